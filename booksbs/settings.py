@@ -39,12 +39,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tienda.instrumentacion.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'tienda.replicas.FijarPrimariaMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -53,34 +55,183 @@ ROOT_URLCONF = 'booksbs.urls'
 
 
 
+# Perfil de plantillas. Con BOOKSBS_PLANTILLAS_CACHEADAS=1 (por defecto sin
+# DEBUG) cada plantilla se lee y compila una sola vez por proceso y no se vuelve
+# a mirar el disco; con DEBUG Django también las cachea, pero comprueba si
+# cambiaron para recargarlas. Los fragmentos con {% cache %} (tienda de libros,
+# próximos) llevan la versión del catálogo en la clave: tienda/context_processors.py
+PLANTILLAS_CACHEADAS = os.environ.get('BOOKSBS_PLANTILLAS_CACHEADAS', '0' if DEBUG else '1') == '1'
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        
-        
+        'BACKEND': 'tienda.instrumentacion.PlantillasMedidas',
         'DIRS': [BASE_DIR / 'templates'],
-        
-        'APP_DIRS': True,
+        'APP_DIRS': not PLANTILLAS_CACHEADAS,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'tienda.context_processors.catalogo',
             ],
         },
     },
 ]
 
+if PLANTILLAS_CACHEADAS:
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'booksbs.wsgi.application'
 
 
 
-DATABASES = {
+# Con varios procesos (gunicorn, uwsgi) la cache debe ser compartida para que
+# la invalidación del catálogo y de los manifiestos llegue a todos, p. ej.:
+#   BOOKSBS_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   BOOKSBS_CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('BOOKSBS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('BOOKSBS_CACHE_LOCATION', 'booksbs'),
+    },
+    # Sesiones aparte, para que vaciar la cache del catálogo no las saque
+    'sesiones': {
+        'BACKEND': os.environ.get('BOOKSBS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('BOOKSBS_CACHE_LOCATION', 'booksbs-sesiones'),
+        'KEY_PREFIX': 'sesiones',
+    },
+    # Fragmentos de plantilla ({% cache %}), uno por tarjeta de libro: aparte
+    # para que no desplacen al catálogo ni a las versiones
+    'template_fragments': {
+        'BACKEND': os.environ.get('BOOKSBS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('BOOKSBS_CACHE_LOCATION', 'booksbs-fragmentos'),
+        'KEY_PREFIX': 'fragmentos',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+# Almacén de sesiones, con BOOKSBS_SESIONES:
+#   mixta      -> (por defecto) anónimos en una cookie firmada y con sesión
+#                 iniciada cached_db (tienda/sesiones.py)
+#   cached_db  -> todas en cache, con la base detrás
+#   cookies    -> todas en cookies firmadas; cerrar sesión no invalida la cookie
+#   db         -> una lectura de la tabla de sesiones en cada petición
+# Con varios procesos la cache 'sesiones' tiene que ser compartida; con
+# LocMemCache un proceso puede leer una versión vieja de la sesión.
+SESIONES = os.environ.get('BOOKSBS_SESIONES', 'mixta')
+
+SESSION_ENGINE = {
+    'mixta': 'tienda.sesiones',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}[SESIONES]
+
+SESSION_CACHE_ALIAS = 'sesiones'
+
+# Los mensajes van en su propia cookie: sin mensajes no se escribe nada, y
+# leerlos no carga la sesión (con FallbackStorage se cargaría al pasar de 4 KB)
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+
+
+# Perfil de base de datos, elegido con BOOKSBS_DB_MOTOR:
+#   sqlite      -> archivo local (por defecto), con los PRAGMA de SQLITE_PRAGMAS
+#                  aplicados a cada conexión nueva (tienda/signals.py)
+#   postgresql  -> BOOKSBS_DB_NAME/USER/PASSWORD/HOST/PORT; con BOOKSBS_DB_POOL=1
+#                  usa el pool de psycopg (pip install "psycopg[pool]") en vez de
+#                  conexiones persistentes
+# En ambos casos las conexiones se reutilizan entre peticiones durante
+# BOOKSBS_DB_CONN_MAX_AGE segundos en lugar de abrir una por petición.
+DB_MOTOR = os.environ.get('BOOKSBS_DB_MOTOR', 'sqlite')
+
+DB_CONN_MAX_AGE = int(os.environ.get('BOOKSBS_DB_CONN_MAX_AGE', '600'))
+
+# Segundos que una transacción espera el bloqueo de escritura antes de fallar
+DB_ESPERA = int(os.environ.get('BOOKSBS_DB_ESPERA', '20'))
+
+if DB_MOTOR == 'postgresql':
+    DB_POOL = os.environ.get('BOOKSBS_DB_POOL', '0') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('BOOKSBS_DB_NAME', 'booksbs'),
+            'USER': os.environ.get('BOOKSBS_DB_USER', 'booksbs'),
+            'PASSWORD': os.environ.get('BOOKSBS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('BOOKSBS_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('BOOKSBS_DB_PORT', '5432'),
+            # Con pool Django devuelve la conexión al pool al terminar cada
+            # petición, así que CONN_MAX_AGE debe ser 0
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('BOOKSBS_DB_POOL_MIN', '2')),
+                    'max_size': int(os.environ.get('BOOKSBS_DB_POOL_MAX', '10')),
+                    'timeout': DB_ESPERA,
+                },
+            } if DB_POOL else {},
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            # Para benchmarks con datos generados: BOOKSBS_DB_NAME=/tmp/bench.sqlite3
+            'NAME': os.environ.get('BOOKSBS_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # Las transacciones toman el bloqueo de escritura al empezar y esperan
+            # hasta DB_ESPERA s a las demás, en vez de fallar con "database is locked"
+            # al pasar de lectura a escritura (compras concurrentes, tienda/compras.py)
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': DB_ESPERA,
+            },
+            # Las pruebas de concurrencia usan una conexión por hilo; con la base
+            # en memoria compartida SQLite no espera a los bloqueos, así que las
+            # pruebas usan un archivo
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+
+# Réplicas de solo lectura para la tienda (tienda/replicas.py), separadas por
+# comas: rutas de archivo con SQLite (se copian de la primaria con
+# "manage.py sincronizar_replica") o hosts con PostgreSQL. Cada una queda como
+# el alias replica_1, replica_2...; en las pruebas son espejos de 'default'.
+DB_REPLICAS = []
+
+for i, destino in enumerate(filter(None, os.environ.get('BOOKSBS_DB_REPLICAS', '').split(',')), 1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    replica['HOST' if DB_MOTOR == 'postgresql' else 'NAME'] = destino.strip()
+    DATABASES[f'replica_{i}'] = replica
+    DB_REPLICAS.append(f'replica_{i}')
+
+# Segundos que una sesión sigue leyendo de la primaria después de escribir; más
+# que el retraso habitual de las réplicas.
+DB_PRIMARIA_TRAS_ESCRITURA = float(os.environ.get('BOOKSBS_DB_PRIMARIA_TRAS_ESCRITURA', '10'))
+
+DATABASE_ROUTERS = ['tienda.replicas.RouterReplicas']
+
+# PRAGMA para cada conexión SQLite nueva. WAL deja leer mientras otro escribe
+# y con synchronous=NORMAL un commit no espera a fsync (solo al hacer
+# checkpoint); un corte de luz puede perder las últimas transacciones pero no
+# corrompe la base. Para volver al modo clásico: BOOKSBS_SQLITE_JOURNAL=delete
+# BOOKSBS_SQLITE_SYNCHRONOUS=full
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('BOOKSBS_SQLITE_JOURNAL', 'wal'),
+    'synchronous': os.environ.get('BOOKSBS_SQLITE_SYNCHRONOUS', 'normal'),
+    'busy_timeout': DB_ESPERA * 1000,
+    'mmap_size': int(os.environ.get('BOOKSBS_SQLITE_MMAP', str(256 * 1024 * 1024))),
+    'temp_store': 'memory',
 }
 
 
@@ -107,6 +258,28 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+STATIC_ROOT = os.environ.get('BOOKSBS_STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# Estáticos compilados (tienda/estaticos.py): "manage.py collectstatic" escribe
+# en STATIC_ROOT los archivos con hash en el nombre y sus variantes .gz/.br
+# (.br solo con "pip install brotli"), y {% static %} apunta a los nombres con
+# hash. Sin proxy, Django los sirve con Cache-Control immutable; con nginx:
+#   location /static/ { alias /ruta/a/staticfiles/; gzip_static on; brotli_static on;
+#                       add_header Cache-Control "public, max-age=31536000, immutable"; }
+ESTATICOS_COMPILADOS = os.environ.get('BOOKSBS_ESTATICOS_COMPILADOS', '0') == '1'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'tienda.estaticos.AlmacenEstaticos' if ESTATICOS_COMPILADOS
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
 
 
 MEDIA_URL = '/media/'
@@ -118,4 +291,42 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-LOGIN_URL = 'login'
\ No newline at end of file
+LOGIN_URL = 'login'
+
+# Versiones WebP/JPEG reducidas de páginas y portadas (tienda/derivados.py)
+DERIVADOS_AL_SUBIR = os.environ.get('BOOKSBS_DERIVADOS_AL_SUBIR', '1') == '1'
+
+DERIVADOS_PROCESOS = int(os.environ.get('BOOKSBS_DERIVADOS_PROCESOS', '2'))
+
+# Entrega de páginas y audio de los libros (tienda/entrega.py):
+#   'django'           -> Django transmite el archivo (Range, ETag, If-None-Match)
+#   'x-accel-redirect' -> nginx, con una location interna que apunte a MEDIA_ROOT:
+#                         location /protegido/ { internal; alias /ruta/a/media/; }
+#   'x-sendfile'       -> Apache (mod_xsendfile) u otro proxy compatible
+MEDIA_ENTREGA = os.environ.get('BOOKSBS_MEDIA_ENTREGA', 'django')
+
+MEDIA_ACCEL_PREFIJO = os.environ.get('BOOKSBS_MEDIA_ACCEL_PREFIJO', '/protegido/')
+
+MEDIA_CACHE_SEGUNDOS = 60 * 60 * 24
+
+# Filas por página en los listados del dashboard (?por_pagina= hasta el máximo)
+DASHBOARD_POR_PAGINA = int(os.environ.get('BOOKSBS_DASHBOARD_POR_PAGINA', '50'))
+
+DASHBOARD_POR_PAGINA_MAX = 500
+
+# Libros por página en la tienda; cada página del catálogo se cachea por separado
+TIENDA_POR_PAGINA = int(os.environ.get('BOOKSBS_TIENDA_POR_PAGINA', '48'))
+
+# Progreso de lectura con escritura diferida (tienda/progreso.py): cada cuántos
+# segundos se guarda lo pendiente y con cuántas entradas se guarda antes.
+# Con 0 no se arranca el hilo y solo se guarda al llenarse el lote.
+PROGRESO_INTERVALO = float(os.environ.get('BOOKSBS_PROGRESO_INTERVALO', '10'))
+
+PROGRESO_LOTE = int(os.environ.get('BOOKSBS_PROGRESO_LOTE', '500'))
+
+# Medición de cada petición (tienda/instrumentacion.py): cabecera Server-Timing
+# con consultas SQL, plantillas, vista y total, y una línea JSON en el log
+# 'tienda.instrumentacion' para las que tardan más de PETICION_LENTA_MS.
+INSTRUMENTACION = os.environ.get('BOOKSBS_INSTRUMENTACION', '1') == '1'
+
+PETICION_LENTA_MS = float(os.environ.get('BOOKSBS_PETICION_LENTA_MS', '500'))
@@ -2,11 +2,13 @@
 # Archivo: booksbs/urls.py (¡ACTUALIZADO!)
 #
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 
 from django.conf import settings
 from django.conf.urls.static import static
 
+from tienda.estaticos import servir_estatico
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     
@@ -17,5 +19,13 @@ urlpatterns = [
     path('', include('tienda.urls')), 
 ]
 
+# Solo portadas y fotos son públicas; el contenido de los libros se entrega
+# por la vista protegida tienda.views.servir_contenido.
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    for carpeta in ('portadas/', 'autores/'):
+        urlpatterns += static(settings.MEDIA_URL + carpeta, document_root=settings.MEDIA_ROOT / carpeta)
+
+# Estáticos con hash desde Django cuando no hay proxy delante (con DEBUG los
+# sirve runserver desde static/)
+if settings.ESTATICOS_COMPILADOS and not settings.DEBUG:
+    urlpatterns.insert(0, re_path(r'^static/(?P<ruta>.+)$', servir_estatico, name='estatico'))
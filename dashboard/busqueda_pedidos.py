@@ -0,0 +1,146 @@
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils import timezone
+
+from tienda.models import Pedido
+
+
+# Mini lenguaje de búsqueda de pedidos. Cada término se traduce a filtros de
+# igualdad o de rango sobre columnas indexadas (nunca a LIKE '%...%' ni a
+# convertir fechas en texto):
+#
+#   fecha:2025-11-01..2025-11-30   fecha:2025-11   fecha>=2025-11-01
+#   estado:completado              email:ana@x.com   email:ana
+#   total>100   total:100..200     id:42   42   completado   ana@x.com
+#
+# El email se compara tal como se guardó (distingue mayúsculas).
+
+TERMINO_RE = re.compile(r'^(?P<campo>[a-z_]+)(?P<op>:|>=|<=|>|<|=)(?P<valor>.+)$')
+
+IMPORTE_RE = re.compile(r'^\d+\.\d+$')
+
+OPERADORES = {'>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte'}
+
+ESTADOS = {valor: valor for valor, _ in Pedido.ESTADO_PAGO_CHOICES}
+ESTADOS.update({etiqueta.lower(): valor for valor, etiqueta in Pedido.ESTADO_PAGO_CHOICES})
+
+
+class ErrorBusqueda(ValueError):
+    pass
+
+
+def inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+
+def rango_de_fecha(texto):
+    """'2025-11' o '2025-11-05' -> (inicio, fin) como datetimes, fin excluido."""
+    try:
+        if len(texto) == 7:
+            desde = datetime.date.fromisoformat(texto + '-01')
+            hasta = (desde + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            desde = datetime.date.fromisoformat(texto)
+            hasta = desde + datetime.timedelta(days=1)
+        return inicio_del_dia(desde), inicio_del_dia(hasta)
+    except (ValueError, OverflowError):
+        # OverflowError: el último día o mes del calendario no tiene fin
+        raise ErrorBusqueda(f'Fecha no válida: {texto}')
+
+
+def leer_decimal(texto):
+    try:
+        valor = Decimal(texto)
+    except InvalidOperation:
+        raise ErrorBusqueda(f'Importe no válido: {texto}')
+    # Decimal acepta NaN e Infinity, que no se pueden comparar con la columna
+    if not valor.is_finite():
+        raise ErrorBusqueda(f'Importe no válido: {texto}')
+    return valor
+
+
+def leer_entero(texto):
+    try:
+        return int(texto)
+    except ValueError:
+        raise ErrorBusqueda(f'Número de pedido no válido: {texto}')
+
+
+def filtro_prefijo(campo, prefijo):
+    """campo >= 'ana' AND campo < 'anb': un LIKE 'ana%' que sí usa el índice."""
+    siguiente = prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+    return Q(**{f'{campo}__gte': prefijo, f'{campo}__lt': siguiente})
+
+
+def filtro_fecha(op, valor):
+    if op == ':':
+        if '..' in valor:
+            inicio, fin = valor.split('..', 1)
+            return Q(fecha_pedido__gte=rango_de_fecha(inicio)[0], fecha_pedido__lt=rango_de_fecha(fin)[1])
+        inicio, fin = rango_de_fecha(valor)
+        return Q(fecha_pedido__gte=inicio, fecha_pedido__lt=fin)
+    inicio, fin = rango_de_fecha(valor)
+    # fecha>2025-11-01 empieza al terminar ese día; fecha<=... termina al terminarlo
+    limite = {'>': fin, '>=': inicio, '<': inicio, '<=': fin, '=': None}[op]
+    if limite is None:
+        return Q(fecha_pedido__gte=inicio, fecha_pedido__lt=fin)
+    return Q(**{f"fecha_pedido__{'gte' if op in ('>', '>=') else 'lt'}": limite})
+
+
+def filtro_total(op, valor):
+    if op == ':' and '..' in valor:
+        minimo, maximo = valor.split('..', 1)
+        return Q(total_pagado__gte=leer_decimal(minimo), total_pagado__lte=leer_decimal(maximo))
+    if op in OPERADORES:
+        return Q(**{f'total_pagado__{OPERADORES[op]}': leer_decimal(valor)})
+    return Q(total_pagado=leer_decimal(valor))
+
+
+def filtro_termino(termino):
+    coincidencia = TERMINO_RE.match(termino)
+    if not coincidencia:
+        # Términos sueltos, como en la búsqueda anterior
+        if termino.isdigit():
+            return Q(id=int(termino)) | Q(total_pagado=Decimal(termino))
+        if termino.lower() in ESTADOS:
+            return Q(estado_pago=ESTADOS[termino.lower()])
+        if IMPORTE_RE.match(termino):
+            return Q(total_pagado=Decimal(termino))
+        if '@' in termino:
+            return Q(usuario__email=termino)
+        return filtro_prefijo('usuario__email', termino)
+
+    campo, op, valor = coincidencia['campo'], coincidencia['op'], coincidencia['valor']
+    if campo == 'fecha':
+        return filtro_fecha(op, valor)
+    if campo == 'total':
+        return filtro_total(op, valor)
+    if campo == 'id' and op in (':', '='):
+        return Q(id=leer_entero(valor))
+    if campo == 'estado' and op in (':', '='):
+        if valor.lower() not in ESTADOS:
+            raise ErrorBusqueda(f'Estado desconocido: {valor}')
+        return Q(estado_pago=ESTADOS[valor.lower()])
+    if campo == 'email' and op in (':', '='):
+        if '@' in valor:
+            return Q(usuario__email=valor)
+        return filtro_prefijo('usuario__email', valor)
+    raise ErrorBusqueda(f'Término no reconocido: {termino}')
+
+
+def interpretar_busqueda(texto):
+    """
+    Devuelve (filtro, errores). Los términos se combinan con AND; los que no
+    se entienden se ignoran y se informan en `errores`.
+    """
+    filtro = Q()
+    errores = []
+    for termino in texto.split():
+        try:
+            filtro &= filtro_termino(termino)
+        except ErrorBusqueda as e:
+            errores.append(str(e))
+    return filtro, errores
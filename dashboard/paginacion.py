@@ -0,0 +1,128 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import IntegerField, Q
+
+
+# Paginación por clave (keyset): en lugar de OFFSET se filtra por la fila
+# donde terminó la página anterior, así la página N cuesta lo mismo que la 1
+# siempre que exista un índice sobre las columnas de `orden`.
+
+# El cursor de paginar_por_posicion es la posición de la fila
+CAMPO_POSICION = [IntegerField()]
+
+
+def codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, campos):
+    """Devuelve la lista de valores del cursor o None si no es válido."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list) or len(valores) != len(campos):
+            return None
+        return [campo.to_python(valor) for campo, valor in zip(campos, valores)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def url_con_cursor(request, parametro, valores):
+    parametros = request.GET.copy()
+    parametros.pop('despues', None)
+    parametros.pop('antes', None)
+    parametros[parametro] = codificar_cursor(valores)
+    return '?' + parametros.urlencode()
+
+
+def tamano_pagina(request):
+    try:
+        tamano = int(request.GET.get('por_pagina', settings.DASHBOARD_POR_PAGINA))
+    except ValueError:
+        tamano = settings.DASHBOARD_POR_PAGINA
+    return min(max(tamano, 1), settings.DASHBOARD_POR_PAGINA_MAX)
+
+
+def filtro_despues(orden, valores, invertir=False):
+    """
+    Filas que van después de `valores` según `orden` (o antes, con invertir).
+    (a, b) > (x, y) se escribe como a > x OR (a = x AND b > y), más un
+    a >= x redundante para que la base de datos pueda buscar en el índice.
+    """
+    filtro = Q(pk__in=[])
+    iguales = Q()
+    for (nombre, descendente), valor in zip(orden, valores):
+        mayor = descendente == invertir
+        filtro |= iguales & Q(**{f"{nombre}__{'gt' if mayor else 'lt'}": valor})
+        iguales &= Q(**{nombre: valor})
+    nombre, descendente = orden[0]
+    mayor = descendente == invertir
+    return Q(**{f"{nombre}__{'gte' if mayor else 'lte'}": valores[0]}) & filtro
+
+
+def paginar_por_clave(request, queryset, *orden):
+    """
+    Pagina `queryset` según los campos de `orden` (como en order_by; el último
+    debe ser único). Devuelve un dict con 'objetos' y las query strings
+    'url_siguiente'/'url_anterior' (None si no hay más páginas).
+    """
+    orden = [(nombre.lstrip('-'), nombre.startswith('-')) for nombre in orden]
+    campos = [queryset.model._meta.get_field(nombre) for nombre, _ in orden]
+    tamano = tamano_pagina(request)
+
+    despues = decodificar_cursor(request.GET.get('despues', ''), campos)
+    antes = decodificar_cursor(request.GET.get('antes', ''), campos) if despues is None else None
+
+    orden_sql = [f"{'-' if descendente else ''}{nombre}" for nombre, descendente in orden]
+    if antes is not None:
+        # Hacia atrás: se recorre el índice al revés y se da la vuelta al resultado
+        orden_inverso = [f"{'' if descendente else '-'}{nombre}" for nombre, descendente in orden]
+        objetos = list(queryset.filter(filtro_despues(orden, antes, invertir=True)).order_by(*orden_inverso)[:tamano + 1])
+        hay_anterior, hay_siguiente = len(objetos) > tamano, True
+        objetos = objetos[:tamano][::-1]
+    else:
+        if despues is not None:
+            queryset = queryset.filter(filtro_despues(orden, despues))
+        objetos = list(queryset.order_by(*orden_sql)[:tamano + 1])
+        hay_anterior, hay_siguiente = despues is not None, len(objetos) > tamano
+        objetos = objetos[:tamano]
+
+    def enlace(parametro, objeto):
+        return url_con_cursor(request, parametro, [campo.value_to_string(objeto) for campo in campos])
+
+    return {
+        'objetos': objetos,
+        'url_siguiente': enlace('despues', objetos[-1]) if hay_siguiente and objetos else None,
+        'url_anterior': enlace('antes', objetos[0]) if hay_anterior and objetos else None,
+    }
+
+
+def paginar_por_posicion(request, queryset):
+    """
+    Como paginar_por_clave, para un `queryset` que ya viene ordenado por algo
+    que no es una columna (por ejemplo, la relevancia de una búsqueda). El
+    cursor es la posición de la fila y cada página es una sola consulta con
+    LIMIT/OFFSET que trae solo sus filas (más una para saber si hay siguiente).
+    """
+    tamano = tamano_pagina(request)
+    despues = decodificar_cursor(request.GET.get('despues', ''), CAMPO_POSICION)
+    antes = decodificar_cursor(request.GET.get('antes', ''), CAMPO_POSICION) if despues is None else None
+    if despues is not None:
+        inicio = despues[0]
+    elif antes is not None:
+        inicio = antes[0] - tamano
+    else:
+        inicio = 0
+    inicio = max(inicio, 0)
+    fin = inicio + tamano
+
+    objetos = list(queryset[inicio:fin + 1])
+    return {
+        'objetos': objetos[:tamano],
+        'url_siguiente': url_con_cursor(request, 'despues', [fin]) if len(objetos) > tamano else None,
+        'url_anterior': url_con_cursor(request, 'antes', [inicio]) if inicio > 0 else None,
+    }
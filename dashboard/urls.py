@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path('pedidos/', views.vista_ver_pedidos, name='dash_ver_pedidos'),
+    path('ventas/', views.vista_ventas, name='dash_ventas'),
     
     path('libros/', views.vista_ver_libros, name='dash_ver_libros'),
     path('libros/agregar/', views.vista_agregar_libro, name='dash_agregar_libro'),
@@ -2,10 +2,16 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth.models import User
-from tienda.models import Pedido, Libro, Genero, Autor
+from tienda.models import Pedido, Libro, Genero, Autor, VentaDiariaLibro, VentaDiariaGenero, VentaDiariaFormato
+from tienda.busqueda import filtro_busqueda, por_relevancia
 from .forms import LibroForm, UserForm, GeneroForm, AutorForm
-from django.db.models import Q
+from .paginacion import paginar_por_clave, paginar_por_posicion
+from .busqueda_pedidos import interpretar_busqueda
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncWeek, TruncMonth
+from django.utils import timezone
 from decimal import Decimal, InvalidOperation
+import datetime
 
 def es_admin(user):
     return user.is_superuser
@@ -14,42 +20,21 @@ def es_admin(user):
 @user_passes_test(es_admin)
 def vista_ver_pedidos(request):
     query = request.GET.get('q')
-    pedidos = Pedido.objects.all()
-    
+    # El usuario se trae en la misma consulta (ver_pedidos.html muestra su email)
+    pedidos = Pedido.objects.select_related('usuario')
+    errores_busqueda = []
+
     if query:
-        search_filter = Q()
-        is_numeric_search = False
-        
-        try:
-            query_int = int(query)
-            search_filter |= Q(id=query_int)
-            is_numeric_search = True
-        except ValueError:
-            pass
-            
-        try:
-            query_dec = Decimal(query)
-            search_filter |= Q(total_pagado=query_dec)
-            is_numeric_search = True
-        except InvalidOperation:
-            pass
-        
-        # Si la consulta NO FUE numérica, busca en campos de texto/fecha
-        if not is_numeric_search:
-            search_filter = (
-                Q(usuario__email__icontains=query) |
-                Q(usuario__first_name__icontains=query) |
-                Q(estado_pago__icontains=query) |
-                Q(fecha_pedido__icontains=query) # Búsqueda de fecha como texto
-            )
-            
-        pedidos = pedidos.filter(search_filter).order_by('-fecha_pedido').distinct()
-    else:
-        pedidos = pedidos.order_by('-fecha_pedido')
-        
+        # Ver dashboard/busqueda_pedidos.py: fecha:, estado:, email:, total>, id:
+        search_filter, errores_busqueda = interpretar_busqueda(query)
+        pedidos = pedidos.filter(search_filter)
+
+    pagina = paginar_por_clave(request, pedidos, '-fecha_pedido', '-id')
     contexto = {
-        'pedidos': pedidos,
-        'search_query': query
+        'pedidos': pagina['objetos'],
+        'paginacion': pagina,
+        'search_query': query,
+        'errores_busqueda': errores_busqueda,
     }
     return render(request, 'dashboard/ver_pedidos.html', contexto)
 
@@ -58,6 +43,7 @@ def vista_ver_pedidos(request):
 def vista_ver_libros(request):
     query = request.GET.get('q')
     libros = Libro.objects.all()
+    por_texto = False
     
     if query:
         search_filter = Q()
@@ -79,27 +65,135 @@ def vista_ver_libros(request):
         except InvalidOperation:
             pass # No es un decimal
         
-        # Si NO fue una búsqueda numérica, entonces busca en el texto
+        # Si NO fue una búsqueda numérica, usa el índice de texto completo
+        # (título, descripción, autores y géneros) y las opciones de estado/formato
         if not is_numeric_search:
-            search_filter = (
-                Q(titulo__icontains=query) |
-                Q(descripcion__icontains=query) |
-                Q(estado_publicacion__icontains=query) |
-                Q(formato__icontains=query) |
-                Q(autores__nombre_autor__icontains=query) |
-                Q(generos__nombre_genero__icontains=query)
-            )
+            search_filter = Q()
+            texto = query.strip().lower()
+            for campo, opciones in (('estado_publicacion', Libro.ESTADO_CHOICES), ('formato', Libro.FORMATO_CHOICES)):
+                for valor, etiqueta in opciones:
+                    if texto in (valor, etiqueta.lower()):
+                        search_filter |= Q(**{campo: valor})
+            if search_filter:
+                search_filter |= filtro_busqueda(query)
+            else:
+                # Solo texto: se pagina en orden de relevancia
+                por_texto = True
             
-        libros = libros.filter(search_filter).order_by('id').distinct()
+        libros = por_relevancia(libros, query) if por_texto else libros.filter(search_filter)
+
+    if por_texto:
+        pagina = paginar_por_posicion(request, libros)
     else:
-        libros = libros.order_by('id')
-        
+        pagina = paginar_por_clave(request, libros, 'id')
     contexto = {
-        'libros': libros,
+        'libros': pagina['objetos'],
+        'paginacion': pagina,
         'search_query': query
     }
     return render(request, 'dashboard/ver_libros.html', contexto)
 
+# --- Ventas (solo lee de los resúmenes diarios de tienda/ventas.py) ---
+
+# Diez años por mes ya son 120 barras; un rango mayor se recorta por el principio
+VENTAS_MAX_DIAS = 3660
+
+def leer_fecha(valor, por_defecto):
+    try:
+        return datetime.date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        return por_defecto
+
+def dias_antes(fecha, dias):
+    try:
+        return fecha - datetime.timedelta(days=dias)
+    except OverflowError:
+        # No hay fechas antes del año 1
+        return datetime.date.min
+
+def periodos_entre(desde, hasta, agrupacion):
+    """Primer día de cada periodo (día, semana o mes) entre las dos fechas."""
+    if agrupacion == 'semana':
+        actual = desde - datetime.timedelta(days=desde.weekday())
+    elif agrupacion == 'mes':
+        actual = desde.replace(day=1)
+    else:
+        actual = desde
+    while actual <= hasta:
+        yield actual
+        try:
+            if agrupacion == 'semana':
+                actual += datetime.timedelta(days=7)
+            elif agrupacion == 'mes':
+                actual = (actual + datetime.timedelta(days=32)).replace(day=1)
+            else:
+                actual += datetime.timedelta(days=1)
+        except OverflowError:
+            # El periodo que contiene el 9999-12-31 es el último
+            return
+
+@login_required
+@user_passes_test(es_admin)
+def vista_ventas(request):
+    hoy = timezone.localdate()
+    hasta = leer_fecha(request.GET.get('hasta'), hoy)
+    desde = leer_fecha(request.GET.get('desde'), dias_antes(hasta, 29))
+    if desde > hasta:
+        desde, hasta = hasta, desde
+    desde = max(desde, dias_antes(hasta, VENTAS_MAX_DIAS - 1))
+
+    # Más de ~3 meses por día o de ~2 años por semana no se leen en una gráfica
+    dias = (hasta - desde).days + 1
+    agrupacion = 'dia' if dias <= 92 else 'semana' if dias <= 730 else 'mes'
+
+    rango = Q(fecha__gte=desde, fecha__lte=hasta)
+    por_formato = VentaDiariaFormato.objects.filter(rango)
+    if agrupacion == 'semana':
+        por_formato = por_formato.annotate(periodo=TruncWeek('fecha'))
+    elif agrupacion == 'mes':
+        por_formato = por_formato.annotate(periodo=TruncMonth('fecha'))
+    else:
+        por_formato = por_formato.annotate(periodo=F('fecha'))
+    filas = {
+        fila['periodo']: fila
+        for fila in por_formato.values('periodo').annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos'))
+    }
+
+    serie = [
+        {
+            'periodo': periodo,
+            'unidades': filas.get(periodo, {}).get('unidades') or 0,
+            'ingresos': filas.get(periodo, {}).get('ingresos') or Decimal('0'),
+        }
+        for periodo in periodos_entre(desde, hasta, agrupacion)
+    ]
+    max_unidades = max((punto['unidades'] for punto in serie), default=0) or 1
+    max_ingresos = max((punto['ingresos'] for punto in serie), default=0) or 1
+    for punto in serie:
+        punto['alto_unidades'] = round(punto['unidades'] * 100 / max_unidades, 1)
+        punto['alto_ingresos'] = round(float(punto['ingresos'] * 100 / max_ingresos), 1)
+
+    formatos = dict(Libro.FORMATO_CHOICES)
+    totales_formato = [
+        {'formato': formatos.get(fila['formato'], 'Libros borrados'), 'unidades': fila['unidades'], 'ingresos': fila['ingresos']}
+        for fila in VentaDiariaFormato.objects.filter(rango).values('formato')
+        .annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos')).order_by('-ingresos')
+    ]
+    contexto = {
+        'desde': desde,
+        'hasta': hasta,
+        'agrupacion': {'dia': 'día', 'semana': 'semana', 'mes': 'mes'}[agrupacion],
+        'serie': serie,
+        'total_unidades': sum(punto['unidades'] for punto in serie),
+        'total_ingresos': sum(punto['ingresos'] for punto in serie),
+        'totales_formato': totales_formato,
+        'top_libros': VentaDiariaLibro.objects.filter(rango).values('libro_id', 'libro__titulo')
+            .annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos')).order_by('-ingresos', 'libro_id')[:10],
+        'top_generos': VentaDiariaGenero.objects.filter(rango).values('genero_id', 'genero__nombre_genero')
+            .annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos')).order_by('-ingresos', 'genero_id')[:10],
+    }
+    return render(request, 'dashboard/ventas.html', contexto)
+
 # --- Vistas de Libros (Agregar, Editar, Borrar) - Sin cambios ---
 
 @login_required
@@ -186,12 +280,12 @@ def vista_ver_usuarios(request):
                 Q(username__icontains=query)
             )
             
-        usuarios = usuarios.filter(search_filter).order_by('id').distinct()
-    else:
-        usuarios = usuarios.order_by('id')
-        
+        usuarios = usuarios.filter(search_filter)
+
+    pagina = paginar_por_clave(request, usuarios, 'id')
     contexto = {
-        'usuarios': usuarios,
+        'usuarios': pagina['objetos'],
+        'paginacion': pagina,
         'search_query': query
     }
     return render(request, 'dashboard/ver_usuarios.html', contexto)
@@ -263,12 +357,13 @@ def vista_ver_generos(request):
                 Q(descripcion_genero__icontains=query)
             )
         
-        generos = generos.filter(search_filter).order_by('nombre_genero').distinct()
-    else:
-        generos = generos.order_by('nombre_genero')
-        
+        generos = generos.filter(search_filter)
+
+    # nombre_genero es único, basta como clave de paginación
+    pagina = paginar_por_clave(request, generos, 'nombre_genero')
     contexto = {
-        'generos': generos,
+        'generos': pagina['objetos'],
+        'paginacion': pagina,
         'search_query': query
     }
     return render(request, 'dashboard/ver_generos.html', contexto)
@@ -352,12 +447,13 @@ def vista_ver_autores(request):
                 Q(biografia__icontains=query)
             )
         
-        autores = autores.filter(search_filter).order_by('nombre_autor').distinct()
-    else:
-        autores = autores.order_by('nombre_autor')
+        autores = autores.filter(search_filter)
 
+    # nombre_autor es único, basta como clave de paginación
+    pagina = paginar_por_clave(request, autores, 'nombre_autor')
     contexto = {
-        'autores': autores,
+        'autores': pagina['objetos'],
+        'paginacion': pagina,
         'search_query': query
     }
     return render(request, 'dashboard/ver_autores.html', contexto)
@@ -0,0 +1,62 @@
+import time
+from array import array
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import BibliotecaUsuario
+from .replicas import en_primaria
+
+
+# Ids de los libros de cada usuario, en una sola entrada de cache por usuario
+# con su propia versión (como el catálogo): al cambiar la biblioteca se cambia
+# la versión y la entrada vieja deja de usarse. En la cache se guarda un
+# array de enteros ordenado (8 bytes por libro); al leerlo se convierte en un
+# frozenset para comprobar la propiedad en O(1).
+
+BIBLIOTECA_TIMEOUT = 60 * 60 * 24
+ATRIBUTO_MEMO = '_libros_propios'
+
+
+def clave_version(usuario_id):
+    return f'biblioteca:{usuario_id}:version'
+
+
+def version_biblioteca(usuario_id):
+    clave = clave_version(usuario_id)
+    version = cache.get(clave)
+    if version is None:
+        version = time.time_ns()
+        cache.add(clave, version, None)
+        version = cache.get(clave, version)
+    return version
+
+
+def invalidar_biblioteca(usuario_id):
+    """Se llama al confirmar la transacción para no cachear datos sin confirmar."""
+    transaction.on_commit(lambda: cache.set(clave_version(usuario_id), time.time_ns(), None))
+
+
+def libros_propios(usuario):
+    """frozenset con los ids de los libros del usuario (vacío si es anónimo)."""
+    if not usuario.is_authenticated:
+        return frozenset()
+    # Varias comprobaciones en la misma petición leen la cache una sola vez
+    memo = getattr(usuario, ATRIBUTO_MEMO, None)
+    if memo is not None:
+        return memo
+
+    clave = f'biblioteca:{usuario.id}:{version_biblioteca(usuario.id)}'
+    ids = cache.get(clave)
+    if ids is None:
+        with en_primaria():
+            ids = array('q', BibliotecaUsuario.objects.filter(usuario=usuario).order_by('libro_id').values_list('libro_id', flat=True))
+        cache.set(clave, ids, BIBLIOTECA_TIMEOUT)
+    propios = frozenset(ids)
+    setattr(usuario, ATRIBUTO_MEMO, propios)
+    return propios
+
+
+def olvidar_memo(usuario):
+    if hasattr(usuario, ATRIBUTO_MEMO):
+        delattr(usuario, ATRIBUTO_MEMO)
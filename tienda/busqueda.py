@@ -0,0 +1,131 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Libro
+
+
+# Tabla virtual FTS5 (ver migración 0005). El rowid es el id del libro.
+TABLA_BUSQUEDA = 'tienda_libro_busqueda'
+
+# Peso de cada columna en bm25: título, descripción, autores, géneros
+PESOS_COLUMNAS = (10.0, 1.0, 5.0, 3.0)
+
+PALABRA_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def indice_disponible():
+    return connection.vendor == 'sqlite'
+
+
+def consulta_fts(texto):
+    """'mero crist' -> '"mero"* "crist"*' (todas las palabras, por prefijo)"""
+    palabras = PALABRA_RE.findall(texto or '')
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def indexar_libros(ids):
+    if not indice_disponible() or not ids:
+        return
+    libros = Libro.objects.filter(id__in=ids).prefetch_related('autores', 'generos')
+    filas = [
+        (
+            libro.id,
+            libro.titulo,
+            libro.descripcion or '',
+            ' '.join(autor.nombre_autor for autor in libro.autores.all()),
+            ' '.join(genero.nombre_genero for genero in libro.generos.all()),
+        )
+        for libro in libros
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLA_BUSQUEDA} WHERE rowid = %s', [(id_libro,) for id_libro in ids])
+        cursor.executemany(
+            f'INSERT INTO {TABLA_BUSQUEDA} (rowid, titulo, descripcion, autores, generos) VALUES (%s, %s, %s, %s, %s)',
+            filas,
+        )
+
+
+def quitar_libros(ids):
+    if not indice_disponible() or not ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLA_BUSQUEDA} WHERE rowid = %s', [(id_libro,) for id_libro in ids])
+
+
+def reconstruir_indice(lote=2000):
+    if not indice_disponible():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLA_BUSQUEDA}')
+    ids = list(Libro.objects.order_by('id').values_list('id', flat=True))
+    for inicio in range(0, len(ids), lote):
+        indexar_libros(ids[inicio:inicio + lote])
+
+
+def filtro_contiene(texto):
+    """Sin índice (PostgreSQL): cada palabra en alguna de las columnas."""
+    filtro = Q()
+    for palabra in PALABRA_RE.findall(texto):
+        filtro &= (
+            Q(titulo__icontains=palabra) | Q(descripcion__icontains=palabra) |
+            Q(autores__nombre_autor__icontains=palabra) | Q(generos__nombre_genero__icontains=palabra)
+        )
+    return filtro
+
+
+def filtro_busqueda(texto):
+    """
+    Q con los libros que coinciden con `texto`, como subconsulta: se combina
+    con otros filtros en la misma consulta sin traer antes todos los ids.
+    """
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return Q(pk__in=[])
+    if not indice_disponible():
+        return Q(id__in=Libro.objects.filter(filtro_contiene(texto)).values('id'))
+    return Q(id__in=RawSQL(f'SELECT rowid FROM {TABLA_BUSQUEDA} WHERE {TABLA_BUSQUEDA} MATCH %s', [consulta]))
+
+
+def por_relevancia(libros, texto):
+    """
+    `libros` (un queryset de Libro) limitado a los que coinciden con `texto`,
+    del más al menos relevante. Es una sola consulta: el índice se cruza con
+    los filtros del queryset y se ordena por bm25 en la base, así que al
+    cortarlo por páginas ([inicio:fin]) solo se traen las filas de la página.
+    """
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return libros.none()
+    if not indice_disponible():
+        return libros.filter(filtro_busqueda(texto)).order_by('-id')
+    pesos = ', '.join(str(peso) for peso in PESOS_COLUMNAS)
+    return libros.extra(
+        tables=[TABLA_BUSQUEDA],
+        where=[f'{TABLA_BUSQUEDA}.rowid = {Libro._meta.db_table}.id', f'{TABLA_BUSQUEDA} MATCH %s'],
+        params=[consulta],
+        select={'relevancia': f'bm25({TABLA_BUSQUEDA}, {pesos})'},
+        order_by=['relevancia', 'id'],
+    )
+
+
+def buscar_ids(texto, limite=200):
+    """Ids de libros que coinciden con `texto`, del más al menos relevante."""
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    if not indice_disponible():
+        ids = Libro.objects.filter(filtro_contiene(texto)).values_list('id', flat=True).distinct()
+        return list(ids[:limite] if limite else ids)
+
+    pesos = ', '.join(str(peso) for peso in PESOS_COLUMNAS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABLA_BUSQUEDA} WHERE {TABLA_BUSQUEDA} MATCH %s '
+            f'ORDER BY bm25({TABLA_BUSQUEDA}, {pesos}) LIMIT %s',
+            # LIMIT -1: sin límite
+            [consulta, limite or -1],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
@@ -0,0 +1,30 @@
+# Carrito guardado en la sesión: solo una lista de ids de libros. Precios y
+# propiedad se comprueban siempre contra la base de datos al pagar.
+
+CLAVE_CARRITO = 'carrito'
+
+
+def obtener_carrito(request):
+    return list(request.session.get(CLAVE_CARRITO, []))
+
+
+def guardar_carrito(request, ids):
+    request.session[CLAVE_CARRITO] = ids
+
+
+def agregar_al_carrito(request, libro_id):
+    ids = obtener_carrito(request)
+    if libro_id not in ids:
+        ids.append(libro_id)
+        guardar_carrito(request, ids)
+
+
+def quitar_del_carrito(request, libro_id):
+    ids = obtener_carrito(request)
+    if libro_id in ids:
+        ids.remove(libro_id)
+        guardar_carrito(request, ids)
+
+
+def vaciar_carrito(request):
+    request.session.pop(CLAVE_CARRITO, None)
@@ -0,0 +1,48 @@
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .replicas import en_primaria
+
+
+# Todas las entradas del catálogo llevan la versión en la clave; al cambiar
+# un Libro, Genero o Autor se cambia la versión y las entradas viejas
+# simplemente dejan de usarse (y expiran solas).
+CLAVE_VERSION = 'catalogo:version'
+CATALOGO_TIMEOUT = 60 * 60 * 24
+
+
+def version_catalogo():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Si la cache perdió la versión no se puede reutilizar un número viejo
+        version = time.time_ns()
+        cache.add(CLAVE_VERSION, version, None)
+        version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def invalidar_catalogo():
+    cache.set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def tocar_libros(libros):
+    """Marca como modificados los libros del queryset (p. ej. los de un autor editado)."""
+    libros.update(actualizado=timezone.now())
+
+
+def clave_catalogo(vista, *partes):
+    sufijo = ':'.join(str(parte) for parte in partes)
+    return f'catalogo:{version_catalogo()}:{vista}:{sufijo}'
+
+
+def en_cache_catalogo(vista, *partes, construir):
+    """Devuelve el valor cacheado para (vista, partes) o lo construye y lo guarda."""
+    clave = clave_catalogo(vista, *partes)
+    valor = cache.get(clave)
+    if valor is None:
+        with en_primaria():
+            valor = construir()
+        cache.set(clave, valor, CATALOGO_TIMEOUT)
+    return valor
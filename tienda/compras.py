@@ -0,0 +1,91 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum
+
+from .models import Libro, BibliotecaUsuario, Pedido, DetallePedido
+from .ventas import sumar_ventas
+from .biblioteca import invalidar_biblioteca, olvidar_memo
+
+
+# Las compras no comprueban "¿ya lo tiene?" antes de insertar: dos peticiones
+# simultáneas pasarían las dos la comprobación. En su lugar:
+#   - el pedido lleva una clave de idempotencia única por usuario, así que un
+#     reintento con la misma clave choca con el pedido ya creado y lo devuelve;
+#   - las filas de BibliotecaUsuario se insertan con ON CONFLICT DO NOTHING
+#     (unique_together usuario/libro) y el pedido solo cobra las que insertó.
+
+LONGITUD_CLAVE = 64
+
+
+def clave_valida(clave):
+    return clave if clave and len(clave) <= LONGITUD_CLAVE else None
+
+
+def pedido_existente(usuario, clave):
+    pedido = Pedido.objects.filter(usuario=usuario, clave_idempotencia=clave).first()
+    if pedido is None:
+        return None, [], []
+    libros = [detalle.libro for detalle in pedido.detalles.select_related('libro') if detalle.libro]
+    return pedido, libros, []
+
+
+@transaction.atomic
+def comprar_libros(usuario, libro_ids, clave=None):
+    """
+    Compra en un solo pedido los libros de `libro_ids` que el usuario aún no
+    tiene. Devuelve (pedido, libros_comprados, ids_que_ya_tenia); pedido es
+    None si no había nada que comprar. Con una `clave` ya usada devuelve el
+    pedido original sin comprar nada más.
+    """
+    clave = clave_valida(clave)
+    if clave:
+        previo = pedido_existente(usuario, clave)
+        if previo[0]:
+            return previo
+
+    # Una sola consulta trae los libros y marca los que ya son del usuario;
+    # es solo para informar, quien decide es el INSERT de más abajo
+    ya_propio = BibliotecaUsuario.objects.filter(usuario=usuario, libro=OuterRef('pk'))
+    libros = list(
+        Libro.objects.filter(id__in=libro_ids, estado_publicacion='disponible')
+        .annotate(ya_propio=Exists(ya_propio)).order_by('id')
+    )
+    candidatos = [libro for libro in libros if not libro.ya_propio]
+    ya_tenia = [libro.id for libro in libros if libro.ya_propio]
+    if not candidatos:
+        return None, [], ya_tenia
+
+    try:
+        with transaction.atomic():
+            pedido = Pedido.objects.create(
+                usuario=usuario, total_pagado=0, estado_pago='completado', clave_idempotencia=clave,
+            )
+    except IntegrityError:
+        # Otra petición con la misma clave se adelantó
+        return pedido_existente(usuario, clave)
+
+    BibliotecaUsuario.objects.bulk_create(
+        [BibliotecaUsuario(usuario=usuario, libro=libro, pedido=pedido) for libro in candidatos],
+        ignore_conflicts=True,
+    )
+    insertados = set(BibliotecaUsuario.objects.filter(pedido=pedido).values_list('libro_id', flat=True))
+    # bulk_create no envía post_save: la versión de la biblioteca se cambia aquí
+    invalidar_biblioteca(usuario.id)
+    olvidar_memo(usuario)
+    comprados = [libro for libro in candidatos if libro.id in insertados]
+    ya_tenia += [libro.id for libro in candidatos if libro.id not in insertados]
+    if not comprados:
+        pedido.delete()
+        return None, [], ya_tenia
+
+    detalles = DetallePedido.objects.bulk_create([
+        DetallePedido(pedido=pedido, libro=libro, precio_compra=libro.precio, resumido=True)
+        for libro in comprados
+    ])
+    # El total lo suma la base de datos a partir de los detalles guardados
+    Pedido.objects.filter(pk=pedido.pk).update(total_pagado=Subquery(
+        DetallePedido.objects.filter(pedido=OuterRef('pk')).values('pedido')
+        .annotate(total=Sum('precio_compra')).values('total')
+    ))
+    pedido.refresh_from_db(fields=['total_pagado'])
+    sumar_ventas(detalles)
+    return pedido, comprados, ya_tenia
@@ -0,0 +1,87 @@
+import datetime
+import functools
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .biblioteca import version_biblioteca
+from .catalogo import version_catalogo
+from .models import Libro
+
+
+# GET condicional (If-None-Match / If-Modified-Since) para las páginas del
+# catálogo. El validador de cada página se calcula sin renderizar nada: la
+# versión del catálogo (una lectura de cache) o la fecha de modificación del
+# libro (una consulta por clave primaria), más la parte del usuario: quién es
+# y la versión de su biblioteca, que decide "Ya está en tu biblioteca".
+# La ficha lleva un formulario con {% csrf_token %}, así que su validador
+# incluye también el secreto CSRF: al iniciar o cerrar sesión cambia
+# (rotate_token) y una copia guardada tendría un token que ya no vale.
+# Las versiones de catálogo y biblioteca son time.time_ns() del último cambio,
+# así que también sirven como fecha de Last-Modified.
+
+def desde_ns(version):
+    return datetime.datetime.fromtimestamp(version / 1e9, tz=datetime.timezone.utc)
+
+
+def parte_usuario(request):
+    """(texto para el ETag, fecha del último cambio de su biblioteca o None)."""
+    if not request.user.is_authenticated:
+        return 'anonimo', None
+    version = version_biblioteca(request.user.id)
+    return f'u{request.user.id}.{version}', desde_ns(version)
+
+
+def parte_csrf(request):
+    # get_token crea el secreto si el navegador aún no tiene la cookie; así la
+    # primera respuesta y las siguientes llevan el mismo validador
+    get_token(request)
+    return hashlib.sha256(request.META['CSRF_COOKIE'].encode()).hexdigest()[:16]
+
+
+def marca_catalogo(request, *args, **kwargs):
+    version = version_catalogo()
+    usuario, biblioteca = parte_usuario(request)
+    return f'c{version}-{usuario}', max(filter(None, [desde_ns(version), biblioteca]))
+
+
+def marca_libro(request, id_libro, **kwargs):
+    actualizado = Libro.objects.filter(pk=id_libro).values_list('actualizado', flat=True).first()
+    if actualizado is None:
+        return None  # la vista responde el 404
+    usuario, biblioteca = parte_usuario(request)
+    return f'l{id_libro}.{actualizado.timestamp()}-{usuario}-{parte_csrf(request)}', max(filter(None, [actualizado, biblioteca]))
+
+
+def condicional(marca):
+    """
+    Responde 304 antes de llamar a la vista si el navegador ya tiene la
+    versión que indica `marca(request, *args, **kwargs)`, que devuelve
+    (etag, última_modificación) o None para no usar validadores.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            # Los mensajes pendientes cambian la página sin cambiar el validador
+            if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+                return vista(request, *args, **kwargs)
+            validadores = marca(request, *args, **kwargs)
+            if validadores is None:
+                return vista(request, *args, **kwargs)
+
+            etag, modificado = quote_etag(validadores[0]), int(validadores[1].timestamp())
+            respuesta = get_conditional_response(request, etag=etag, last_modified=modificado)
+            if respuesta is None:
+                respuesta = vista(request, *args, **kwargs)
+                if respuesta.status_code != 200:
+                    return respuesta
+            respuesta['ETag'] = etag
+            respuesta['Last-Modified'] = http_date(modificado)
+            # La página depende del usuario y debe revalidarse siempre
+            patch_cache_control(respuesta, private=True, no_cache=True)
+            return respuesta
+        return envoltura
+    return decorador
@@ -0,0 +1,12 @@
+from .catalogo import CATALOGO_TIMEOUT, version_catalogo
+
+
+def catalogo(request):
+    """
+    Para los {% cache %} de las plantillas, que llevan la versión del catálogo
+    en la clave. Se pasa la función: la versión solo se lee si se usa.
+    """
+    return {
+        'version_catalogo': version_catalogo,
+        'catalogo_timeout': CATALOGO_TIMEOUT,
+    }
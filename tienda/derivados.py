@@ -0,0 +1,244 @@
+import atexit
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image
+
+
+# Anchos (px) de las versiones reducidas de páginas y portadas.
+ANCHOS_DERIVADOS = (480, 960, 1440)
+
+# formato -> (extensión, opciones de Pillow)
+FORMATOS_DERIVADOS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 78, 'optimize': True, 'progressive': True}),
+}
+
+TIPOS_MIME = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+# Miniaturas con nombre para portadas y fotos de autor: ancho máximo en px
+# (el doble de lo que ocupan en pantalla, para pantallas de alta densidad).
+MINIATURAS = {
+    'tabla': 100,        # iconos de 50 px en las tablas del dashboard
+    'cuadricula': 360,   # tarjetas de la tienda y de Mis libros
+    'detalle': 600,      # portada grande de 300 px en las fichas
+}
+
+# Carpetas públicas de MEDIA_ROOT que tienen miniaturas
+CARPETAS_MINIATURAS = ('portadas/', 'autores/')
+
+
+def nombre_derivado(nombre, ancho, formato):
+    """'contenido/libro_pagina_1.png' -> 'contenido/libro_pagina_1.w480.webp'"""
+    base, _ = os.path.splitext(nombre)
+    extension = FORMATOS_DERIVADOS[formato][0]
+    return f'{base}.w{ancho}.{extension}'
+
+
+def nombre_miniatura(nombre, tamano, formato):
+    """'portadas/libro.png' -> 'portadas/libro.cuadricula.webp'"""
+    base, _ = os.path.splitext(nombre)
+    return f'{base}.{tamano}.{FORMATOS_DERIVADOS[formato][0]}'
+
+
+def es_derivado(nombre):
+    """
+    True si `nombre` tiene la forma exacta de lo que genera este módulo:
+    'x.w480.webp' con un ancho de ANCHOS_DERIVADOS, o 'portadas/x.detalle.jpg'
+    dentro de CARPETAS_MINIATURAS. 'x.detalle.png' es un original.
+    """
+    base, extension = os.path.splitext(nombre)
+    base, sufijo = os.path.splitext(base)
+    if not os.path.basename(base) or extension[1:] not in {ext for ext, _ in FORMATOS_DERIVADOS.values()}:
+        return False
+    if sufijo[1:] in MINIATURAS:
+        return nombre.startswith(CARPETAS_MINIATURAS)
+    return sufijo[1:] in {f'w{ancho}' for ancho in ANCHOS_DERIVADOS}
+
+
+def _ruta(nombre):
+    return os.path.join(settings.MEDIA_ROOT, nombre)
+
+
+def generar_derivados(ruta_original, anchos=ANCHOS_DERIVADOS):
+    """
+    Genera las versiones WebP/JPEG de una imagen junto al archivo original.
+
+    Trabaja solo con rutas absolutas para poder ejecutarse en otro proceso sin
+    configurar Django. Las versiones más nuevas que el original no se
+    regeneran. Devuelve cuántos archivos se escribieron.
+    """
+    if not os.path.exists(ruta_original):
+        return 0
+
+    mtime_original = os.path.getmtime(ruta_original)
+    base, _ = os.path.splitext(ruta_original)
+
+    # Image.open solo lee la cabecera; la imagen se decodifica hasta convert()
+    with Image.open(ruta_original) as imagen:
+        ancho_original, alto_original = imagen.size
+        pendientes = []
+        for ancho in anchos:
+            # No se amplían imágenes más pequeñas que el ancho pedido
+            if ancho > ancho_original:
+                continue
+            for formato, (extension, opciones) in FORMATOS_DERIVADOS.items():
+                destino = f'{base}.w{ancho}.{extension}'
+                if os.path.exists(destino) and os.path.getmtime(destino) >= mtime_original:
+                    continue
+                pendientes.append((ancho, formato, destino, opciones))
+
+        if not pendientes:
+            return 0
+
+        imagen = imagen.convert('RGB')
+        for ancho, formato, destino, opciones in pendientes:
+            alto = round(alto_original * ancho / ancho_original)
+            reducida = imagen.resize((ancho, alto), Image.LANCZOS)
+            temporal = f'{destino}.tmp'
+            reducida.save(temporal, format=formato.upper(), **opciones)
+            os.replace(temporal, destino)
+    return len(pendientes)
+
+
+def generar_miniaturas(ruta_original, tamanos=tuple(MINIATURAS)):
+    """
+    Como generar_derivados, pero con los tamaños con nombre de MINIATURAS.
+    Las imágenes más pequeñas que el tamaño se guardan sin ampliar.
+    """
+    if not os.path.exists(ruta_original):
+        return 0
+
+    mtime_original = os.path.getmtime(ruta_original)
+    base, _ = os.path.splitext(ruta_original)
+    escritos = 0
+    with Image.open(ruta_original) as imagen:
+        imagen.draft('RGB', (max(MINIATURAS[t] for t in tamanos),) * 2)
+        imagen = imagen.convert('RGB')
+        for tamano in tamanos:
+            reducida = None
+            # El JPEG va primero: si existe el WebP existen los dos
+            for formato in ('jpeg', 'webp'):
+                extension, opciones = FORMATOS_DERIVADOS[formato]
+                destino = f'{base}.{tamano}.{extension}'
+                if os.path.exists(destino) and os.path.getmtime(destino) >= mtime_original:
+                    continue
+                if reducida is None:
+                    reducida = imagen.copy()
+                    reducida.thumbnail((MINIATURAS[tamano], MINIATURAS[tamano] * 4), Image.LANCZOS)
+                # Dos peticiones pueden generar la misma miniatura a la vez
+                temporal = f'{destino}.{os.getpid()}-{threading.get_ident()}.tmp'
+                reducida.save(temporal, format=formato.upper(), **opciones)
+                os.replace(temporal, destino)
+                escritos += 1
+    return escritos
+
+
+def generar_derivados_en_paralelo(nombres, procesos=None, al_terminar=None, funcion=generar_derivados):
+    """Procesa una lista de nombres de archivo (relativos a MEDIA_ROOT) con un pool de procesos."""
+    pendientes = [nombre for nombre in nombres if nombre and not es_derivado(nombre)]
+    total_escritos = 0
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        futuros = {pool.submit(funcion, _ruta(nombre)): nombre for nombre in pendientes}
+        for futuro in as_completed(futuros):
+            escritos = futuro.result()
+            total_escritos += escritos
+            if escritos:
+                olvidar_derivados(futuros[futuro])
+            if al_terminar:
+                al_terminar(_ruta(futuros[futuro]), escritos)
+    return total_escritos
+
+
+# Pool para lo que se sube desde el dashboard. Se crea con la primera subida y
+# se cierra al salir del proceso: termina lo que está en marcha y descarta lo
+# que no ha empezado (manage.py generar_derivados lo hace después, y las
+# miniaturas también se generan al pedirlas).
+_pool_subidas = None
+_cerrojo_pool = threading.Lock()
+
+
+def cerrar_pool_subidas():
+    global _pool_subidas
+    with _cerrojo_pool:
+        if _pool_subidas is not None:
+            _pool_subidas.shutdown(wait=True, cancel_futures=True)
+            _pool_subidas = None
+
+
+def programar_derivados(nombre, funcion=generar_derivados):
+    """Encola la generación de derivados (o miniaturas) de un archivo recién subido."""
+    global _pool_subidas
+    if not nombre or es_derivado(nombre) or not os.path.exists(_ruta(nombre)):
+        return None
+    with _cerrojo_pool:
+        if _pool_subidas is None:
+            _pool_subidas = ProcessPoolExecutor(max_workers=settings.DERIVADOS_PROCESOS)
+            atexit.register(cerrar_pool_subidas)
+        futuro = _pool_subidas.submit(funcion, _ruta(nombre))
+    futuro.add_done_callback(lambda _: olvidar_derivados(nombre))
+    return futuro
+
+
+def derivados_existentes(nombre):
+    """{formato: [(nombre_derivado, ancho), ...]} con las versiones ya generadas."""
+    existentes = {}
+    for formato in FORMATOS_DERIVADOS:
+        for ancho in ANCHOS_DERIVADOS:
+            derivado = nombre_derivado(nombre, ancho, formato)
+            if os.path.exists(_ruta(derivado)):
+                existentes.setdefault(formato, []).append((derivado, ancho))
+    return existentes
+
+
+def miniaturas_existentes(nombre):
+    """Nombres de las miniaturas de `nombre` que ya están en disco."""
+    return {
+        nombre_miniatura(nombre, tamano, formato)
+        for tamano in MINIATURAS for formato in FORMATOS_DERIVADOS
+        if os.path.exists(_ruta(nombre_miniatura(nombre, tamano, formato)))
+    }
+
+
+# Lo que devuelven derivados_existentes y miniaturas_existentes (seis stat por
+# imagen) se guarda en la cache; se borra cuando el pool o la vista de
+# miniaturas terminan de generar los de ese archivo. Sin ninguno se vuelve a
+# mirar pronto: puede que se estén generando en otro proceso o con
+# manage.py generar_derivados.
+DERIVADOS_TIMEOUT = 60 * 60 * 24
+SIN_DERIVADOS_TIMEOUT = 60
+
+
+def clave_derivados(nombre):
+    return f'derivados:{hashlib.md5(nombre.encode()).hexdigest()}'
+
+
+def clave_miniaturas(nombre):
+    return f'miniaturas:{hashlib.md5(nombre.encode()).hexdigest()}'
+
+
+def olvidar_derivados(nombre):
+    cache.delete_many([clave_derivados(nombre), clave_miniaturas(nombre)])
+
+
+def _en_cache(clave, calcular):
+    existentes = cache.get(clave)
+    if existentes is None:
+        existentes = calcular()
+        cache.set(clave, existentes, DERIVADOS_TIMEOUT if existentes else SIN_DERIVADOS_TIMEOUT)
+    return existentes
+
+
+def derivados_en_cache(nombre):
+    return _en_cache(clave_derivados(nombre), lambda: derivados_existentes(nombre))
+
+
+def miniaturas_en_cache(nombre):
+    return _en_cache(clave_miniaturas(nombre), lambda: miniaturas_existentes(nombre))
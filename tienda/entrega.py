@@ -0,0 +1,131 @@
+import asyncio
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+TAMANO_BLOQUE = 64 * 1024
+
+RANGO_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def etag_archivo(stat):
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def interpretar_rango(cabecera, tamano):
+    """
+    Devuelve (inicio, fin) inclusivos para una cabecera Range de un solo
+    rango, None si no hay rango utilizable, o False si no se puede satisfacer.
+    """
+    coincidencia = RANGO_RE.match(cabecera.strip()) if cabecera else None
+    if not coincidencia:
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # bytes=-500: los últimos 500 bytes
+        longitud = int(fin)
+        if longitud == 0:
+            return False
+        return max(tamano - longitud, 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+def leer_archivo(ruta, inicio, longitud):
+    with open(ruta, 'rb') as f:
+        f.seek(inicio)
+        restante = longitud
+        while restante > 0:
+            bloque = f.read(min(TAMANO_BLOQUE, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+
+
+async def leer_archivo_async(ruta, inicio, longitud):
+    """
+    Igual que leer_archivo pero sin bloquear el event loop: cada lectura va a
+    un hilo y entre bloque y bloque el loop atiende a los demás clientes. Un
+    oyente lento solo ocupa esta corrutina, no un hilo del servidor.
+    """
+    f = await asyncio.to_thread(open, ruta, 'rb')
+    try:
+        await asyncio.to_thread(f.seek, inicio)
+        restante = longitud
+        while restante > 0:
+            bloque = await asyncio.to_thread(f.read, min(TAMANO_BLOQUE, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+    finally:
+        f.close()
+
+
+def respuesta_archivo(request, nombre):
+    """
+    Entrega un archivo de MEDIA_ROOT ya autorizado. Según MEDIA_ENTREGA se
+    delega al proxy (X-Accel-Redirect / X-Sendfile) o se transmite desde
+    Django con soporte de Range, ETag e If-None-Match. Con ASGI el archivo se
+    lee con un iterador asíncrono (con WSGI, Django juntaría uno asíncrono en
+    memoria antes de enviarlo, así que ahí se usa el síncrono).
+    """
+    ruta = os.path.join(settings.MEDIA_ROOT, nombre)
+    try:
+        stat = os.stat(ruta)
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+
+    tipo = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+    etag = etag_archivo(stat)
+
+    # El proxy también responde Range y validadores por su cuenta
+    if settings.MEDIA_ENTREGA == 'x-accel-redirect':
+        respuesta = HttpResponse(content_type=tipo)
+        respuesta['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIJO + nombre
+        return respuesta
+    if settings.MEDIA_ENTREGA == 'x-sendfile':
+        respuesta = HttpResponse(content_type=tipo)
+        respuesta['X-Sendfile'] = ruta
+        return respuesta
+
+    respuesta = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    leer = leer_archivo_async if isinstance(request, ASGIRequest) else leer_archivo
+    if respuesta is None:
+        tamano = stat.st_size
+        rango = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range == etag:
+            rango = interpretar_rango(request.META.get('HTTP_RANGE'), tamano)
+
+        if rango is False:
+            respuesta = HttpResponse(status=416)
+            respuesta['Content-Range'] = f'bytes */{tamano}'
+        elif rango:
+            inicio, fin = rango
+            longitud = fin - inicio + 1
+            respuesta = StreamingHttpResponse(leer(ruta, inicio, longitud), status=206, content_type=tipo)
+            respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+            respuesta['Content-Length'] = str(longitud)
+        else:
+            respuesta = StreamingHttpResponse(leer(ruta, 0, tamano), content_type=tipo)
+            respuesta['Content-Length'] = str(tamano)
+
+    respuesta['Accept-Ranges'] = 'bytes'
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(stat.st_mtime)
+    respuesta['Cache-Control'] = f'private, max-age={settings.MEDIA_CACHE_SEGUNDOS}'
+    return respuesta
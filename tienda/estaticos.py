@@ -0,0 +1,95 @@
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional; sin ella solo se genera .gz
+    brotli = None
+
+
+# Estáticos con el hash del contenido en el nombre (style.3f1c...css): como el
+# nombre cambia con cada versión se pueden cachear para siempre. collectstatic
+# escribe además .gz y .br junto a cada archivo de texto, para servir la
+# versión comprimida sin comprimir en cada petición.
+
+EXTENSIONES_COMPRIMIBLES = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map'}
+
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+CACHE_SIN_HASH = 'public, max-age=300'
+
+# Orden de preferencia: brotli comprime mejor, gzip lo entiende todo el mundo
+CODIFICACIONES = [('br', '.br'), ('gzip', '.gz')]
+
+
+def comprimir(contenido):
+    """Devuelve {sufijo: bytes} con las versiones que salen más pequeñas."""
+    versiones = {'.gz': gzip.compress(contenido, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        versiones['.br'] = brotli.compress(contenido, quality=11)
+    return {sufijo: datos for sufijo, datos in versiones.items() if len(datos) < len(contenido)}
+
+
+class AlmacenEstaticos(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage que además deja las variantes .gz y .br."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for nombre in set(self.hashed_files.values()):
+            if os.path.splitext(nombre)[1] not in EXTENSIONES_COMPRIMIBLES:
+                continue
+            with self.open(nombre) as f:
+                contenido = f.read()
+            for sufijo, datos in comprimir(contenido).items():
+                with open(self.path(nombre + sufijo), 'wb') as destino:
+                    destino.write(datos)
+
+
+def servir_estatico(request, ruta):
+    """
+    Entrega un archivo de STATIC_ROOT eligiendo la variante comprimida que
+    acepte el navegador. Es para desplegar sin proxy delante; con nginx basta
+    con gzip_static/brotli_static y la misma cabecera Cache-Control.
+    """
+    try:
+        original = safe_join(settings.STATIC_ROOT, ruta)
+    except SuspiciousFileOperation:
+        raise Http404
+    if os.path.normpath(ruta) != ruta or not os.path.isfile(original):
+        raise Http404
+
+    aceptadas = {
+        parte.split(';')[0].strip() for parte in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')
+        if not parte.replace(' ', '').endswith(';q=0')
+    }
+    archivo, codificacion = original, None
+    for nombre, sufijo in CODIFICACIONES:
+        if nombre in aceptadas and os.path.isfile(original + sufijo):
+            archivo, codificacion = original + sufijo, nombre
+            break
+
+    stat = os.stat(archivo)
+    respuesta = get_conditional_response(request, last_modified=int(stat.st_mtime))
+    if respuesta is None:
+        respuesta = FileResponse(
+            open(archivo, 'rb'), filename=os.path.basename(original),
+            content_type=mimetypes.guess_type(original)[0] or 'application/octet-stream',
+        )
+        if codificacion:
+            respuesta['Content-Encoding'] = codificacion
+    respuesta['Last-Modified'] = http_date(stat.st_mtime)
+    patch_vary_headers(respuesta, ['Accept-Encoding'])
+    hashed = getattr(staticfiles_storage, 'hashed_files', {})
+    respuesta['Cache-Control'] = CACHE_INMUTABLE if ruta in hashed.values() else CACHE_SIN_HASH
+    return respuesta
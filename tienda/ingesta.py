@@ -0,0 +1,84 @@
+import hashlib
+import os
+import shutil
+
+from django.conf import settings
+from django.db import transaction
+
+from .lector import invalidar_manifiesto
+from .models import ContenidoLibro
+
+
+CARPETA_CONTENIDO = 'contenido'
+TAMANO_BLOQUE = 1024 * 1024
+
+
+def numero_pagina(nombre_archivo):
+    """'pagina_12.png' -> 12"""
+    return int(os.path.splitext(nombre_archivo)[0].split('_')[-1])
+
+
+def paginas_ordenadas(carpeta, extension='.png'):
+    nombres = [f for f in os.listdir(carpeta) if f.lower().endswith(extension)]
+    return sorted(nombres, key=numero_pagina)
+
+
+def hash_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def nombre_destino(prefijo, numero, digest, extension):
+    # El nombre depende del contenido: si el archivo ya está en MEDIA_ROOT
+    # (de una corrida anterior que se interrumpió) no se vuelve a copiar.
+    return f'{CARPETA_CONTENIDO}/{prefijo}_pagina_{numero}_{digest[:12]}{extension}'
+
+
+def instalar_pagina(nombre, escribir):
+    """
+    Deja la página en MEDIA_ROOT/nombre: escribir(ruta) la escribe en un
+    temporal que luego se renombra. Devuelve (nombre, se_copio).
+    """
+    destino = os.path.join(settings.MEDIA_ROOT, nombre)
+    if os.path.exists(destino):
+        return nombre, False
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f'{destino}.tmp'
+    escribir(temporal)
+    os.replace(temporal, destino)
+    return nombre, True
+
+
+def copiar_pagina(ruta_origen, prefijo, numero):
+    """Copia una página a MEDIA_ROOT/contenido. Devuelve (nombre, se_copio)."""
+    extension = os.path.splitext(ruta_origen)[1].lower()
+    nombre = nombre_destino(prefijo, numero, hash_archivo(ruta_origen), extension)
+    return instalar_pagina(nombre, lambda temporal: shutil.copyfile(ruta_origen, temporal))
+
+
+def guardar_pagina(contenido, prefijo, numero, extension):
+    """Como copiar_pagina, pero a partir de bytes ya generados en memoria."""
+    nombre = nombre_destino(prefijo, numero, hashlib.sha256(contenido).hexdigest(), extension)
+
+    def escribir(temporal):
+        with open(temporal, 'wb') as f:
+            f.write(contenido)
+    return instalar_pagina(nombre, escribir)
+
+
+def reemplazar_paginas(libro, nombres, tipo_contenido='imagen'):
+    """
+    Cambia el conjunto de páginas del libro por `nombres` (en orden) en una
+    sola transacción: si algo falla, el libro conserva sus páginas anteriores.
+    """
+    with transaction.atomic():
+        ContenidoLibro.objects.filter(libro=libro, tipo_contenido=tipo_contenido).delete()
+        ContenidoLibro.objects.bulk_create(
+            (ContenidoLibro(libro=libro, tipo_contenido=tipo_contenido, orden=orden, archivo=nombre)
+             for orden, nombre in enumerate(nombres, start=1)),
+            batch_size=500,
+        )
+        transaction.on_commit(lambda: invalidar_manifiesto(libro.id))
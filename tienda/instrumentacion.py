@@ -0,0 +1,172 @@
+import contextvars
+import json
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+
+# Medición por petición: consultas SQL (número y tiempo), tiempo de plantillas,
+# de la vista y total, y tamaño de la respuesta. Se devuelve en la cabecera
+# Server-Timing (visible en las herramientas del navegador) y las peticiones
+# que pasan de PETICION_LENTA_MS se escriben en el log 'tienda.instrumentacion'
+# como una línea JSON, con las consultas repetidas.
+#
+# La medición en curso va en una variable de contexto, así la ven también las
+# consultas y plantillas que corren en otro hilo con sync_to_async. Cada
+# conexión lleva siempre el mismo execute_wrapper (se añade al crearse, en
+# tienda/signals.py); fuera de una petición solo mira la variable y sigue.
+# Los tiempos se solapan: las consultas que hace una plantilla cuentan en sql
+# y en plantillas, y las dos en vista.
+
+CONSULTAS_REPETIDAS_EN_LOG = 10
+
+medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = Counter()
+        self.tiempo_sql = 0.0
+        self.tiempo_plantillas = 0.0
+        self.inicio_vista = None
+        self.tiempo_vista = 0.0
+
+    def anotar_consulta(self, sql, segundos):
+        self.consultas[sql] += 1
+        self.tiempo_sql += segundos
+
+    def repetidas(self):
+        return [
+            {'sql': sql, 'veces': veces}
+            for sql, veces in self.consultas.most_common(CONSULTAS_REPETIDAS_EN_LOG) if veces > 1
+        ]
+
+
+def medir_consulta(execute, sql, params, many, context):
+    medicion = medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.anotar_consulta(sql, time.perf_counter() - inicio)
+
+
+class PlantillaMedida(Template):
+
+    def render(self, context=None, request=None):
+        medicion = medicion_actual.get()
+        if medicion is None:
+            return super().render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicion.tiempo_plantillas += time.perf_counter() - inicio
+
+
+class PlantillasMedidas(DjangoTemplates):
+    """DjangoTemplates que suma a la petición el tiempo de cada render()."""
+
+    def get_template(self, template_name):
+        return PlantillaMedida(super().get_template(template_name).template, self)
+
+
+def marcar_inicio_vista():
+    medicion = medicion_actual.get()
+    if medicion is not None:
+        medicion.inicio_vista = time.perf_counter()
+
+
+def tamano_respuesta(response):
+    if response.streaming:
+        return int(response.get('Content-Length', 0)) or None
+    return len(response.content)
+
+
+def server_timing(medicion, total, tamano):
+    metricas = [
+        f'sql;dur={medicion.tiempo_sql * 1000:.1f};desc="{sum(medicion.consultas.values())} consultas"',
+        f'plantillas;dur={medicion.tiempo_plantillas * 1000:.1f}',
+        f'vista;dur={medicion.tiempo_vista * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ]
+    if tamano is not None:
+        metricas.append(f'respuesta;desc="{tamano} bytes"')
+    return ', '.join(metricas)
+
+
+class InstrumentacionMiddleware:
+    """Va el primero de MIDDLEWARE para que 'total' incluya a todos los demás."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTACION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Con un process_view síncrono Django pasaría a un hilo en cada petición
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion = Medicion()
+        token = medicion_actual.set(medicion)
+        try:
+            response = self.get_response(request)
+        finally:
+            medicion_actual.reset(token)
+        return self.terminar(request, response, medicion)
+
+    async def __acall__(self, request):
+        medicion = Medicion()
+        token = medicion_actual.set(medicion)
+        try:
+            response = await self.get_response(request)
+        finally:
+            medicion_actual.reset(token)
+        return self.terminar(request, response, medicion)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        marcar_inicio_vista()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        marcar_inicio_vista()
+
+    def terminar(self, request, response, medicion):
+        total = time.perf_counter() - medicion.inicio
+        if medicion.inicio_vista is not None:
+            medicion.tiempo_vista = time.perf_counter() - medicion.inicio_vista
+        tamano = tamano_respuesta(response)
+        response['Server-Timing'] = server_timing(medicion, total, tamano)
+
+        if total * 1000 >= settings.PETICION_LENTA_MS:
+            logger.warning(json.dumps({
+                'evento': 'peticion_lenta',
+                'metodo': request.method,
+                'ruta': request.path,
+                'vista': getattr(request.resolver_match, 'view_name', None),
+                'estado': response.status_code,
+                'total_ms': round(total * 1000, 1),
+                'vista_ms': round(medicion.tiempo_vista * 1000, 1),
+                'plantillas_ms': round(medicion.tiempo_plantillas * 1000, 1),
+                'sql_ms': round(medicion.tiempo_sql * 1000, 1),
+                'consultas': sum(medicion.consultas.values()),
+                'bytes': tamano,
+                'consultas_repetidas': medicion.repetidas(),
+            }, ensure_ascii=False))
+        return response
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.urls import reverse
+
+from .derivados import ANCHOS_DERIVADOS, FORMATOS_DERIVADOS, nombre_derivado
+from .models import ContenidoLibro
+from .replicas import en_primaria
+
+
+# El manifiesto vive en cache hasta que cambie el contenido del libro
+# (ver tienda/signals.py), por eso no lleva tiempo de expiración.
+MANIFIESTO_TIMEOUT = None
+
+
+def clave_manifiesto(libro_id):
+    # v2: 'archivos' lleva nombres exactos (antes, nombres sin extensión)
+    return f'manifiesto_libro:v2:{libro_id}'
+
+
+def archivos_servibles(tipo, archivo):
+    """El archivo guardado y, si es una página, los nombres de sus versiones reducidas."""
+    nombres = [archivo]
+    if tipo == 'imagen':
+        nombres += [
+            nombre_derivado(archivo, ancho, formato)
+            for ancho in ANCHOS_DERIVADOS for formato in FORMATOS_DERIVADOS
+        ]
+    return nombres
+
+
+def url_contenido(libro_id, nombre):
+    return reverse('servir_contenido', args=[libro_id, nombre])
+
+
+def construir_manifiesto(libro_id):
+    """
+    Páginas ordenadas (id, nombre, url) de un libro, su total, la pista de
+    audio y el conjunto de archivos que se pueden servir a sus dueños.
+    """
+    filas = (
+        ContenidoLibro.objects
+        .filter(libro_id=libro_id)
+        .order_by('tipo_contenido', 'orden')
+        .values_list('id', 'tipo_contenido', 'archivo')
+    )
+    paginas = []
+    audio = None
+    archivos = set()
+    for id_contenido, tipo, archivo in filas:
+        archivos.update(archivos_servibles(tipo, archivo))
+        if tipo == 'imagen':
+            paginas.append((id_contenido, archivo, url_contenido(libro_id, archivo)))
+        elif tipo == 'audio' and audio is None:
+            audio = {'id': id_contenido, 'nombre': archivo, 'url': url_contenido(libro_id, archivo)}
+    return {
+        'total': len(paginas),
+        'paginas': paginas,
+        'audio': audio,
+        'archivos': frozenset(archivos),
+    }
+
+
+def obtener_manifiesto(libro_id):
+    clave = clave_manifiesto(libro_id)
+    manifiesto = cache.get(clave)
+    if manifiesto is None:
+        with en_primaria():
+            manifiesto = construir_manifiesto(libro_id)
+        cache.set(clave, manifiesto, MANIFIESTO_TIMEOUT)
+    return manifiesto
+
+
+def invalidar_manifiesto(libro_id):
+    cache.delete(clave_manifiesto(libro_id))
+
+
+def obtener_pagina(manifiesto, pagina_num):
+    """Ajusta el número de página al rango válido y devuelve (num, pagina)."""
+    total = manifiesto['total']
+    if total == 0:
+        return 1, None
+    pagina_num = min(max(pagina_num, 1), total)
+    id_contenido, nombre, url = manifiesto['paginas'][pagina_num - 1]
+    return pagina_num, {'id': id_contenido, 'nombre': nombre, 'url': url}
+
+
+def archivo_pertenece_al_libro(manifiesto, nombre):
+    return nombre in manifiesto['archivos']
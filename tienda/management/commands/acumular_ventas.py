@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from tienda.ventas import acumular_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        'Suma a los resúmenes diarios de ventas los detalles de pedido que todavía no están '
+        'en ellos. Es seguro correrlo varias veces (por ejemplo desde cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        total = acumular_pendientes(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} detalles de pedido sumados a los resúmenes.'))
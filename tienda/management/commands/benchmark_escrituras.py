@@ -0,0 +1,111 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.test.utils import override_settings
+
+from tienda.models import Libro, BibliotecaUsuario
+
+from .benchmark_urls import percentil
+
+
+# Perfiles de SQLite que se comparan. 'clasico' es SQLite sin ajustes (diario
+# de rollback y fsync en cada commit); 'configurado' es settings.SQLITE_PRAGMAS.
+PERFIL_CLASICO = {
+    'journal_mode': 'delete',
+    'synchronous': 'full',
+    'mmap_size': 0,
+    'temp_store': 'default',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide escrituras concurrentes (progreso de lectura) mezcladas con lecturas (Mis libros) '
+        'con SQLite sin ajustes y con SQLITE_PRAGMAS, abriendo una conexión por operación o '
+        'reutilizándola. Las escrituras no cambian ningún valor.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escritores', type=int, default=8)
+        parser.add_argument('--lectores', type=int, default=8)
+        parser.add_argument('--segundos', type=float, default=5)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Este benchmark compara perfiles de SQLite; la base configurada es ' + connection.vendor)
+        self.filas = list(BibliotecaUsuario.objects.values_list('id', 'usuario_id'))
+        if not self.filas:
+            raise CommandError('No hay datos suficientes; ejecuta primero "manage.py generar_datos".')
+
+        perfiles = [
+            ('clasico', {**settings.SQLITE_PRAGMAS, **PERFIL_CLASICO}),
+            ('configurado', settings.SQLITE_PRAGMAS),
+        ]
+        try:
+            for nombre, pragmas in perfiles:
+                for reutilizar in (False, True):
+                    # journal_mode solo cambia si no hay otras conexiones abiertas
+                    connections.close_all()
+                    with override_settings(SQLITE_PRAGMAS=pragmas):
+                        self.medir(nombre, reutilizar, options)
+        finally:
+            connections.close_all()
+
+    def medir(self, perfil, reutilizar, options):
+        fin = time.perf_counter() + options['segundos']
+        escrituras, lecturas, errores = [], [], []
+
+        def escribir():
+            azar = random.Random()
+            while time.perf_counter() < fin:
+                fila_id, _ = azar.choice(self.filas)
+                inicio = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        BibliotecaUsuario.objects.filter(id=fila_id).update(ultima_pagina=F('ultima_pagina'))
+                    escrituras.append((time.perf_counter() - inicio) * 1000)
+                except OperationalError as e:
+                    errores.append(str(e))
+                if not reutilizar:
+                    connection.close()
+            connection.close()
+
+        def leer():
+            azar = random.Random()
+            while time.perf_counter() < fin:
+                _, usuario_id = azar.choice(self.filas)
+                inicio = time.perf_counter()
+                try:
+                    list(Libro.objects.filter(bibliotecausuario__usuario_id=usuario_id).annotate(
+                        ultima_pagina=F('bibliotecausuario__ultima_pagina')
+                    ))
+                    lecturas.append((time.perf_counter() - inicio) * 1000)
+                except OperationalError as e:
+                    errores.append(str(e))
+                if not reutilizar:
+                    connection.close()
+            connection.close()
+
+        hilos = [threading.Thread(target=escribir) for _ in range(options['escritores'])]
+        hilos += [threading.Thread(target=leer) for _ in range(options['lectores'])]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        segundos = options['segundos']
+        conexiones = 'reutilizada' if reutilizar else 'por operación'
+        self.stdout.write(
+            f'{perfil:<12} conexión {conexiones:<14} '
+            f'escrituras {len(escrituras) / segundos:>7.0f}/s p50={percentil(escrituras or [0], 50):>7.2f}ms '
+            f'p95={percentil(escrituras or [0], 95):>7.2f}ms | '
+            f'lecturas {len(lecturas) / segundos:>7.0f}/s p95={percentil(lecturas or [0], 95):>7.2f}ms | '
+            f'errores {len(errores)}'
+        )
+        for error in sorted(set(errores)):
+            self.stdout.write(self.style.WARNING(f'  {error}'))
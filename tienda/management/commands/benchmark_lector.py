@@ -0,0 +1,55 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from tienda.lector import invalidar_manifiesto
+from tienda.models import Libro, ContenidoLibro
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de cambiar de página en el lector (página 1 contra la última).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paginas', type=int, default=500)
+        parser.add_argument('--repeticiones', type=int, default=200)
+
+    def handle(self, *args, **options):
+        total = options['paginas']
+        repeticiones = options['repeticiones']
+
+        # Todo se crea dentro de una transacción que se revierte al final,
+        # así la base de datos real no se modifica.
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+            usuario = User.objects.create_user(username='benchmark_lector@booksbs.local')
+            libro = Libro.objects.create(titulo='Benchmark lector', portada='portadas/benchmark.png')
+            ContenidoLibro.objects.bulk_create(
+                ContenidoLibro(libro=libro, tipo_contenido='imagen', orden=i, archivo=f'contenido/benchmark_pagina_{i}.png')
+                for i in range(1, total + 1)
+            )
+            invalidar_manifiesto(libro.id)
+
+            cliente = Client()
+            cliente.force_login(usuario)
+
+            for pagina in (1, total // 2, total):
+                url = reverse('leer_libro', args=[libro.id, pagina])
+                cliente.get(url)  # calienta el manifiesto
+
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    for _ in range(repeticiones):
+                        cliente.get(url)
+                    duracion = time.perf_counter() - inicio
+
+                self.stdout.write(
+                    f'Página {pagina:>5}: {duracion / repeticiones * 1000:.2f} ms/petición, '
+                    f'{len(consultas) // repeticiones} consultas/petición'
+                )
+
+            invalidar_manifiesto(libro.id)
+            transaction.set_rollback(True)
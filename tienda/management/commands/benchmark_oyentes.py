@@ -0,0 +1,145 @@
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from tienda.models import Libro, ContenidoLibro, BibliotecaUsuario
+
+from .benchmark_urls import percentil
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula oyentes lentos descargando el MP3 de un audiobook por servir_contenido: '
+        'por WSGI con un número fijo de hilos (como gunicorn --threads) y por ASGI en un '
+        'solo event loop. Mide el tiempo hasta el primer byte y el total.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--oyentes', type=int, default=200)
+        parser.add_argument('--hilos', type=int, default=16, help='Hilos del servidor WSGI simulado.')
+        parser.add_argument('--tamano', type=int, default=256, help='KB del archivo de audio.')
+        parser.add_argument('--velocidad', type=int, default=256, help='KB/s de cada oyente.')
+
+    def handle(self, *args, **options):
+        media = tempfile.mkdtemp()
+        os.makedirs(os.path.join(media, 'contenido'))
+        with open(os.path.join(media, 'contenido', 'benchmark_oyentes.mp3'), 'wb') as f:
+            f.write(os.urandom(options['tamano'] * 1024))
+
+        # Los datos se confirman (los hilos WSGI usan sus propias conexiones)
+        # y se borran al terminar
+        usuario = User.objects.create_user(username='benchmark_oyentes@booksbs.local')
+        libro = Libro.objects.create(titulo='Benchmark oyentes', portada='portadas/benchmark.png', formato='audiobook')
+        try:
+            ContenidoLibro.objects.create(libro=libro, tipo_contenido='audio', archivo='contenido/benchmark_oyentes.mp3')
+            BibliotecaUsuario.objects.create(usuario=usuario, libro=libro)
+            cliente = Client()
+            cliente.force_login(usuario)
+            self.cookie = f"sessionid={cliente.cookies['sessionid'].value}"
+            self.url = reverse('servir_contenido', args=[libro.id, 'contenido/benchmark_oyentes.mp3'])
+            self.pausa_por_byte = 1 / (options['velocidad'] * 1024)
+
+            with override_settings(MEDIA_ROOT=media, MEDIA_ENTREGA='django', ALLOWED_HOSTS=['testserver']):
+                self.informar('WSGI', options, *self.medir_wsgi(options['oyentes'], options['hilos']))
+                self.informar('ASGI', options, *asyncio.run(self.medir_asgi(options['oyentes'])))
+        finally:
+            libro.delete()
+            usuario.delete()
+            shutil.rmtree(media)
+
+    def informar(self, nombre, options, duracion, primeros_bytes, hilos):
+        esperado = options['tamano'] / options['velocidad']
+        self.stdout.write(
+            f'{nombre}: {options["oyentes"]} oyentes en {duracion:.1f}s (cada descarga ~{esperado:.1f}s), '
+            f'primer byte p50={percentil(primeros_bytes, 50) * 1000:.0f}ms '
+            f'p95={percentil(primeros_bytes, 95) * 1000:.0f}ms, hasta {hilos} hilos vivos'
+        )
+
+    def medir_wsgi(self, oyentes, hilos):
+        aplicacion = WSGIHandler()
+        inicio = time.perf_counter()
+        primeros_bytes = []
+        max_hilos = threading.active_count()
+
+        def oyente():
+            nonlocal max_hilos
+            entorno = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': self.url, 'QUERY_STRING': '',
+                'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'HTTP_HOST': 'testserver',
+                'HTTP_COOKIE': self.cookie, 'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+            }
+            respuesta = aplicacion(entorno, lambda status, headers: None)
+            primero = True
+            try:
+                for bloque in respuesta:
+                    if primero:
+                        primeros_bytes.append(time.perf_counter() - inicio)
+                        primero = False
+                    time.sleep(len(bloque) * self.pausa_por_byte)
+            finally:
+                respuesta.close()
+                max_hilos = max(max_hilos, threading.active_count())
+
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            for futuro in [pool.submit(oyente) for _ in range(oyentes)]:
+                futuro.result()
+        connection.close()
+        return time.perf_counter() - inicio, primeros_bytes, max_hilos
+
+    async def medir_asgi(self, oyentes):
+        aplicacion = ASGIHandler()
+        inicio = time.perf_counter()
+        primeros_bytes = []
+        max_hilos = threading.active_count()
+        nunca = asyncio.Event()
+        # Django abre un hilo por petición en curso para su parte síncrona
+        # (ThreadSensitiveContext); mientras se transmite está parado, lo que
+        # limita a los oyentes es el número de hilos de WSGI, no estos
+
+        async def oyente():
+            nonlocal max_hilos
+            enviado = False
+            primero = True
+
+            async def recibir():
+                nonlocal enviado
+                if not enviado:
+                    enviado = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # El cliente no se desconecta
+                await nunca.wait()
+
+            async def enviar(mensaje):
+                nonlocal primero, max_hilos
+                if mensaje['type'] != 'http.response.body':
+                    return
+                if primero:
+                    primeros_bytes.append(time.perf_counter() - inicio)
+                    primero = False
+                max_hilos = max(max_hilos, threading.active_count())
+                await asyncio.sleep(len(mensaje.get('body', b'')) * self.pausa_por_byte)
+
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': self.url, 'raw_path': self.url.encode(), 'query_string': b'',
+                'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+                'headers': [(b'host', b'testserver'), (b'cookie', self.cookie.encode())],
+            }
+            await aplicacion(scope, recibir, enviar)
+
+        await asyncio.gather(*(oyente() for _ in range(oyentes)))
+        return time.perf_counter() - inicio, primeros_bytes, max_hilos
@@ -0,0 +1,83 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from tienda.models import Libro
+
+from .benchmark_urls import percentil
+
+
+MOTORES = [
+    ('db', 'django.contrib.sessions.backends.db'),
+    ('cached_db', 'django.contrib.sessions.backends.cached_db'),
+    ('cookies', 'django.contrib.sessions.backends.signed_cookies'),
+    ('mixta', 'tienda.sesiones'),
+]
+
+CONTRASENA = 'benchmark-sesiones'
+
+
+class Command(BaseCommand):
+    help = (
+        'Recorre la tienda como anónimo y con sesión iniciada con cada SESSION_ENGINE y cuenta '
+        'las consultas por petición, en total y a la tabla de sesiones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        libro = Libro.objects.filter(estado_publicacion='disponible').order_by('id').first()
+        if libro is None:
+            raise CommandError('No hay datos suficientes; ejecuta primero "manage.py generar_datos".')
+        usuario = User.objects.create_user(username='benchmark_sesiones@booksbs.local', password=CONTRASENA)
+        paginas = [reverse('index'), reverse('bookstore'), reverse('libro_detalle', args=[libro.id])]
+        credenciales = {'email': usuario.username, 'password': CONTRASENA}
+        try:
+            # Con réplicas (aquí la misma base) los POST del carrito fijan la
+            # sesión a la primaria y la escriben, como en producción
+            with override_settings(ALLOWED_HOSTS=['testserver'], DB_REPLICAS=['default']):
+                for nombre, motor in MOTORES:
+                    with override_settings(SESSION_ENGINE=motor):
+                        caches['sesiones'].clear()
+                        cliente = Client()
+                        # Un intento de login fallido no le crea sesión al anónimo
+                        peticiones = [('anonimo', self.pedir(cliente.post, reverse('login'), {'email': usuario.username, 'password': 'mal'}))]
+                        for _ in range(options['repeticiones']):
+                            for url in paginas:
+                                peticiones.append(('anonimo', self.pedir(cliente.get, url)))
+                        peticiones.append(('login', self.pedir(cliente.post, reverse('login'), credenciales)))
+                        for _ in range(options['repeticiones']):
+                            for url in paginas + [reverse('mis_libros'), reverse('carrito')]:
+                                peticiones.append(('con sesion', self.pedir(cliente.get, url)))
+                        peticiones.append(('carrito', self.pedir(cliente.post, reverse('agregar_carrito', args=[libro.id]))))
+                        peticiones.append(('carrito', self.pedir(cliente.post, reverse('quitar_carrito', args=[libro.id]))))
+                        peticiones.append(('logout', self.pedir(cliente.get, reverse('logout'))))
+                        self.informar(nombre, peticiones)
+        finally:
+            usuario.delete()
+
+    def pedir(self, metodo, url, datos=None):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            metodo(url, datos or {})
+            duracion = (time.perf_counter() - inicio) * 1000
+        de_sesion = sum('django_session' in c['sql'] for c in consultas)
+        return len(consultas), de_sesion, duracion
+
+    def informar(self, nombre, peticiones):
+        self.stdout.write(f'{nombre}:')
+        for grupo in dict.fromkeys(g for g, _ in peticiones):
+            medidas = [m for g, m in peticiones if g == grupo]
+            consultas = sum(m[0] for m in medidas) / len(medidas)
+            de_sesion = sum(m[1] for m in medidas) / len(medidas)
+            self.stdout.write(
+                f'  {grupo:<11} {len(medidas):>4} peticiones  {consultas:>5.2f} consultas/petición, '
+                f'{de_sesion:.2f} a sesiones  p50={percentil([m[2] for m in medidas], 50):.1f}ms'
+            )
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+import dashboard.urls
+import tienda.urls
+from tienda.models import Libro, Genero, Autor, BibliotecaUsuario, Pedido, DetallePedido
+
+
+# URLs que cierran la sesión o escriben datos: se piden con GET igual que las
+# demás, pero se miden al final para no afectar al resto.
+URLS_AL_FINAL = ('logout',)
+
+
+def percentil(valores, p):
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+def commit_actual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+class Command(BaseCommand):
+    help = (
+        'Pide con el cliente de pruebas cada URL con nombre de tienda y dashboard y guarda '
+        'latencia p50/p95 y número de consultas en JSON. Pensado para correr sobre los datos '
+        'de generar_datos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--salida', help='Archivo JSON (por defecto benchmarks/<commit>.json).')
+        parser.add_argument('--solo', nargs='*', help='Nombres de URL a medir.')
+        parser.add_argument('--cache-fria', action='store_true', help='Vacía la cache antes de cada petición.')
+
+    def handle(self, *args, **options):
+        self.usuario = (
+            User.objects.filter(bibliotecausuario__libro__formato='ebook', is_superuser=False)
+            .order_by('id').first()
+        )
+        self.admin = User.objects.filter(is_superuser=True).order_by('id').first()
+        if not self.usuario or not self.admin:
+            raise CommandError('No hay datos suficientes; ejecuta primero "manage.py generar_datos".')
+
+        self.argumentos = self.argumentos_de_ejemplo()
+        urls = [(u, 'tienda') for u in tienda.urls.urlpatterns] + [(u, 'dashboard') for u in dashboard.urls.urlpatterns]
+        urls.sort(key=lambda par: par[0].name in URLS_AL_FINAL)
+        if options['solo']:
+            urls = [par for par in urls if par[0].name in options['solo']]
+
+        # Los 404/403 esperados no deben llenar la salida del benchmark
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        commit = commit_actual()
+        resultados = []
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for patron, app in urls:
+                kwargs = self.kwargs_para(patron)
+                if None in kwargs.values():
+                    self.stdout.write(self.style.WARNING(f'{patron.name}: no hay datos para construir la URL, se omite.'))
+                    continue
+                resultado = self.medir(patron, app, kwargs, options['repeticiones'], options['cache_fria'])
+                resultados.append(resultado)
+                self.stdout.write(
+                    f"{resultado['nombre']:<22} {resultado['status']} "
+                    f"p50={resultado['p50_ms']:>8.2f}ms p95={resultado['p95_ms']:>8.2f}ms "
+                    f"consultas={resultado['consultas']}"
+                )
+
+        informe = {
+            'commit': commit,
+            'fecha': timezone.now().isoformat(),
+            'base_de_datos': connection.vendor,
+            'repeticiones': options['repeticiones'],
+            'cache_fria': options['cache_fria'],
+            'escala': {
+                'libros': Libro.objects.count(),
+                'autores': Autor.objects.count(),
+                'generos': Genero.objects.count(),
+                'usuarios': User.objects.count(),
+                'pedidos': Pedido.objects.count(),
+                'detalles_pedido': DetallePedido.objects.count(),
+                'bibliotecas': BibliotecaUsuario.objects.count(),
+            },
+            'resultados': resultados,
+        }
+        salida = options['salida'] or os.path.join(settings.BASE_DIR, 'benchmarks', f'{commit}.json')
+        os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+        with open(salida, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
+
+    def argumentos_de_ejemplo(self):
+        libro_propio = (
+            Libro.objects.filter(bibliotecausuario__usuario=self.usuario, formato='ebook').order_by('id').first()
+        )
+        libro_nuevo = (
+            Libro.objects.filter(estado_publicacion='disponible')
+            .exclude(bibliotecausuario__usuario=self.usuario).order_by('-id').first()
+        )
+        proximo = Libro.objects.filter(estado_publicacion='proximamente').order_by('id').first()
+        pagina = libro_propio.contenido.filter(tipo_contenido='imagen').order_by('orden').first() if libro_propio else None
+        return {
+            'id_libro': libro_nuevo.id if libro_nuevo else None,
+            'id_libro_propio': libro_propio.id if libro_propio else None,
+            'id_proximo': proximo.id if proximo else None,
+            'pagina': 1,
+            'nombre': pagina.archivo.name if pagina else 'contenido/no-existe.png',
+            'id_usuario': self.usuario.id,
+            'id_genero': Genero.objects.order_by('id').values_list('id', flat=True).first(),
+            'id_autor': Autor.objects.order_by('id').values_list('id', flat=True).first(),
+            'tamano': 'cuadricula',
+            'formato': 'webp',
+            'portada': self.portada_en_disco(),
+        }
+
+    def portada_en_disco(self):
+        # generar_datos pone nombres de portada sin archivo; con ellos solo se mediría el 404
+        portadas = Libro.objects.exclude(portada='').order_by('id').values_list('portada', flat=True)
+        for nombre in portadas[:200]:
+            if os.path.isfile(os.path.join(settings.MEDIA_ROOT, nombre)):
+                return nombre
+        return portadas.first()
+
+    def kwargs_para(self, patron):
+        kwargs = {}
+        for nombre in patron.pattern.converters:
+            clave = nombre
+            if nombre == 'id_libro' and patron.name == 'proximo_detalle':
+                clave = 'id_proximo'
+            elif nombre == 'id_libro' and patron.name in ('leer_libro', 'servir_contenido'):
+                clave = 'id_libro_propio'
+            elif nombre == 'nombre' and patron.name == 'miniatura':
+                clave = 'portada'
+            kwargs[nombre] = self.argumentos.get(clave)
+        return kwargs
+
+    def medir(self, patron, app, kwargs, repeticiones, cache_fria):
+        url = reverse(patron.name, kwargs=kwargs)
+        cliente = Client()
+        cliente.force_login(self.admin if app == 'dashboard' else self.usuario)
+
+        tiempos = []
+        consultas = []
+        status = None
+        # Una petición de calentamiento que no se cuenta
+        for i in range(repeticiones + 1):
+            if cache_fria:
+                cache.clear()
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                respuesta = cliente.get(url)
+                duracion = time.perf_counter() - inicio
+            if patron.name in URLS_AL_FINAL:
+                cliente.force_login(self.usuario)
+            if i == 0:
+                continue
+            tiempos.append(duracion * 1000)
+            consultas.append(len(capturadas))
+            status = respuesta.status_code
+
+        return {
+            'nombre': patron.name,
+            'app': app,
+            'url': url,
+            'status': status,
+            'p50_ms': round(percentil(tiempos, 50), 3),
+            'p95_ms': round(percentil(tiempos, 95), 3),
+            'max_ms': round(max(tiempos), 3),
+            'consultas': max(consultas),
+        }
@@ -0,0 +1,115 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.text import slugify
+
+from tienda import pdf
+from tienda.derivados import generar_derivados_en_paralelo
+from tienda.ingesta import paginas_ordenadas, copiar_pagina, guardar_pagina, reemplazar_paginas
+from tienda.models import Libro
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga a un libro las páginas de una carpeta (pagina_1.png, pagina_2.png, ...) '
+        'o de un PDF, que se rasteriza página por página. Las páginas anteriores se '
+        'reemplazan en una sola transacción y una corrida interrumpida se puede repetir '
+        'sin volver a copiar lo que ya estaba copiado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('id_libro', type=int)
+        parser.add_argument('origen', help='Carpeta con imágenes .png o archivo .pdf.')
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos para calcular hashes y copiar archivos.')
+        parser.add_argument('--procesos', type=int, default=None, help='Procesos para rasterizar el PDF (por defecto, uno por CPU).')
+        parser.add_argument('--dpi', type=int, default=150, help='Resolución de las páginas rasterizadas del PDF.')
+        parser.add_argument('--prefijo', help='Prefijo de los archivos copiados (por defecto, el título del libro).')
+        parser.add_argument('--sin-derivados', action='store_true', help='No generar las versiones WebP/JPEG.')
+
+    def handle(self, *args, **options):
+        try:
+            libro = Libro.objects.get(id=options['id_libro'])
+        except Libro.DoesNotExist:
+            raise CommandError(f"No se encontró ningún libro con ID {options['id_libro']}.")
+
+        origen = options['origen']
+        prefijo = options['prefijo'] or slugify(libro.titulo) or f'libro_{libro.id}'
+
+        self.inicio = time.perf_counter()
+        if origen.lower().endswith('.pdf'):
+            if not os.path.isfile(origen):
+                raise CommandError(f'No se encontró el PDF: {origen}')
+            nombres = self.cargar_pdf(libro, origen, prefijo, options)
+        else:
+            if not os.path.isdir(origen):
+                raise CommandError(f'No se pudo encontrar la carpeta de imágenes en: {origen}')
+            nombres = self.cargar_carpeta(libro, origen, prefijo, options)
+
+        reemplazar_paginas(libro, nombres)
+        total = len(nombres)
+        duracion = time.perf_counter() - self.inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'Se cargaron {total} páginas en {duracion:.1f}s ({total / duracion:.1f} páginas/s).'
+        ))
+
+        if settings.DERIVADOS_AL_SUBIR and not options['sin_derivados']:
+            self.stdout.write('Generando versiones WebP/JPEG...')
+            generar_derivados_en_paralelo(nombres, procesos=settings.DERIVADOS_PROCESOS)
+
+    def progreso(self, i, total):
+        if i % 20 == 0 or i == total:
+            velocidad = i / (time.perf_counter() - self.inicio)
+            self.stdout.write(f'  ... {i}/{total} páginas ({velocidad:.1f} páginas/s)')
+
+    def resumen_copiadas(self, copiadas, total):
+        if copiadas < total:
+            self.stdout.write(f'  {total - copiadas} páginas ya estaban copiadas de una corrida anterior.')
+
+    def cargar_carpeta(self, libro, carpeta, prefijo, options):
+        try:
+            archivos = paginas_ordenadas(carpeta)
+        except ValueError:
+            raise CommandError("Los archivos deben llamarse 'pagina_1.png', 'pagina_2.png', etc.")
+        if not archivos:
+            raise CommandError(f'No hay imágenes .png en {carpeta}.')
+
+        total = len(archivos)
+        self.stdout.write(f"Cargando {total} páginas en '{libro.titulo}' con {options['hilos']} hilos...")
+
+        nombres = []
+        copiadas = 0
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            resultados = pool.map(
+                lambda par: copiar_pagina(os.path.join(carpeta, par[1]), prefijo, par[0]),
+                enumerate(archivos, start=1),
+            )
+            # map conserva el orden de las páginas aunque terminen desordenadas
+            for i, (nombre, se_copio) in enumerate(resultados, start=1):
+                nombres.append(nombre)
+                copiadas += se_copio
+                self.progreso(i, total)
+
+        self.resumen_copiadas(copiadas, total)
+        return nombres
+
+    def cargar_pdf(self, libro, ruta_pdf, prefijo, options):
+        if pdf.pymupdf is None:
+            raise CommandError('Se necesita PyMuPDF para cargar libros en PDF (pip install pymupdf).')
+
+        total = pdf.total_paginas_pdf(ruta_pdf)
+        self.stdout.write(f"Rasterizando {total} páginas de '{os.path.basename(ruta_pdf)}' a {options['dpi']} dpi...")
+
+        nombres = []
+        copiadas = 0
+        # Cada página se escribe a disco en cuanto llega; solo se guardan los nombres
+        for numero, png in pdf.paginas_pdf(ruta_pdf, dpi=options['dpi'], procesos=options['procesos']):
+            nombre, se_copio = guardar_pagina(png, prefijo, numero, '.png')
+            nombres.append(nombre)
+            copiadas += se_copio
+            self.progreso(numero, total)
+
+        self.resumen_copiadas(copiadas, total)
+        return nombres
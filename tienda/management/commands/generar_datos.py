@@ -0,0 +1,178 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tienda.busqueda import reconstruir_indice
+from tienda.catalogo import invalidar_catalogo
+from tienda.ventas import acumular_pendientes
+from tienda.models import Libro, Genero, Autor, BibliotecaUsuario, Pedido, DetallePedido
+
+
+LOTE = 5000
+
+# Las portadas de los libros generados; sirven para reconocerlos al repetir el comando
+PREFIJO_PORTADA = 'portadas/generada_'
+
+PALABRAS = (
+    'camino', 'noche', 'ciudad', 'memoria', 'silencio', 'viaje', 'fuego', 'mar', 'jardín', 'sombra',
+    'río', 'tiempo', 'casa', 'luz', 'invierno', 'promesa', 'guerra', 'carta', 'isla', 'voz',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera un catálogo, usuarios y pedidos sintéticos y reproducibles para benchmarks. '
+        'Úsalo sobre una base de datos aparte (BOOKSBS_DB_NAME=/tmp/bench.sqlite3). '
+        'Se puede repetir: lo que ya existe se reutiliza.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=100_000)
+        parser.add_argument('--autores', type=int, default=20_000)
+        parser.add_argument('--generos', type=int, default=40)
+        parser.add_argument('--usuarios', type=int, default=50_000)
+        parser.add_argument('--pedidos', type=int, default=1_000_000)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--desde', default='2025-01-01', help='Fecha del primer pedido (AAAA-MM-DD).')
+        parser.add_argument('--dias', type=int, default=365, help='Días sobre los que se reparten los pedidos.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['semilla'])
+        inicio = time.perf_counter()
+
+        desde = datetime.datetime.fromisoformat(options['desde']).replace(tzinfo=datetime.timezone.utc)
+        generos = self.crear_generos(options['generos'])
+        autores = self.crear_autores(options['autores'])
+        libros = list(Libro.objects.filter(portada__startswith=PREFIJO_PORTADA).order_by('id'))
+        if libros:
+            self.stdout.write(f'  {len(libros)} libros de una ejecución anterior, no se crean más')
+        else:
+            libros = self.crear_libros(options['libros'], autores, generos, desde.date())
+        usuarios = self.crear_usuarios(options['usuarios'])
+        if usuarios and Pedido.objects.filter(usuario_id=usuarios[0].id).exists():
+            self.stdout.write('  los pedidos ya estaban generados')
+        else:
+            self.crear_pedidos(options['pedidos'], usuarios, libros, desde, options['dias'])
+        self.stdout.write(f'  {acumular_pendientes()} detalles sumados a los resúmenes de ventas')
+        # bulk_create no pasa por las señales que mantienen el índice de búsqueda
+        reconstruir_indice()
+        self.stdout.write('  índice de búsqueda reconstruido')
+
+        invalidar_catalogo()
+        self.stdout.write(self.style.SUCCESS(f'Datos generados en {time.perf_counter() - inicio:.1f}s.'))
+
+    def lotes(self, modelo, objetos, descripcion, campo_unico=None):
+        """
+        bulk_create por lotes. Con `campo_unico` las filas que ya existen se
+        dejan como están y se devuelven las de la base, en el mismo orden.
+        """
+        creados = []
+        lote = []
+
+        def guardar(lote):
+            if campo_unico is None:
+                return modelo.objects.bulk_create(lote)
+            modelo.objects.bulk_create(lote, ignore_conflicts=True)
+            valores = [getattr(objeto, campo_unico) for objeto in lote]
+            en_base = modelo.objects.in_bulk(valores, field_name=campo_unico)
+            return [en_base[valor] for valor in valores]
+
+        for objeto in objetos:
+            lote.append(objeto)
+            if len(lote) == LOTE:
+                creados += guardar(lote)
+                lote = []
+        if lote:
+            creados += guardar(lote)
+        self.stdout.write(f'  {len(creados)} {descripcion}')
+        return creados
+
+    def titulo(self):
+        return ' '.join(self.rng.choice(PALABRAS) for _ in range(self.rng.randint(2, 5))).capitalize()
+
+    def crear_generos(self, total):
+        return self.lotes(Genero, (Genero(nombre_genero=f'Género {i}') for i in range(total)), 'géneros', 'nombre_genero')
+
+    def crear_autores(self, total):
+        return self.lotes(Autor, (
+            Autor(nombre_autor=f'Autor {i}', biografia=self.titulo()) for i in range(total)
+        ), 'autores', 'nombre_autor')
+
+    @transaction.atomic
+    def crear_libros(self, total, autores, generos, desde):
+        libros = self.lotes(Libro, (
+            Libro(
+                titulo=f'{self.titulo()} {i}',
+                descripcion=' '.join(self.rng.choice(PALABRAS) for _ in range(40)),
+                precio=Decimal(self.rng.randint(49, 599)) + Decimal('0.99'),
+                portada=f'{PREFIJO_PORTADA}{i % 50}.jpg',
+                formato='audiobook' if self.rng.random() < 0.2 else 'ebook',
+                estado_publicacion='proximamente' if self.rng.random() < 0.1 else 'disponible',
+                fecha_lanzamiento=desde + datetime.timedelta(days=self.rng.randint(0, 730)),
+            )
+            for i in range(total)
+        ), 'libros')
+        self.lotes(Libro.autores.through, (
+            Libro.autores.through(libro_id=libro.id, autor_id=autor.id)
+            for libro in libros
+            for autor in self.rng.sample(autores, self.rng.randint(1, 3))
+        ), 'relaciones libro-autor')
+        self.lotes(Libro.generos.through, (
+            Libro.generos.through(libro_id=libro.id, genero_id=genero.id)
+            for libro in libros
+            for genero in self.rng.sample(generos, self.rng.randint(1, 2))
+        ), 'relaciones libro-género')
+        return libros
+
+    def crear_usuarios(self, total):
+        usuarios = self.lotes(User, (
+            User(username=f'usuario{i}@booksbs.local', email=f'usuario{i}@booksbs.local',
+                 first_name=f'Usuario {i}', password='!')
+            for i in range(total)
+        ), 'usuarios', 'username')
+        if not User.objects.filter(username='benchmark_admin@booksbs.local').exists():
+            User.objects.create_superuser(username='benchmark_admin@booksbs.local', email='benchmark_admin@booksbs.local')
+        return usuarios
+
+    def crear_pedidos(self, total, usuarios, libros, desde, dias):
+        if not usuarios or not total:
+            return
+        disponibles = [libro for libro in libros if libro.estado_publicacion == 'disponible']
+        por_usuario, sobrantes = divmod(total, len(usuarios))
+        segundos = dias * 24 * 60 * 60
+
+        # fecha_pedido es auto_now_add; se desactiva para repartir los pedidos en el tiempo
+        campo_fecha = Pedido._meta.get_field('fecha_pedido')
+        campo_fecha.auto_now_add = False
+        usuarios_por_lote = max(LOTE // max(por_usuario, 1), 1)
+        creados = 0
+        try:
+            for inicio in range(0, len(usuarios), usuarios_por_lote):
+                with transaction.atomic():
+                    pedidos = []
+                    compras = []
+                    for i, usuario in enumerate(usuarios[inicio:inicio + usuarios_por_lote], start=inicio):
+                        cantidad = min(por_usuario + (i < sobrantes), len(disponibles))
+                        for libro in self.rng.sample(disponibles, cantidad):
+                            fecha = desde + datetime.timedelta(seconds=self.rng.randrange(segundos))
+                            pedidos.append(Pedido(usuario_id=usuario.id, fecha_pedido=fecha,
+                                                  total_pagado=libro.precio, estado_pago='completado'))
+                            compras.append((usuario.id, libro))
+                    pedidos = Pedido.objects.bulk_create(pedidos, batch_size=LOTE)
+                    DetallePedido.objects.bulk_create((
+                        DetallePedido(pedido_id=pedido.id, libro_id=libro.id, precio_compra=libro.precio)
+                        for pedido, (_, libro) in zip(pedidos, compras)
+                    ), batch_size=LOTE)
+                    BibliotecaUsuario.objects.bulk_create((
+                        BibliotecaUsuario(usuario_id=usuario_id, libro_id=libro.id)
+                        for usuario_id, libro in compras
+                    ), batch_size=LOTE)
+                    creados += len(pedidos)
+                self.stdout.write(f'  ... {creados}/{total} pedidos')
+        finally:
+            campo_fecha.auto_now_add = True
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tienda.derivados import generar_derivados_en_paralelo, generar_miniaturas
+from tienda.models import Libro, Autor, ContenidoLibro
+
+
+class Command(BaseCommand):
+    help = 'Genera las versiones WebP/JPEG de páginas y portadas, y las miniaturas de portadas y fotos, que todavía no existan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libro', type=int, help='Procesa solo el libro con este ID.')
+        parser.add_argument('--procesos', type=int, default=None, help='Procesos del pool (por defecto, uno por CPU).')
+
+    def handle(self, *args, **options):
+        paginas = ContenidoLibro.objects.filter(tipo_contenido='imagen')
+        libros = Libro.objects.all()
+        if options['libro']:
+            paginas = paginas.filter(libro_id=options['libro'])
+            libros = libros.filter(id=options['libro'])
+
+        nombres = list(libros.values_list('portada', flat=True))
+        nombres += list(paginas.order_by('libro_id', 'orden').values_list('archivo', flat=True))
+        self.stdout.write(f'Revisando {len(nombres)} imágenes...')
+
+        procesadas = 0
+        inicio = time.perf_counter()
+
+        def al_terminar(ruta, escritos):
+            nonlocal procesadas
+            procesadas += 1
+            if procesadas % 50 == 0:
+                self.stdout.write(f'  ... {procesadas}/{len(nombres)} imágenes revisadas')
+
+        escritos = generar_derivados_en_paralelo(nombres, procesos=options['procesos'], al_terminar=al_terminar)
+
+        imagenes = list(libros.values_list('portada', flat=True))
+        if not options['libro']:
+            imagenes += list(Autor.objects.exclude(foto='').exclude(foto=None).values_list('foto', flat=True))
+        self.stdout.write(f'Revisando miniaturas de {len(imagenes)} portadas y fotos...')
+        escritos += generar_derivados_en_paralelo(imagenes, procesos=options['procesos'], funcion=generar_miniaturas)
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'Listo: {escritos} versiones nuevas en {duracion:.1f}s.'
+        ))
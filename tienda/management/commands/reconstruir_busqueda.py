@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tienda.busqueda import indice_disponible, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Vuelve a llenar el índice de búsqueda de texto completo de los libros.'
+
+    def handle(self, *args, **options):
+        if not indice_disponible():
+            self.stdout.write('Esta base de datos no usa el índice FTS5; no hay nada que reconstruir.')
+            return
+        reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS('Índice de búsqueda reconstruido.'))
@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia la base SQLite primaria sobre cada réplica de BOOKSBS_DB_REPLICAS (API de backup '
+        'de SQLite, sin parar el servidor). Sirve para probar las réplicas en local; en '
+        'PostgreSQL la replicación la hace el propio servidor.'
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Solo para SQLite.')
+        if not settings.DB_REPLICAS:
+            raise CommandError('No hay réplicas configuradas (BOOKSBS_DB_REPLICAS).')
+
+        connection.ensure_connection()
+        for alias in settings.DB_REPLICAS:
+            connections[alias].close()
+            nombre = connections[alias].settings_dict['NAME']
+            destino = sqlite3.connect(nombre)
+            try:
+                connection.connection.backup(destino)
+            finally:
+                destino.close()
+            self.stdout.write(self.style.SUCCESS(f'{alias}: copiada en {nombre}'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0002_paginalibro'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contenidolibro',
+            index=models.Index(fields=['libro', 'tipo_contenido', 'orden', 'archivo'], name='contenido_libro_orden_idx'),
+        ),
+    ]
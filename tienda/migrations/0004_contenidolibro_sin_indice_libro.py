@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0003_contenidolibro_orden_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contenidolibro',
+            name='libro',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='contenido', to='tienda.libro'),
+        ),
+    ]
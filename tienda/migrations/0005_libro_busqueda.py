@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+CREAR = """
+CREATE VIRTUAL TABLE tienda_libro_busqueda USING fts5(
+    titulo, descripcion, autores, generos,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+LLENAR = """
+INSERT INTO tienda_libro_busqueda (rowid, titulo, descripcion, autores, generos)
+SELECT
+    l.id,
+    l.titulo,
+    COALESCE(l.descripcion, ''),
+    COALESCE((SELECT group_concat(a.nombre_autor, ' ')
+              FROM tienda_libro_autores la JOIN tienda_autor a ON a.id = la.autor_id
+              WHERE la.libro_id = l.id), ''),
+    COALESCE((SELECT group_concat(g.nombre_genero, ' ')
+              FROM tienda_libro_generos lg JOIN tienda_genero g ON g.id = lg.genero_id
+              WHERE lg.libro_id = l.id), '')
+FROM tienda_libro l
+"""
+
+
+def crear_indice(apps, schema_editor):
+    # Solo SQLite tiene FTS5; en otras bases la búsqueda usa icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREAR)
+    schema_editor.execute(LLENAR)
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS tienda_libro_busqueda')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0004_contenidolibro_sin_indice_libro'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
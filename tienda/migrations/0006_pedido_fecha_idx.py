@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0005_libro_busqueda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['fecha_pedido', 'id'], name='pedido_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0006_pedido_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiariaFormato',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('formato', models.CharField(blank=True, choices=[('ebook', 'Ebook'), ('audiobook', 'Audiobook')], max_length=10)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaGenero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaLibro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='detallepedido',
+            name='resumido',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='detallepedido',
+            index=models.Index(condition=models.Q(('resumido', False)), fields=['id'], name='detalle_sin_resumir_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiariaformato',
+            constraint=models.UniqueConstraint(fields=('fecha', 'formato'), name='venta_diaria_formato_unica'),
+        ),
+        migrations.AddField(
+            model_name='ventadiariagenero',
+            name='genero',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='tienda.genero'),
+        ),
+        migrations.AddField(
+            model_name='ventadiarialibro',
+            name='libro',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='tienda.libro'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiariagenero',
+            constraint=models.UniqueConstraint(fields=('fecha', 'genero'), name='venta_diaria_genero_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiarialibro',
+            constraint=models.UniqueConstraint(fields=('fecha', 'libro'), name='venta_diaria_libro_unica'),
+        ),
+    ]
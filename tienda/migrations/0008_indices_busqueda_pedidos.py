@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0007_resumenes_ventas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedido',
+            name='usuario',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado_pago', 'fecha_pedido', 'id'], name='pedido_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', 'fecha_pedido', 'id'], name='pedido_usuario_fecha_idx'),
+        ),
+        # auth_user.email no tiene índice propio; la búsqueda de pedidos por
+        # email (igualdad o rango de prefijo) lo necesita
+        migrations.RunSQL(
+            'CREATE INDEX tienda_usuario_email_idx ON auth_user (email)',
+            'DROP INDEX tienda_usuario_email_idx',
+        ),
+    ]
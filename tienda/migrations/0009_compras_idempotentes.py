@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0008_indices_busqueda_pedidos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bibliotecausuario',
+            name='pedido',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entregas', to='tienda.pedido'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='clave_idempotencia',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='pedido',
+            constraint=models.UniqueConstraint(fields=('usuario', 'clave_idempotencia'), name='pedido_idempotente'),
+        ),
+    ]
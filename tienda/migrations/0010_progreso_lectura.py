@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0009_compras_idempotentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bibliotecausuario',
+            name='posicion_audio',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bibliotecausuario',
+            name='progreso_actualizado',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bibliotecausuario',
+            name='ultima_pagina',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0010_progreso_lectura'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autor',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='genero',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0011_cambios_catalogo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ventadiarialibro',
+            name='libro',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ventas_diarias', to='tienda.libro'),
+        ),
+    ]
@@ -9,6 +9,7 @@ from django.contrib.auth.models import User
 class Genero(models.Model):
     nombre_genero = models.CharField(max_length=100, unique=True)
     descripcion_genero = models.TextField(blank=True, null=True)
+    actualizado = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nombre_genero
@@ -20,6 +21,7 @@ class Autor(models.Model):
     
     # Campo de imagen
     foto = models.ImageField(upload_to='autores/', blank=True, null=True)
+    actualizado = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nombre_autor
@@ -49,6 +51,10 @@ class Libro(models.Model):
     autores = models.ManyToManyField(Autor, related_name="libros")
     generos = models.ManyToManyField(Genero, related_name="libros")
 
+    # Cambia también al cambiar sus autores o géneros (tienda/signals.py);
+    # las fichas lo usan como validador de caché HTTP
+    actualizado = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return self.titulo
 
@@ -74,6 +80,13 @@ class BibliotecaUsuario(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     libro = models.ForeignKey(Libro, on_delete=models.CASCADE)
     fecha_adquisicion = models.DateTimeField(auto_now_add=True)
+    # Pedido que insertó la fila; con INSERT ... ON CONFLICT DO NOTHING es la
+    # forma de saber qué libros compró de verdad cada pedido
+    pedido = models.ForeignKey('Pedido', on_delete=models.SET_NULL, null=True, blank=True, related_name='entregas')
+    # Progreso de lectura; se guarda por lotes desde tienda/progreso.py
+    ultima_pagina = models.PositiveIntegerField(default=1)
+    posicion_audio = models.PositiveIntegerField(default=0)
+    progreso_actualizado = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ('usuario', 'libro')
@@ -88,13 +101,18 @@ class ContenidoLibro(models.Model):
         ('audio', 'Audio (MP3)'),
     ]
 
-    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name="contenido")
+    # El índice compuesto de Meta ya empieza por libro, no hace falta otro
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name="contenido", db_index=False)
     tipo_contenido = models.CharField(max_length=10, choices=TIPO_CHOICES)
     archivo = models.FileField(upload_to='contenido/')
     orden = models.PositiveIntegerField(default=1)
 
     class Meta:
         ordering = ['orden']
+        indexes = [
+            # Índice cubriente para el manifiesto de páginas del lector
+            models.Index(fields=['libro', 'tipo_contenido', 'orden', 'archivo'], name='contenido_libro_orden_idx'),
+        ]
 
     def __str__(self):
         return f"{self.libro.titulo} - {self.tipo_contenido} {self.orden}"
@@ -109,10 +127,27 @@ class Pedido(models.Model):
         ('fallido', 'Fallido'),
     ]
 
-    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Los índices compuestos de Meta ya empiezan por usuario
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, db_index=False)
     fecha_pedido = models.DateTimeField(auto_now_add=True)
     total_pagado = models.DecimalField(max_digits=10, decimal_places=2)
     estado_pago = models.CharField(max_length=15, choices=ESTADO_PAGO_CHOICES, default='pendiente')
+    # Enviada con el formulario de compra: un reintento o doble clic con la
+    # misma clave devuelve el pedido ya creado en vez de crear otro
+    clave_idempotencia = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave_idempotencia'], name='pedido_idempotente'),
+        ]
+        indexes = [
+            # Orden y paginación por clave del listado de pedidos del dashboard
+            models.Index(fields=['fecha_pedido', 'id'], name='pedido_fecha_idx'),
+            # Búsqueda por estado o por usuario (dashboard/busqueda_pedidos.py)
+            # manteniendo el orden por fecha de la paginación
+            models.Index(fields=['estado_pago', 'fecha_pedido', 'id'], name='pedido_estado_fecha_idx'),
+            models.Index(fields=['usuario', 'fecha_pedido', 'id'], name='pedido_usuario_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"Pedido {self.id} - {self.usuario.username}"
@@ -122,6 +157,64 @@ class DetallePedido(models.Model):
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name="detalles")
     libro = models.ForeignKey(Libro, on_delete=models.SET_NULL, null=True)
     precio_compra = models.DecimalField(max_digits=10, decimal_places=2)
+    # True cuando el detalle ya está sumado en los resúmenes de ventas (tienda/ventas.py)
+    resumido = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(resumido=False), name='detalle_sin_resumir_idx'),
+        ]
 
     def __str__(self):
         return f"{self.libro.titulo} en Pedido {self.pedido.id}"
+
+
+# --- Resúmenes diarios de ventas ---
+# Se actualizan al comprar y con el comando acumular_ventas; el panel de
+# ventas solo lee de aquí, nunca de Pedido/DetallePedido.
+
+class VentaDiariaLibro(models.Model):
+    fecha = models.DateField()
+    # Al borrar el libro sus ventas se quedan (sin libro), como en DetallePedido
+    libro = models.ForeignKey(Libro, on_delete=models.SET_NULL, null=True, related_name="ventas_diarias")
+    unidades = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'libro'], name='venta_diaria_libro_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.libro_id}: {self.unidades}"
+
+
+class VentaDiariaGenero(models.Model):
+    fecha = models.DateField()
+    genero = models.ForeignKey(Genero, on_delete=models.CASCADE, related_name="ventas_diarias")
+    unidades = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'genero'], name='venta_diaria_genero_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.genero_id}: {self.unidades}"
+
+
+class VentaDiariaFormato(models.Model):
+    # formato vacío: ventas de libros que ya se borraron
+    fecha = models.DateField()
+    formato = models.CharField(max_length=10, choices=Libro.FORMATO_CHOICES, blank=True)
+    unidades = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'formato'], name='venta_diaria_formato_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.formato}: {self.unidades}"
@@ -0,0 +1,54 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pymupdf
+except ImportError:  # dependencia opcional, solo para cargar libros en PDF
+    pymupdf = None
+
+
+# Cada proceso del pool abre el PDF una sola vez y lo reutiliza.
+_documento = None
+
+
+def _abrir_documento(ruta_pdf):
+    global _documento
+    if _documento is None or _documento.name != ruta_pdf:
+        _documento = pymupdf.open(ruta_pdf)
+    return _documento
+
+
+def total_paginas_pdf(ruta_pdf):
+    with pymupdf.open(ruta_pdf) as documento:
+        return documento.page_count
+
+
+def rasterizar_pagina(ruta_pdf, indice, dpi):
+    """Devuelve la página `indice` (desde 0) del PDF como PNG."""
+    pagina = _abrir_documento(ruta_pdf)[indice]
+    return pagina.get_pixmap(dpi=dpi).tobytes('png')
+
+
+def paginas_pdf(ruta_pdf, dpi=150, procesos=None, ventana=None):
+    """
+    Rasteriza el PDF con un pool de procesos y genera (numero, png) en orden.
+
+    Nunca hay más de `ventana` páginas en vuelo, así que la memoria usada no
+    depende del tamaño del libro.
+    """
+    if pymupdf is None:
+        raise ImportError('Se necesita PyMuPDF para cargar libros en PDF (pip install pymupdf).')
+
+    total = total_paginas_pdf(ruta_pdf)
+    procesos = procesos or os.cpu_count() or 1
+    ventana = ventana or procesos * 2
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        pendientes = deque()
+        siguiente = 0
+        while siguiente < total or pendientes:
+            while siguiente < total and len(pendientes) < ventana:
+                pendientes.append(pool.submit(rasterizar_pagina, ruta_pdf, siguiente, dpi))
+                siguiente += 1
+            numero = siguiente - len(pendientes) + 1
+            yield numero, pendientes.popleft().result()
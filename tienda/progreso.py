@@ -0,0 +1,115 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BibliotecaUsuario
+
+
+# Progreso de lectura (última página y segundo del audiobook) con escritura
+# diferida: cada cambio de página solo actualiza un dict en memoria y un hilo
+# lo guarda cada PROGRESO_INTERVALO segundos, todo en una transacción. Si un
+# lector pasa diez páginas entre dos guardados se escribe una sola vez.
+#
+# Cada proceso tiene su propio búfer; al guardar, una fila solo se pisa si lo
+# que hay en la base de datos es más antiguo, así un proceso que guarda tarde
+# no deshace el progreso que guardó otro. Al terminar el proceso se guarda lo
+# pendiente (atexit); un proceso que muere de golpe pierde como mucho los
+# últimos PROGRESO_INTERVALO segundos.
+
+logger = logging.getLogger(__name__)
+
+# Tope para la posición del audio (cabe en un PositiveIntegerField)
+SEGUNDOS_MAXIMOS = 2 ** 31 - 1
+
+pendientes = {}
+cerrojo = threading.Lock()
+despertar = threading.Event()
+hilo = None
+
+
+def registrar_progreso(usuario_id, libro_id, pagina=None, segundos=None):
+    """Anota la página y/o el segundo de escucha; no consulta la base de datos."""
+    with cerrojo:
+        entrada = pendientes.setdefault((usuario_id, libro_id), {})
+        if pagina is not None:
+            entrada['ultima_pagina'] = pagina
+        if segundos is not None:
+            entrada['posicion_audio'] = segundos
+        entrada['progreso_actualizado'] = timezone.now()
+        lleno = len(pendientes) >= settings.PROGRESO_LOTE
+
+    if settings.PROGRESO_INTERVALO <= 0:
+        if lleno:
+            guardar_pendientes()
+        return
+    iniciar_hilo()
+    if lleno:
+        despertar.set()
+
+
+def progreso_pendiente(usuario_id, libro_id):
+    """Lo que este proceso aún no ha guardado para ese libro ({} si nada)."""
+    with cerrojo:
+        return dict(pendientes.get((usuario_id, libro_id), {}))
+
+
+def aplicar_pendiente(fila, usuario_id, libro_id):
+    """Copia sobre `fila` (BibliotecaUsuario o Libro anotado) el progreso sin guardar."""
+    for campo, valor in progreso_pendiente(usuario_id, libro_id).items():
+        setattr(fila, campo, valor)
+    return fila
+
+
+def guardar_pendientes():
+    """Guarda en una transacción todo lo pendiente. Devuelve cuántas filas tocó."""
+    global pendientes
+    with cerrojo:
+        lote, pendientes = pendientes, {}
+    if not lote:
+        return 0
+
+    guardadas = 0
+    try:
+        with transaction.atomic():
+            for (usuario_id, libro_id), campos in lote.items():
+                momento = campos['progreso_actualizado']
+                guardadas += BibliotecaUsuario.objects.filter(
+                    Q(progreso_actualizado__isnull=True) | Q(progreso_actualizado__lt=momento),
+                    usuario_id=usuario_id, libro_id=libro_id,
+                ).update(**campos)
+    except Exception:
+        # Se devuelve al búfer lo que no se pudo guardar, sin pisar lo más nuevo
+        with cerrojo:
+            for clave, campos in lote.items():
+                pendientes[clave] = {**campos, **pendientes.get(clave, {})}
+        raise
+    return guardadas
+
+
+def bucle_guardado():
+    while True:
+        despertar.wait(settings.PROGRESO_INTERVALO)
+        despertar.clear()
+        try:
+            guardar_pendientes()
+        except Exception:
+            logger.exception('No se pudo guardar el progreso de lectura')
+        finally:
+            # La conexión de este hilo no la cierra ningún request_finished
+            connection.close()
+
+
+def iniciar_hilo():
+    global hilo
+    if hilo is not None:
+        return
+    with cerrojo:
+        if hilo is None:
+            hilo = threading.Thread(target=bucle_guardado, name='guardar-progreso', daemon=True)
+            hilo.start()
+            atexit.register(guardar_pendientes)
@@ -0,0 +1,123 @@
+import contextvars
+import functools
+import random
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+# Lecturas de la tienda en réplicas. Solo las vistas marcadas con
+# @lectura_en_replica leen de una réplica, y solo los modelos de la tienda
+# (sesiones y usuarios siempre van a la primaria). Todas las escrituras van a
+# la primaria. Una sesión que hace un POST (compra, carrito, progreso...) lee
+# de la primaria durante DB_PRIMARIA_TRAS_ESCRITURA segundos, para que vea lo
+# que acaba de escribir aunque la réplica vaya con retraso. Entrar, salir y
+# registrarse no cuentan: solo escriben usuarios y sesiones, que ya se leen
+# siempre de la primaria.
+#
+# Lo que se guarda en cache (catálogo, manifiestos) se construye siempre con
+# la primaria: una réplica atrasada justo después de invalidar dejaría datos
+# viejos en la cache durante todo su timeout.
+
+CLAVE_SESION = 'primaria_hasta'
+
+VISTAS_SIN_FIJAR = ('login', 'logout', 'registro')
+
+replica_actual = contextvars.ContextVar('replica_actual', default=None)
+
+
+class RouterReplicas:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'tienda':
+            return replica_actual.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaria y réplicas tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+def en_ventana(hasta):
+    return hasta is not None and time.time() < hasta
+
+
+def lectura_en_replica(vista):
+    if iscoroutinefunction(vista):
+        # La variable de contexto pasa también a las llamadas con sync_to_async
+        @functools.wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            if not settings.DB_REPLICAS or en_ventana(await request.session.aget(CLAVE_SESION)):
+                return await vista(request, *args, **kwargs)
+            token = replica_actual.set(random.choice(settings.DB_REPLICAS))
+            try:
+                return await vista(request, *args, **kwargs)
+            finally:
+                replica_actual.reset(token)
+        return envoltura_async
+
+    @functools.wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if not settings.DB_REPLICAS or en_ventana(request.session.get(CLAVE_SESION)):
+            return vista(request, *args, **kwargs)
+        # Una réplica por petición, así todas sus consultas ven el mismo estado
+        token = replica_actual.set(random.choice(settings.DB_REPLICAS))
+        try:
+            return vista(request, *args, **kwargs)
+        finally:
+            replica_actual.reset(token)
+    return envoltura
+
+
+@contextmanager
+def en_primaria():
+    """Dentro del bloque las lecturas vuelven a la primaria."""
+    token = replica_actual.set(None)
+    try:
+        yield
+    finally:
+        replica_actual.reset(token)
+
+
+class FijarPrimariaMiddleware:
+    """Tras un POST (o cualquier método que escribe) fija la sesión a la primaria un rato."""
+
+    # También asíncrono, para que con ASGI las vistas asíncronas (lector,
+    # archivos) no pasen por un hilo solo por este middleware
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def debe_fijar(self, request):
+        return (
+            settings.DB_REPLICAS
+            and request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+            and hasattr(request, 'session')
+            and getattr(request.resolver_match, 'url_name', None) not in VISTAS_SIN_FIJAR
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.debe_fijar(request):
+            request.session[CLAVE_SESION] = time.time() + settings.DB_PRIMARIA_TRAS_ESCRITURA
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.debe_fijar(request):
+            await request.session.aset(CLAVE_SESION, time.time() + settings.DB_PRIMARIA_TRAS_ESCRITURA)
+        return response
@@ -0,0 +1,71 @@
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.base import SessionBase
+from django.core import signing
+
+
+# Almacén de sesiones "mixta" (SESSION_ENGINE = 'tienda.sesiones'). Mientras
+# no hay usuario, la sesión (mensajes, fijar primaria...) va entera en una
+# cookie firmada: ni se lee ni se escribe la tabla de sesiones. Al iniciar
+# sesión pasa a cached_db: se lee de la cache y solo se escribe en la base
+# cuando cambia, y cerrar sesión la borra del servidor, cosa que una cookie
+# no permite. Las claves firmadas se distinguen porque llevan ':'; las de la
+# base son 32 caracteres [a-z0-9].
+# La cookie se puede leer (no va cifrada), así que no hay que guardar nada
+# secreto en la sesión de un anónimo.
+
+SAL = 'tienda.sesiones'
+
+
+def es_firmada(clave):
+    return clave is not None and ':' in clave
+
+
+class SessionStore(cached_db.SessionStore):
+
+    def load(self):
+        if not es_firmada(self.session_key):
+            return super().load()
+        try:
+            return signing.loads(
+                self.session_key, salt=SAL, serializer=self.serializer, max_age=self.get_session_cookie_age(),
+            )
+        except signing.BadSignature:
+            # Firma inválida o caducada (SignatureExpired): sesión nueva
+            self._session_key = None
+            return {}
+
+    async def aload(self):
+        if es_firmada(self.session_key):
+            return self.load()
+        return await super().aload()
+
+    def exists(self, session_key):
+        return not es_firmada(session_key) and super().exists(session_key)
+
+    def create(self):
+        # La clave (firmada o de la base) se decide al guardar
+        self._session_key = None
+        self.modified = True
+
+    def save(self, must_create=False):
+        datos = self._get_session(no_load=must_create)
+        if SESSION_KEY in datos:
+            if self.session_key is None or es_firmada(self.session_key):
+                return super().create()
+            return super().save(must_create=must_create)
+        if self.session_key is not None and not es_firmada(self.session_key):
+            super().delete()
+        self._session_key = signing.dumps(datos, salt=SAL, serializer=self.serializer, compress=True)
+        self.modified = True
+
+    def delete(self, session_key=None):
+        if not es_firmada(session_key or self.session_key):
+            super().delete(session_key)
+
+    # Las versiones asíncronas de cached_db no pasan por los métodos de
+    # arriba; las genéricas de SessionBase sí
+    aexists = SessionBase.aexists
+    acreate = SessionBase.acreate
+    asave = SessionBase.asave
+    adelete = SessionBase.adelete
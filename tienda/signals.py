@@ -0,0 +1,146 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Libro, Genero, Autor, ContenidoLibro, BibliotecaUsuario
+from .lector import invalidar_manifiesto
+from .derivados import programar_derivados, generar_miniaturas
+from .catalogo import invalidar_catalogo, tocar_libros
+from .busqueda import indexar_libros, quitar_libros
+from .biblioteca import invalidar_biblioteca
+from .instrumentacion import medir_consulta
+
+
+@receiver(connection_created)
+def configurar_sqlite(sender, connection, **kwargs):
+    """Aplica settings.SQLITE_PRAGMAS a cada conexión SQLite nueva."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for nombre, valor in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {nombre} = {valor}')
+
+
+@receiver(connection_created)
+def instrumentar_conexion(sender, connection, **kwargs):
+    # Las conexiones se reutilizan (CONN_MAX_AGE): solo se añade una vez
+    if settings.INSTRUMENTACION and medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_consulta)
+
+
+@receiver([post_save, post_delete], sender=ContenidoLibro)
+def contenido_libro_cambiado(sender, instance, **kwargs):
+    invalidar_manifiesto(instance.libro_id)
+
+
+@receiver([post_save, post_delete], sender=BibliotecaUsuario)
+def biblioteca_cambiada(sender, instance, **kwargs):
+    invalidar_biblioteca(instance.usuario_id)
+
+
+@receiver(post_save, sender=ContenidoLibro)
+def derivados_pagina(sender, instance, raw=False, **kwargs):
+    if raw or not settings.DERIVADOS_AL_SUBIR or instance.tipo_contenido != 'imagen':
+        return
+    nombre = instance.archivo.name
+    transaction.on_commit(lambda: programar_derivados(nombre))
+
+
+@receiver(post_save, sender=Libro)
+def derivados_portada(sender, instance, raw=False, **kwargs):
+    if raw or not settings.DERIVADOS_AL_SUBIR:
+        return
+    nombre = instance.portada.name
+    transaction.on_commit(lambda: programar_derivados(nombre))
+    transaction.on_commit(lambda: programar_derivados(nombre, generar_miniaturas))
+
+
+@receiver(post_save, sender=Autor)
+def miniaturas_foto(sender, instance, raw=False, **kwargs):
+    if raw or not settings.DERIVADOS_AL_SUBIR or not instance.foto:
+        return
+    nombre = instance.foto.name
+    transaction.on_commit(lambda: programar_derivados(nombre, generar_miniaturas))
+
+
+@receiver([post_save, pre_delete], sender=Autor)
+@receiver([post_save, pre_delete], sender=Genero)
+def autor_o_genero_cambiado(sender, instance, raw=False, **kwargs):
+    # Las fichas de sus libros muestran el nombre: cambian también
+    if not raw:
+        tocar_libros(Libro.objects.filter(**{'autores' if sender is Autor else 'generos': instance}))
+
+
+@receiver(m2m_changed, sender=Libro.autores.through)
+@receiver(m2m_changed, sender=Libro.generos.through)
+def relacion_libro_cambiada(sender, instance, action, reverse, pk_set, **kwargs):
+    campo = 'autores' if sender is Libro.autores.through else 'generos'
+    if reverse and action == 'pre_clear':
+        # Después del clear ya no se sabe qué libros tenían este autor/género
+        tocar_libros(Libro.objects.filter(**{campo: instance}))
+    elif action in ('post_add', 'post_remove'):
+        tocar_libros(Libro.objects.filter(pk__in=pk_set if reverse else [instance.pk]))
+    elif action == 'post_clear' and not reverse:
+        tocar_libros(Libro.objects.filter(pk=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Libro)
+@receiver([post_save, post_delete], sender=Genero)
+@receiver([post_save, post_delete], sender=Autor)
+@receiver(m2m_changed, sender=Libro.autores.through)
+@receiver(m2m_changed, sender=Libro.generos.through)
+def catalogo_cambiado(sender, action=None, **kwargs):
+    if action and action.startswith('pre_'):
+        return
+    invalidar_catalogo()
+
+
+# --- Índice de búsqueda (tienda/busqueda.py) ---
+# La tabla FTS5 vive en la misma base de datos, así que se actualiza dentro
+# de la misma transacción que el cambio que la provoca.
+
+@receiver(post_save, sender=Libro)
+def libro_guardado_busqueda(sender, instance, **kwargs):
+    indexar_libros([instance.id])
+
+
+@receiver(post_delete, sender=Libro)
+def libro_borrado_busqueda(sender, instance, **kwargs):
+    quitar_libros([instance.id])
+
+
+@receiver(m2m_changed, sender=Libro.autores.through)
+@receiver(m2m_changed, sender=Libro.generos.through)
+def relaciones_libro_busqueda(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            indexar_libros([instance.id])
+        return
+    # instance es un Autor o un Genero; pk_set son ids de libros
+    if action == 'pre_clear':
+        instance._libros_antes = list(instance.libros.values_list('id', flat=True))
+    elif action == 'post_clear':
+        indexar_libros(getattr(instance, '_libros_antes', []))
+    elif action.startswith('post_'):
+        indexar_libros(list(pk_set or []))
+
+
+@receiver(post_save, sender=Autor)
+@receiver(post_save, sender=Genero)
+def nombre_cambiado_busqueda(sender, instance, created=False, **kwargs):
+    if not created:
+        indexar_libros(list(instance.libros.values_list('id', flat=True)))
+
+
+@receiver(pre_delete, sender=Autor)
+@receiver(pre_delete, sender=Genero)
+def antes_de_borrar_busqueda(sender, instance, **kwargs):
+    instance._libros_antes = list(instance.libros.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Autor)
+@receiver(post_delete, sender=Genero)
+def despues_de_borrar_busqueda(sender, instance, **kwargs):
+    indexar_libros(getattr(instance, '_libros_antes', []))
@@ -0,0 +1,75 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+
+from tienda.derivados import derivados_en_cache, miniaturas_en_cache, nombre_miniatura, TIPOS_MIME
+from tienda.lector import url_contenido
+
+register = template.Library()
+
+
+def _srcset(versiones, url):
+    return ', '.join(f'{url(nombre)} {ancho}w' for nombre, ancho in versiones)
+
+
+@register.simple_tag
+def imagen_responsiva(archivo, alt='', clase='', sizes='100vw', libro_id=None):
+    """
+    <picture> con las versiones WebP/JPEG generadas por tienda.derivados.
+    Si todavía no existen, se usa solo la imagen original. Con `libro_id` las
+    URLs pasan por la vista protegida servir_contenido.
+    """
+    nombre = getattr(archivo, 'name', archivo)
+    if not nombre:
+        return ''
+    if libro_id is not None:
+        url = lambda n: url_contenido(libro_id, n)
+    else:
+        url = default_storage.url
+    url_original = url(nombre)
+    derivados = derivados_en_cache(nombre)
+
+    if not derivados:
+        return format_html('<img src="{}" alt="{}" class="{}">', url_original, alt, clase)
+
+    fuentes = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        ((TIPOS_MIME[formato], _srcset(versiones, url), sizes)
+         for formato, versiones in derivados.items() if formato != 'jpeg'),
+    )
+    srcset_jpeg = _srcset(derivados.get('jpeg', []), url)
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}"></picture>',
+        fuentes, url_original, srcset_jpeg, sizes, alt, clase,
+    )
+
+
+def url_miniatura(nombre, tamano, formato, existentes):
+    """
+    URL del archivo si ya existe (según `existentes`, de miniaturas_en_cache);
+    si no, la de la vista que lo genera.
+    """
+    miniatura = nombre_miniatura(nombre, tamano, formato)
+    if miniatura in existentes:
+        return default_storage.url(miniatura)
+    return reverse('miniatura', args=[tamano, formato, nombre])
+
+
+@register.simple_tag
+def miniatura(archivo, tamano, alt='', clase='', carga='lazy'):
+    """
+    <picture> con la miniatura `tamano` (ver tienda.derivados.MINIATURAS) de
+    una portada o foto de autor. Las que faltan se generan al pedirlas.
+    """
+    nombre = getattr(archivo, 'name', archivo)
+    if not nombre:
+        return ''
+    existentes = miniaturas_en_cache(nombre)
+    return format_html(
+        '<picture><source type="{}" srcset="{}"><img src="{}" alt="{}" class="{}" loading="{}"></picture>',
+        TIPOS_MIME['webp'], url_miniatura(nombre, tamano, 'webp', existentes),
+        url_miniatura(nombre, tamano, 'jpeg', existentes),
+        alt, clase, carga,
+    )
@@ -1,3 +1,1467 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, router
+from django.http import Http404, HttpResponse
+from django.db.models import Value
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from . import derivados, pdf, progreso, replicas
+from .instrumentacion import InstrumentacionMiddleware
+from .busqueda import buscar_ids, reconstruir_indice
+from .catalogo import en_cache_catalogo
+from .compras import comprar_libros
+from .derivados import (
+    es_derivado, generar_derivados, generar_derivados_en_paralelo, generar_miniaturas, nombre_derivado, nombre_miniatura,
+)
+from .estaticos import servir_estatico
+from .ingesta import reemplazar_paginas
+from .lector import obtener_manifiesto
+from .models import (
+    Libro, Genero, Autor, ContenidoLibro, BibliotecaUsuario, Pedido, DetallePedido,
+    VentaDiariaLibro, VentaDiariaGenero, VentaDiariaFormato,
+)
+from .replicas import lectura_en_replica
+from .sesiones import SessionStore
+from .ventas import acumular_pendientes
+
+
+class LectorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='lector@booksbs.local', password='x')
+        cls.libro = Libro.objects.create(titulo='Libro largo', portada='portadas/largo.png')
+        ContenidoLibro.objects.bulk_create(
+            ContenidoLibro(libro=cls.libro, tipo_contenido='imagen', orden=i, archivo=f'contenido/largo_pagina_{i}.png')
+            for i in range(1, 501)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def consultas_pagina(self, pagina):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('leer_libro', args=[self.libro.id, pagina]))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, len(consultas)
+
+    def test_pagina_500_cuesta_lo_mismo_que_pagina_1(self):
+        self.consultas_pagina(1)
+        _, consultas_primera = self.consultas_pagina(1)
+        respuesta, consultas_ultima = self.consultas_pagina(500)
+        self.assertEqual(consultas_primera, consultas_ultima)
+        self.assertEqual(respuesta.context['pagina_num'], 500)
+        self.assertEqual(respuesta.context['total_paginas'], 500)
+        self.assertTrue(respuesta.context['pagina_actual']['url'].endswith('largo_pagina_500.png'))
+
+    def test_pagina_fuera_de_rango_se_ajusta(self):
+        respuesta, _ = self.consultas_pagina(9999)
+        self.assertEqual(respuesta.context['pagina_num'], 500)
+
+    def test_manifiesto_se_invalida_al_cambiar_contenido(self):
+        self.assertEqual(obtener_manifiesto(self.libro.id)['total'], 500)
+        ContenidoLibro.objects.create(libro=self.libro, tipo_contenido='imagen', orden=501, archivo='contenido/largo_pagina_501.png')
+        self.assertEqual(obtener_manifiesto(self.libro.id)['total'], 501)
+        ContenidoLibro.objects.filter(libro=self.libro, orden=501).delete()
+        self.assertEqual(obtener_manifiesto(self.libro.id)['total'], 500)
+
+
+class DerivadosTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        os.makedirs(os.path.join(self.media, 'contenido'))
+        Image.new('RGB', (1000, 1400), 'white').save(os.path.join(self.media, 'contenido', 'prueba_pagina_1.png'))
+
+    def test_genera_versiones_sin_ampliar_y_sin_repetir_trabajo(self):
+        ruta = os.path.join(self.media, 'contenido', 'prueba_pagina_1.png')
+        self.assertEqual(generar_derivados(ruta), 4)  # 480 y 960 px, WebP y JPEG
+        self.assertEqual(generar_derivados(ruta), 0)
+        with Image.open(os.path.join(self.media, nombre_derivado('contenido/prueba_pagina_1.png', 480, 'webp'))) as imagen:
+            self.assertEqual(imagen.size, (480, 672))
+        self.assertFalse(os.path.exists(os.path.join(self.media, nombre_derivado('contenido/prueba_pagina_1.png', 1440, 'webp'))))
+
+    def test_el_pool_de_subidas_se_cierra(self):
+        with override_settings(MEDIA_ROOT=self.media, DERIVADOS_PROCESOS=1):
+            futuro = derivados.programar_derivados('contenido/prueba_pagina_1.png')
+        self.assertEqual(futuro.result(), 4)
+        derivados.cerrar_pool_subidas()
+        self.assertIsNone(derivados._pool_subidas)
+        derivados.cerrar_pool_subidas()
+
+    def test_imagen_responsiva_emite_srcset(self):
+        plantilla = Template('{% load medios %}{% imagen_responsiva nombre alt="Página" %}')
+        contexto = Context({'nombre': 'contenido/prueba_pagina_1.png'})
+        with override_settings(MEDIA_ROOT=self.media):
+            self.assertNotIn('srcset', plantilla.render(contexto))
+            # Al terminar, el pool borra lo que había en la cache para ese archivo
+            generar_derivados_en_paralelo(['contenido/prueba_pagina_1.png'], procesos=1)
+            html = plantilla.render(contexto)
+            with mock.patch('tienda.derivados.os.path.exists') as existe:
+                self.assertEqual(plantilla.render(contexto), html)
+            existe.assert_not_called()
+        self.assertIn('<source type="image/webp" srcset="/media/contenido/prueba_pagina_1.w480.webp 480w, /media/contenido/prueba_pagina_1.w960.webp 960w"', html)
+        self.assertIn('/media/contenido/prueba_pagina_1.w960.jpg 960w', html)
+
+
+class MiniaturasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        os.makedirs(os.path.join(self.media, 'portadas'))
+        self.ruta = os.path.join(self.media, 'portadas', 'grande.png')
+        Image.new('RGB', (1200, 1800), 'navy').save(self.ruta)
+        ajustes = override_settings(MEDIA_ROOT=self.media, MEDIA_ENTREGA='django')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_tamanos_con_nombre(self):
+        self.assertEqual(generar_miniaturas(self.ruta), 6)  # tres tamaños, WebP y JPEG
+        self.assertEqual(generar_miniaturas(self.ruta), 0)
+        with Image.open(os.path.join(self.media, nombre_miniatura('portadas/grande.png', 'tabla', 'webp'))) as imagen:
+            self.assertEqual(imagen.size, (100, 150))
+        self.assertTrue(es_derivado('portadas/grande.cuadricula.webp'))
+        self.assertTrue(es_derivado('contenido/pagina.w480.jpg'))
+        for nombre in ('portadas/grande.detalle.png', 'contenido/grande.detalle.webp', 'contenido/pagina.w123.webp',
+                       'portadas/.tabla.webp', 'portadas/grande.webp'):
+            with self.subTest(nombre=nombre):
+                self.assertFalse(es_derivado(nombre))
+
+    def test_la_plantilla_pide_la_miniatura_y_se_genera_al_primer_uso(self):
+        plantilla = Template("{% load medios %}{% miniatura nombre 'cuadricula' alt='Portada' %}")
+        html = plantilla.render(Context({'nombre': 'portadas/grande.png'}))
+        url_webp = reverse('miniatura', args=['cuadricula', 'webp', 'portadas/grande.png'])
+        self.assertIn(f'srcset="{url_webp}"', html)
+        self.assertIn('loading="lazy"', html)
+
+        respuesta = self.client.get(url_webp)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/webp')
+        # Una vez en disco la plantilla enlaza directamente al archivo de media
+        html = plantilla.render(Context({'nombre': 'portadas/grande.png'}))
+        self.assertIn('srcset="/media/portadas/grande.cuadricula.webp"', html)
+        self.assertIn('src="/media/portadas/grande.cuadricula.jpg"', html)
+
+    def test_la_plantilla_no_mira_el_disco_en_cada_render(self):
+        generar_miniaturas(self.ruta)
+        plantilla = Template("{% load medios %}{% miniatura nombre 'tabla' %}{% miniatura nombre 'detalle' %}")
+        contexto = Context({'nombre': 'portadas/grande.png'})
+        plantilla.render(contexto)
+        with mock.patch('tienda.derivados.os.path.exists') as existe:
+            html = plantilla.render(contexto)
+        existe.assert_not_called()
+        self.assertIn('srcset="/media/portadas/grande.detalle.webp"', html)
+
+    def test_solo_carpetas_publicas_y_tamanos_conocidos(self):
+        for args in (['enorme', 'webp', 'portadas/grande.png'], ['tabla', 'gif', 'portadas/grande.png'],
+                     ['tabla', 'webp', 'contenido/grande.png'], ['tabla', 'webp', 'portadas/../portadas/grande.png']):
+            with self.subTest(args=args):
+                self.assertEqual(self.client.get(reverse('miniatura', args=args)).status_code, 404)
+
+    def test_derivados_e_imagenes_rotas_dan_404(self):
+        generar_miniaturas(self.ruta)
+        with open(os.path.join(self.media, 'portadas', 'rota.png'), 'wb') as f:
+            f.write(b'no es una imagen')
+        for nombre in ('portadas/grande.cuadricula.webp', 'portadas/rota.png'):
+            with self.subTest(nombre=nombre):
+                respuesta = self.client.get(reverse('miniatura', args=['tabla', 'webp', nombre]))
+                self.assertEqual(respuesta.status_code, 404)
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'portadas', 'grande.cuadricula.tabla.webp')))
+
+
+class CargaPaginasTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(shutil.rmtree, self.carpeta)
+        for i in range(1, 13):
+            Image.new('RGB', (20, 30), (i, i, i)).save(os.path.join(self.carpeta, f'pagina_{i}.png'))
+        self.libro = Libro.objects.create(titulo='Libro nuevo', portada='portadas/nuevo.png')
+        ContenidoLibro.objects.create(libro=self.libro, tipo_contenido='imagen', orden=1, archivo='contenido/viejo.png')
+
+    def test_reemplaza_las_paginas_en_orden_y_se_puede_repetir(self):
+        with override_settings(MEDIA_ROOT=self.media):
+            call_command('cargar_paginas', self.libro.id, self.carpeta, '--sin-derivados', stdout=io.StringIO())
+            primera = list(self.libro.contenido.values_list('orden', 'archivo'))
+            call_command('cargar_paginas', self.libro.id, self.carpeta, '--sin-derivados', stdout=io.StringIO())
+            segunda = list(self.libro.contenido.values_list('orden', 'archivo'))
+        self.assertEqual(len(primera), 12)
+        self.assertEqual(primera, segunda)
+        self.assertTrue(primera[9][1].startswith('contenido/libro-nuevo_pagina_10_'))
+        self.assertEqual(len(os.listdir(os.path.join(self.media, 'contenido'))), 12)
+
+    def test_si_falla_el_libro_conserva_sus_paginas(self):
+        with mock.patch.object(ContenidoLibro.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                reemplazar_paginas(self.libro, ['contenido/nuevo_1.png'])
+        self.assertEqual(list(self.libro.contenido.values_list('archivo', flat=True)), ['contenido/viejo.png'])
+
+    @skipIf(pdf.pymupdf is None, 'PyMuPDF no está instalado')
+    def test_carga_un_pdf_pagina_por_pagina(self):
+        ruta_pdf = os.path.join(self.carpeta, 'libro.pdf')
+        documento = pdf.pymupdf.open()
+        for i in range(1, 4):
+            documento.new_page(width=200, height=300).insert_text((20, 40), f'Página {i}')
+        documento.save(ruta_pdf)
+        documento.close()
+
+        with override_settings(MEDIA_ROOT=self.media):
+            call_command('cargar_paginas', self.libro.id, ruta_pdf, '--sin-derivados', '--procesos', '2', stdout=io.StringIO())
+        archivos = list(self.libro.contenido.values_list('archivo', flat=True))
+        self.assertEqual(len(archivos), 3)
+        for numero, archivo in enumerate(archivos, start=1):
+            self.assertTrue(archivo.startswith(f'contenido/libro-nuevo_pagina_{numero}_'))
+            self.assertTrue(os.path.exists(os.path.join(self.media, archivo)))
+
+
+class EntregaContenidoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        os.makedirs(os.path.join(self.media, 'contenido'))
+        self.datos = bytes(range(256)) * 40
+        with open(os.path.join(self.media, 'contenido', 'libro.mp3'), 'wb') as f:
+            f.write(self.datos)
+        ajustes = override_settings(MEDIA_ROOT=self.media, MEDIA_ENTREGA='django')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.libro = Libro.objects.create(titulo='Audiolibro', portada='portadas/audio.png', formato='audiobook')
+        ContenidoLibro.objects.create(libro=self.libro, tipo_contenido='audio', archivo='contenido/libro.mp3')
+        self.duenio = User.objects.create_user(username='duenio@booksbs.local')
+        self.otro = User.objects.create_user(username='otro@booksbs.local')
+        BibliotecaUsuario.objects.create(usuario=self.duenio, libro=self.libro)
+        self.url = reverse('servir_contenido', args=[self.libro.id, 'contenido/libro.mp3'])
+
+    def test_solo_el_duenio_puede_descargar(self):
+        self.client.force_login(self.otro)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(self.duenio)
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(b''.join(respuesta.streaming_content), self.datos)
+        self.assertEqual(respuesta['Accept-Ranges'], 'bytes')
+
+    def test_archivo_ajeno_al_libro(self):
+        self.client.force_login(self.duenio)
+        url = reverse('servir_contenido', args=[self.libro.id, 'contenido/../../settings.py'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('servir_contenido', args=[self.libro.id, 'contenido/otro.mp3'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_solo_nombres_exactos_del_manifiesto(self):
+        ContenidoLibro.objects.create(libro=self.libro, tipo_contenido='imagen', orden=1, archivo='contenido/pagina.png')
+        for nombre in ('libro.pdf', 'pagina.w480.webp', 'pagina.txt', 'pagina.w480.png'):
+            with open(os.path.join(self.media, 'contenido', nombre), 'wb') as f:
+                f.write(b'x')
+        self.client.force_login(self.duenio)
+        for nombre, estado in (('contenido/pagina.w480.webp', 200), ('contenido/libro.pdf', 404),
+                               ('contenido/pagina.txt', 404), ('contenido/pagina.w480.png', 404)):
+            with self.subTest(nombre=nombre):
+                url = reverse('servir_contenido', args=[self.libro.id, nombre])
+                self.assertEqual(self.client.get(url).status_code, estado)
+
+    def test_range_y_if_none_match(self):
+        self.client.force_login(self.duenio)
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], f'bytes 100-199/{len(self.datos)}')
+        self.assertEqual(b''.join(respuesta.streaming_content), self.datos[100:200])
+
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(respuesta.streaming_content), self.datos[-10:])
+
+        respuesta = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.datos)}-')
+        self.assertEqual(respuesta.status_code, 416)
+
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_delegar_al_proxy(self):
+        self.client.force_login(self.duenio)
+        with override_settings(MEDIA_ENTREGA='x-accel-redirect', MEDIA_ACCEL_PREFIJO='/protegido/'):
+            respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta['X-Accel-Redirect'], '/protegido/contenido/libro.mp3')
+        self.assertEqual(respuesta.content, b'')
+
+    async def test_con_asgi_se_transmite_con_un_iterador_asincrono(self):
+        await self.async_client.aforce_login(self.duenio)
+        respuesta = await self.async_client.get(self.url, headers={'Range': 'bytes=100-70000'})
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertTrue(respuesta.is_async)
+        self.assertEqual(b''.join([bloque async for bloque in respuesta.streaming_content]), self.datos[100:])
+
+        respuesta = await self.async_client.get(reverse('leer_libro', args=[self.libro.id, 1]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'audio-libro')
+
+        await self.async_client.aforce_login(self.otro)
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 403)
+
+
+class CatalogoCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.genero = Genero.objects.create(nombre_genero='Ensayo')
+        cls.autor = Autor.objects.create(nombre_autor='C. S. Lewis')
+        for i in range(5):
+            libro = Libro.objects.create(titulo=f'Libro {i}', portada=f'portadas/{i}.png')
+            libro.autores.add(cls.autor)
+            libro.generos.add(cls.genero)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonimos_no_tocan_la_base_de_datos(self):
+        for url in (reverse('index'), reverse('bookstore'), f"{reverse('bookstore')}?genero_id={self.genero.id}", reverse('proximos')):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_cambios_en_el_catalogo_invalidan_la_cache(self):
+        url = reverse('bookstore')
+        self.client.get(url)
+        libro = Libro.objects.create(titulo='Recién llegado', portada='portadas/nuevo.png')
+        self.assertContains(self.client.get(url), 'Recién llegado')
+
+        otro_autor = Autor.objects.create(nombre_autor='Tolkien')
+        libro.autores.add(otro_autor)
+        self.assertContains(self.client.get(url), 'Tolkien')
+
+        otro_autor.nombre_autor = 'J. R. R. Tolkien'
+        otro_autor.save()
+        self.assertContains(self.client.get(url), 'J. R. R. Tolkien')
+
+        self.genero.delete()
+        self.assertNotContains(self.client.get(url), 'Ensayo')
+
+    @override_settings(TIENDA_POR_PAGINA=2)
+    def test_paginas_de_la_tienda(self):
+        url = reverse('bookstore')
+        titulos = []
+        pagina = url
+        while pagina:
+            respuesta = self.client.get(pagina)
+            titulos += [libro.titulo for libro in respuesta.context['libros']]
+            self.assertLessEqual(len(respuesta.context['libros']), 2)
+            pagina = url + f"?pagina={respuesta.context['pagina_siguiente']}" if respuesta.context['pagina_siguiente'] else None
+        self.assertEqual(titulos, [f'Libro {i}' for i in range(4, -1, -1)])
+
+        respuesta = self.client.get(url, {'pagina': 2, 'genero_id': self.genero.id})
+        self.assertContains(respuesta, f'href="?pagina=3&amp;genero_id={self.genero.id}"')
+        self.assertContains(respuesta, f'href="?pagina=1&amp;genero_id={self.genero.id}"')
+        # Cada página queda en la cache
+        with self.assertNumQueries(0):
+            self.client.get(url, {'pagina': 2, 'genero_id': self.genero.id})
+        self.assertEqual(self.client.get(url, {'pagina': 'x'}).context['pagina_anterior'], None)
+
+    @override_settings(TIENDA_POR_PAGINA=2)
+    def test_las_busquedas_se_paginan_y_no_se_cachean(self):
+        url = reverse('bookstore')
+        respuesta = self.client.get(url, {'q': 'libro', 'pagina': 3})
+        self.assertEqual(len(respuesta.context['libros']), 1)
+        self.assertIsNone(respuesta.context['pagina_siguiente'])
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url, {'q': 'libro', 'pagina': 3})
+        self.assertTrue(consultas)
+
+    def test_genero_invalido_muestra_todo(self):
+        respuesta = self.client.get(reverse('bookstore'), {'genero_id': 'abc'})
+        self.assertEqual(len(respuesta.context['libros']), 5)
+
+    def test_las_tarjetas_se_renderizan_una_vez_por_version_del_catalogo(self):
+        url = reverse('bookstore')
+        with mock.patch('tienda.templatetags.medios.url_miniatura', return_value='/m.webp') as miniaturas:
+            self.client.get(url)
+            self.assertEqual(miniaturas.call_count, 10)
+            self.client.get(url)
+            self.assertEqual(miniaturas.call_count, 10)
+
+            Libro.objects.filter(titulo='Libro 0').first().save()
+            self.client.get(url)
+            self.assertEqual(miniaturas.call_count, 20)
+
+    def test_lo_que_depende_del_usuario_o_del_filtro_no_sale_del_fragmento(self):
+        usuario = User.objects.create_user(username='fragmentos@booksbs.local')
+        BibliotecaUsuario.objects.create(usuario=usuario, libro=Libro.objects.get(titulo='Libro 3'))
+        self.client.get(reverse('bookstore'))
+
+        self.client.force_login(usuario)
+        self.assertContains(self.client.get(reverse('bookstore')), 'Ya lo tienes', count=1)
+        respuesta = self.client.get(reverse('bookstore'), {'genero_id': self.genero.id})
+        self.assertContains(respuesta, f'?genero_id={self.genero.id}" class="active"')
+
+
+class GetCondicionalTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='condicional@booksbs.local', password='x')
+        cls.autor = Autor.objects.create(nombre_autor='Autora')
+        cls.libro = Libro.objects.create(titulo='Condicional', portada='portadas/c.png', precio=50)
+        cls.libro.autores.add(cls.autor)
+        cls.otro = Libro.objects.create(titulo='Otro', portada='portadas/o.png', precio=60)
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidar(self, url):
+        """Pide la página y la vuelve a pedir con su ETag; devuelve (primera, segunda, consultas de la segunda)."""
+        primera = self.client.get(url)
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get(url, HTTP_IF_NONE_MATCH=primera['ETag'])
+        return primera, segunda, len(consultas)
+
+    def test_304_sin_renderizar(self):
+        for url in (reverse('bookstore'), reverse('index'), reverse('libro_detalle', args=[self.libro.id])):
+            with self.subTest(url=url):
+                primera, segunda, consultas = self.revalidar(url)
+                self.assertEqual(primera.status_code, 200)
+                self.assertIn('no-cache', primera['Cache-Control'])
+                self.assertEqual(segunda.status_code, 304)
+                self.assertFalse(segunda.content)
+                self.assertEqual(segunda['ETag'], primera['ETag'])
+                # Catálogo: ninguna consulta; ficha: solo la fecha del libro
+                self.assertEqual(consultas, 1 if 'libro' in url else 0)
+
+        url = reverse('bookstore')
+        ultima = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=ultima).status_code, 304)
+
+    def test_los_cambios_del_catalogo_cambian_el_etag(self):
+        url_libro = reverse('libro_detalle', args=[self.libro.id])
+        etag_bookstore = self.client.get(reverse('bookstore'))['ETag']
+        etag_libro = self.client.get(url_libro)['ETag']
+
+        # Otro libro: cambia el listado pero no esta ficha
+        self.otro.precio = 70
+        self.otro.save()
+        self.assertEqual(self.client.get(reverse('bookstore'), HTTP_IF_NONE_MATCH=etag_bookstore).status_code, 200)
+        self.assertEqual(self.client.get(url_libro, HTTP_IF_NONE_MATCH=etag_libro).status_code, 304)
+
+        # Renombrar a su autora sí cambia la ficha
+        self.autor.nombre_autor = 'Autora renombrada'
+        self.autor.save()
+        respuesta = self.client.get(url_libro, HTTP_IF_NONE_MATCH=etag_libro)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'Autora renombrada')
+
+    def test_una_ficha_guardada_no_conserva_un_token_csrf_viejo(self):
+        self.client = self.client_class(enforce_csrf_checks=True)
+        url = reverse('libro_detalle', args=[self.libro.id])
+
+        def entrar():
+            token = self.client.get(reverse('login')).context['csrf_token']
+            datos = {'email': 'condicional@booksbs.local', 'password': 'x', 'csrfmiddlewaretoken': token}
+            self.assertRedirects(self.client.post(reverse('login'), datos), reverse('mis_libros'), fetch_redirect_response=False)
+
+        entrar()
+        primera = self.client.get(url)
+        self.client.get(reverse('logout'))
+        entrar()
+        segunda = self.client.get(url, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(segunda.status_code, 200)
+        token = segunda.context['csrf_token']
+        respuesta = self.client.post(reverse('agregar_carrito', args=[self.libro.id]), {'csrfmiddlewaretoken': token})
+        self.assertEqual(respuesta.status_code, 302)
+
+    def test_la_parte_del_usuario_entra_en_el_validador(self):
+        url = reverse('libro_detalle', args=[self.libro.id])
+        etag_anonimo = self.client.get(url)['ETag']
+        self.client.force_login(self.usuario)
+        etag_usuario = self.client.get(url)['ETag']
+        self.assertNotEqual(etag_anonimo, etag_usuario)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag_usuario).status_code, 304)
+
+        # Al comprarlo cambia "Ya está en tu biblioteca"
+        with self.captureOnCommitCallbacks(execute=True):
+            comprar_libros(self.usuario, [self.libro.id])
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag_usuario)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.context['ya_adquirido'])
+
+    def test_sin_validador_para_libros_que_no_existen(self):
+        respuesta = self.client.get(reverse('libro_detalle', args=[9999]))
+        self.assertEqual(respuesta.status_code, 404)
+        self.assertFalse(respuesta.has_header('ETag'))
+
+
+class BusquedaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@booksbs.local', 'admin@booksbs.local', 'clave')
+        cls.fantasia = Genero.objects.create(nombre_genero='Fantasía')
+        cls.autor = Autor.objects.create(nombre_autor='Ursula K. Le Guin')
+        cls.terramar = Libro.objects.create(titulo='Un mago de Terramar', portada='portadas/t.png',
+                                            descripcion='Un joven aprende magia.')
+        cls.terramar.autores.add(cls.autor)
+        cls.terramar.generos.add(cls.fantasia)
+        cls.otro = Libro.objects.create(titulo='Cuentos', portada='portadas/c.png',
+                                        descripcion='Incluye un relato sobre un mago.')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_prefijos_ordenados_por_relevancia(self):
+        self.assertEqual(buscar_ids('mag'), [self.terramar.id, self.otro.id])
+        self.assertEqual(buscar_ids('mago terra'), [self.terramar.id])
+        self.assertEqual(buscar_ids('  '), [])
+
+    def test_ignora_acentos(self):
+        self.assertEqual(buscar_ids('fantasia'), [self.terramar.id])
+        self.assertEqual(buscar_ids('TÉRRAMAR'), [self.terramar.id])
+
+    def test_el_indice_sigue_a_los_cambios(self):
+        self.autor.nombre_autor = 'Ursula Kroeber'
+        self.autor.save()
+        self.assertEqual(buscar_ids('kroeber'), [self.terramar.id])
+        self.assertEqual(buscar_ids('guin'), [])
+
+        ciencia = Genero.objects.create(nombre_genero='Ciencia ficción')
+        self.otro.generos.add(ciencia)
+        self.assertEqual(buscar_ids('ciencia'), [self.otro.id])
+        ciencia.delete()
+        self.assertEqual(buscar_ids('ciencia'), [])
+
+        self.autor.libros.clear()
+        self.assertEqual(buscar_ids('kroeber'), [])
+
+        self.terramar.delete()
+        self.assertEqual(buscar_ids('mago'), [self.otro.id])
+
+    def test_busqueda_en_dashboard_y_tienda(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('dash_ver_libros'), {'q': 'le guin'})
+        self.assertEqual([libro.id for libro in respuesta.context['libros']], [self.terramar.id])
+        respuesta = self.client.get(reverse('dash_ver_libros'), {'q': 'Disponible'})
+        self.assertEqual(len(respuesta.context['libros']), 2)
+
+        respuesta = self.client.get(reverse('bookstore'), {'q': 'mago'})
+        self.assertEqual([libro.id for libro in respuesta.context['libros']], [self.terramar.id, self.otro.id])
+        respuesta = self.client.get(reverse('bookstore'), {'q': 'mago', 'genero_id': self.fantasia.id})
+        self.assertEqual([libro.id for libro in respuesta.context['libros']], [self.terramar.id])
+
+    def test_el_dashboard_pagina_en_orden_de_relevancia(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('dash_ver_libros'), {'q': 'mag', 'por_pagina': 1})
+        self.assertEqual([libro.id for libro in respuesta.context['libros']], [self.terramar.id])
+        self.assertIsNone(respuesta.context['paginacion']['url_anterior'])
+        respuesta = self.client.get(reverse('dash_ver_libros') + respuesta.context['paginacion']['url_siguiente'])
+        self.assertEqual([libro.id for libro in respuesta.context['libros']], [self.otro.id])
+        self.assertIsNone(respuesta.context['paginacion']['url_siguiente'])
+        respuesta = self.client.get(reverse('dash_ver_libros') + respuesta.context['paginacion']['url_anterior'])
+        self.assertEqual([libro.id for libro in respuesta.context['libros']], [self.terramar.id])
+
+    def test_la_tienda_filtra_antes_de_ordenar(self):
+        # Más de 200 coincidencias mejores que no están a la venta
+        Libro.objects.bulk_create(
+            Libro(titulo=f'Mago mago {i}', portada='portadas/m.png', estado_publicacion='proximamente') for i in range(250)
+        )
+        reconstruir_indice()
+        respuesta = self.client.get(reverse('bookstore'), {'q': 'mago'})
+        self.assertEqual([libro.id for libro in respuesta.context['libros']], [self.terramar.id, self.otro.id])
+        self.assertEqual(len(buscar_ids('mago', limite=None)), 252)
+
+
+class PaginacionDashboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@booksbs.local', 'admin@booksbs.local', 'clave')
+        # fecha_pedido es auto_now_add; se reparte después, con pares de fechas repetidas
+        for i in range(11):
+            pedido = Pedido.objects.create(usuario=cls.admin, total_pagado=10)
+            Pedido.objects.filter(pk=pedido.pk).update(fecha_pedido=timezone.now() - datetime.timedelta(days=i // 2))
+        Autor.objects.bulk_create(Autor(nombre_autor=f'Autor {letra}') for letra in 'edcbagf')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def recorrer(self, nombre_url, clave, **parametros):
+        paginas = []
+        respuesta = self.client.get(reverse(nombre_url), parametros)
+        while True:
+            paginas.append(list(respuesta.context[clave]))
+            siguiente = respuesta.context['paginacion']['url_siguiente']
+            if not siguiente:
+                return paginas, respuesta
+            respuesta = self.client.get(reverse(nombre_url) + siguiente)
+
+    def test_recorre_pedidos_sin_repetir_ni_saltar(self):
+        paginas, ultima = self.recorrer('dash_ver_pedidos', 'pedidos', por_pagina=3)
+        self.assertEqual([len(pagina) for pagina in paginas], [3, 3, 3, 2])
+        vistos = [pedido for pagina in paginas for pedido in pagina]
+        esperados = sorted(Pedido.objects.all(), key=lambda p: (p.fecha_pedido, p.id), reverse=True)
+        self.assertEqual(vistos, esperados)
+
+        anterior = self.client.get(reverse('dash_ver_pedidos') + ultima.context['paginacion']['url_anterior'])
+        self.assertEqual(list(anterior.context['pedidos']), paginas[-2])
+
+    def test_autores_por_nombre_y_busqueda(self):
+        paginas, _ = self.recorrer('dash_ver_autores', 'autores', por_pagina=4)
+        self.assertEqual([a.nombre_autor for pagina in paginas for a in pagina],
+                         [f'Autor {letra}' for letra in 'abcdefg'])
+        respuesta = self.client.get(reverse('dash_ver_autores'), {'q': 'autor', 'por_pagina': 4})
+        self.assertIn('q=autor', respuesta.context['paginacion']['url_siguiente'])
+
+    def test_pagina_profunda_cuesta_lo_mismo(self):
+        _, ultima = self.recorrer('dash_ver_pedidos', 'pedidos', por_pagina=2)
+        url = reverse('dash_ver_pedidos') + ultima.context['paginacion']['url_anterior']
+        with CaptureQueriesContext(connection) as profunda:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as primera:
+            self.client.get(reverse('dash_ver_pedidos'), {'por_pagina': 2})
+        self.assertEqual(len(profunda), len(primera))
+        self.assertNotIn('OFFSET', profunda[-1]['sql'])
+
+    def test_cursor_invalido_vuelve_al_inicio(self):
+        respuesta = self.client.get(reverse('dash_ver_pedidos'), {'despues': 'basura', 'por_pagina': 'x'})
+        self.assertEqual(len(respuesta.context['pedidos']), 11)
+        self.assertIsNone(respuesta.context['paginacion']['url_anterior'])
+
+
+class VentasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@booksbs.local', 'admin@booksbs.local', 'clave')
+        cls.usuario = User.objects.create_user('lector@booksbs.local', 'lector@booksbs.local', 'clave')
+        cls.terror = Genero.objects.create(nombre_genero='Terror')
+        cls.clasico = Genero.objects.create(nombre_genero='Clásico')
+        cls.libro = Libro.objects.create(titulo='Drácula', portada='portadas/d.png', precio=Decimal('120.00'))
+        cls.libro.generos.add(cls.terror, cls.clasico)
+        cls.audio = Libro.objects.create(titulo='Carmilla', portada='portadas/c.png', precio=Decimal('80.00'),
+                                         formato='audiobook')
+        cls.audio.generos.add(cls.terror)
+
+    def comprar_a_mano(self, libro, dias_atras=0):
+        """Pedido histórico, creado sin pasar por procesar_compra."""
+        pedido = Pedido.objects.create(usuario=self.usuario, total_pagado=libro.precio, estado_pago='completado')
+        Pedido.objects.filter(pk=pedido.pk).update(fecha_pedido=timezone.now() - datetime.timedelta(days=dias_atras))
+        DetallePedido.objects.create(pedido=pedido, libro=libro, precio_compra=libro.precio)
+
+    def test_la_compra_suma_a_los_resumenes(self):
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('procesar_compra', args=[self.libro.id]))
+        hoy = timezone.localdate()
+        self.assertEqual(VentaDiariaLibro.objects.get(fecha=hoy, libro=self.libro).ingresos, Decimal('120.00'))
+        self.assertEqual(VentaDiariaFormato.objects.get(fecha=hoy, formato='ebook').unidades, 1)
+        self.assertEqual(VentaDiariaGenero.objects.filter(fecha=hoy).count(), 2)
+        self.assertEqual(acumular_pendientes(), 0)
+
+    def test_acumular_pendientes_es_incremental(self):
+        self.comprar_a_mano(self.libro, dias_atras=3)
+        self.comprar_a_mano(self.audio, dias_atras=3)
+        self.assertEqual(acumular_pendientes(lote=1), 2)
+        self.comprar_a_mano(self.audio, dias_atras=3)
+        self.assertEqual(acumular_pendientes(), 1)
+        self.assertEqual(acumular_pendientes(), 0)
+
+        fecha = timezone.localdate() - datetime.timedelta(days=3)
+        terror = VentaDiariaGenero.objects.get(fecha=fecha, genero=self.terror)
+        self.assertEqual((terror.unidades, terror.ingresos), (3, Decimal('280.00')))
+        self.assertEqual(VentaDiariaFormato.objects.get(fecha=fecha, formato='audiobook').unidades, 2)
+
+    def test_panel_de_ventas_solo_lee_resumenes(self):
+        for dias in (0, 1, 40, 200):
+            self.comprar_a_mano(self.libro, dias_atras=dias)
+        acumular_pendientes()
+        self.client.force_login(self.admin)
+        desde = (timezone.localdate() - datetime.timedelta(days=365)).isoformat()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('dash_ventas'), {'desde': desde})
+        self.assertFalse(any('tienda_pedido' in c['sql'] or 'tienda_detallepedido' in c['sql'] for c in consultas))
+        self.assertEqual(respuesta.context['total_unidades'], 4)
+        self.assertEqual(respuesta.context['agrupacion'], 'semana')
+        self.assertEqual(respuesta.context['top_libros'][0]['ingresos'], Decimal('480.00'))
+
+        respuesta = self.client.get(reverse('dash_ventas'))
+        self.assertEqual(len(respuesta.context['serie']), 30)
+        self.assertEqual(respuesta.context['total_unidades'], 2)
+
+    def test_rangos_en_los_extremos_del_calendario(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('dash_ventas'), {'hasta': '0001-01-05'})
+        self.assertEqual((respuesta.context['desde'], len(respuesta.context['serie'])), (datetime.date.min, 5))
+
+        respuesta = self.client.get(reverse('dash_ventas'), {'desde': '0001-01-01', 'hasta': '9999-12-31'})
+        self.assertEqual(respuesta.context['hasta'], datetime.date.max)
+        self.assertEqual(respuesta.context['desde'], datetime.date(9989, 12, 24))
+        self.assertEqual(respuesta.context['agrupacion'], 'mes')
+        self.assertEqual(len(respuesta.context['serie']), 121)
+
+        respuesta = self.client.get(reverse('dash_ventas'), {'desde': '9999-12-20', 'hasta': '9999-12-31'})
+        self.assertEqual(len(respuesta.context['serie']), 12)
+
+    def test_borrar_un_libro_no_borra_sus_ventas(self):
+        self.comprar_a_mano(self.libro, dias_atras=1)
+        acumular_pendientes()
+        self.libro.delete()
+        venta = VentaDiariaLibro.objects.get()
+        self.assertIsNone(venta.libro_id)
+        self.assertEqual(venta.ingresos, Decimal('120.00'))
+
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('dash_ventas'))
+        self.assertEqual(respuesta.context['total_unidades'], 1)
+        self.assertContains(respuesta, 'Libros borrados')
+
+
+class BusquedaPedidosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@booksbs.local', 'admin@booksbs.local', 'clave')
+        cls.ana = User.objects.create_user('ana@booksbs.local', 'ana@booksbs.local', 'clave')
+        cls.beto = User.objects.create_user('beto@booksbs.local', 'beto@booksbs.local', 'clave')
+        cls.pedidos = {}
+        for nombre, usuario, fecha, total, estado in (
+            ('ana_oct', cls.ana, '2025-10-31 23:30', '50.00', 'completado'),
+            ('ana_nov', cls.ana, '2025-11-01 00:10', '150.00', 'completado'),
+            ('beto_nov', cls.beto, '2025-11-15 12:00', '99.99', 'fallido'),
+            ('beto_dic', cls.beto, '2025-12-01 09:00', '300.00', 'completado'),
+        ):
+            pedido = Pedido.objects.create(usuario=usuario, total_pagado=Decimal(total), estado_pago=estado)
+            fecha = timezone.make_aware(datetime.datetime.fromisoformat(fecha))
+            Pedido.objects.filter(pk=pedido.pk).update(fecha_pedido=fecha)
+            cls.pedidos[nombre] = pedido.pk
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def buscar(self, texto):
+        respuesta = self.client.get(reverse('dash_ver_pedidos'), {'q': texto})
+        encontrados = {nombre for nombre, pk in self.pedidos.items() if pk in {p.pk for p in respuesta.context['pedidos']}}
+        return encontrados, respuesta.context['errores_busqueda']
+
+    def test_terminos_estructurados(self):
+        self.assertEqual(self.buscar('fecha:2025-11-01..2025-11-30')[0], {'ana_nov', 'beto_nov'})
+        self.assertEqual(self.buscar('fecha:2025-11')[0], {'ana_nov', 'beto_nov'})
+        self.assertEqual(self.buscar('fecha>2025-11-15')[0], {'beto_dic'})
+        self.assertEqual(self.buscar('estado:fallido')[0], {'beto_nov'})
+        self.assertEqual(self.buscar('email:ana total>=100')[0], {'ana_nov'})
+        self.assertEqual(self.buscar('total:99..200')[0], {'ana_nov', 'beto_nov'})
+        self.assertEqual(self.buscar(f"id:{self.pedidos['beto_dic']}")[0], {'beto_dic'})
+        self.assertEqual(self.buscar('beto@booksbs.local Completado')[0], {'beto_dic'})
+
+    def test_terminos_invalidos_se_informan(self):
+        encontrados, errores = self.buscar('fecha:2025-13-01 estado:perdido color:azul email:ana')
+        self.assertEqual(encontrados, {'ana_oct', 'ana_nov'})
+        self.assertEqual(len(errores), 3)
+
+    def test_valores_fuera_de_rango_se_informan(self):
+        for texto in ('fecha:9999-12-31', 'fecha:9999-12', 'fecha>9999-12-31', 'fecha:2025-11..9999-12',
+                      'total>NaN', 'total:sNaN', 'total<=Infinity', 'total:-inf..100'):
+            with self.subTest(texto=texto):
+                encontrados, errores = self.buscar(texto)
+                self.assertEqual(len(errores), 1)
+                self.assertEqual(encontrados, set(self.pedidos))
+
+    def test_filtros_sin_like_ni_fechas_como_texto(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.buscar('fecha:2025-11 email:an estado:completado')
+        sql = consultas[-1]['sql']
+        self.assertNotIn('LIKE', sql)
+        self.assertNotIn('django_datetime_cast', sql)
+        self.assertIn('INNER JOIN "auth_user"', sql)
+
+
+class CarritoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('lector@booksbs.local', 'lector@booksbs.local', 'clave')
+        cls.libros = Libro.objects.bulk_create(
+            Libro(titulo=f'Libro {i}', portada=f'portadas/{i}.png', precio=Decimal('10.50') + i) for i in range(12)
+        )
+        BibliotecaUsuario.objects.create(usuario=cls.usuario, libro=cls.libros[0])
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def llenar_carrito(self, libros):
+        for libro in libros:
+            self.client.post(reverse('agregar_carrito', args=[libro.id]))
+
+    def test_pagar_carrito_crea_un_solo_pedido(self):
+        self.llenar_carrito(self.libros[:3])
+        self.client.post(reverse('quitar_carrito', args=[self.libros[2].id]))
+        respuesta = self.client.get(reverse('carrito'))
+        # El libro que ya tenía desaparece del carrito
+        self.assertEqual([libro.id for libro in respuesta.context['libros']], [self.libros[1].id])
+
+        self.llenar_carrito(self.libros[2:5])
+        self.client.post(reverse('procesar_carrito'))
+        pedido = Pedido.objects.get()
+        self.assertEqual(pedido.total_pagado, Decimal('11.50') + Decimal('12.50') + Decimal('13.50') + Decimal('14.50'))
+        self.assertEqual(pedido.detalles.count(), 4)
+        self.assertEqual(BibliotecaUsuario.objects.filter(usuario=self.usuario).count(), 5)
+        self.assertEqual(self.client.session.get('carrito'), None)
+        self.assertEqual(VentaDiariaFormato.objects.get().unidades, 4)
+
+    def test_el_pago_no_crece_con_el_carrito(self):
+        # Una primera compra deja creados los resúmenes de ventas del día
+        self.llenar_carrito(self.libros[1:2])
+        self.client.post(reverse('procesar_carrito'))
+        self.llenar_carrito(self.libros[2:4])
+        with CaptureQueriesContext(connection) as pocos:
+            self.client.post(reverse('procesar_carrito'))
+        self.llenar_carrito(self.libros[4:12])
+        with CaptureQueriesContext(connection) as muchos:
+            self.client.post(reverse('procesar_carrito'))
+        self.assertEqual(len(pocos), len(muchos))
+        self.assertEqual(Pedido.objects.count(), 3)
+
+    def test_carrito_con_libros_ya_comprados(self):
+        self.llenar_carrito(self.libros[:1])
+        self.client.post(reverse('procesar_carrito'))
+        self.assertFalse(Pedido.objects.exists())
+
+
+class CompraIdempotenteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('lector@booksbs.local', 'lector@booksbs.local', 'clave')
+        cls.libro = Libro.objects.create(titulo='Rayuela', portada='portadas/r.png', precio=Decimal('199.00'))
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_reintento_con_la_misma_clave(self):
+        datos = {'clave_idempotencia': 'abc123'}
+        for _ in range(3):
+            respuesta = self.client.post(reverse('procesar_compra', args=[self.libro.id]), datos, follow=True)
+            self.assertContains(respuesta, 'Compra exitosa')
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_otra_clave_no_vuelve_a_cobrar(self):
+        self.client.post(reverse('procesar_compra', args=[self.libro.id]), {'clave_idempotencia': 'uno'})
+        respuesta = self.client.post(reverse('procesar_compra', args=[self.libro.id]), {'clave_idempotencia': 'dos'}, follow=True)
+        self.assertContains(respuesta, 'Ya has comprado este libro.')
+        self.assertEqual(Pedido.objects.get().total_pagado, Decimal('199.00'))
+
+    def test_un_libro_que_no_esta_a_la_venta(self):
+        self.libro.estado_publicacion = 'proximamente'
+        self.libro.save()
+        respuesta = self.client.post(reverse('procesar_compra', args=[self.libro.id]), follow=True)
+        self.assertContains(respuesta, "&#x27;Rayuela&#x27; no está a la venta.")
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(BibliotecaUsuario.objects.exists())
+
+    def test_fila_insertada_por_otra_peticion(self):
+        # Simula la carrera: la comprobación previa no ve la fila, pero el
+        # INSERT choca con la que otra petición acaba de guardar
+        with mock.patch('tienda.compras.Exists', return_value=Value(False)):
+            BibliotecaUsuario.objects.create(usuario=self.usuario, libro=self.libro)
+            pedido, comprados, ya_tenia = comprar_libros(self.usuario, [self.libro.id])
+        self.assertIsNone(pedido)
+        self.assertEqual(ya_tenia, [self.libro.id])
+        self.assertFalse(Pedido.objects.exists())
+
+
+class CompraConcurrenteTests(TransactionTestCase):
+    """Cientos de compras en paralelo: exactamente un pedido por usuario y libro."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite en memoria compartida no espera a los bloqueos; usa DATABASES TEST NAME')
+
+    def test_compras_en_paralelo(self):
+        usuarios = [User.objects.create_user(f'u{i}@booksbs.local', f'u{i}@booksbs.local') for i in range(10)]
+        libros = Libro.objects.bulk_create(
+            Libro(titulo=f'Libro {i}', portada=f'portadas/{i}.png', precio=Decimal('10.00') + i) for i in range(5)
+        )
+        intentos = [
+            (usuario, libro, f'{usuario.id}-{libro.id}-{i % 2}' if i % 3 else None)
+            for usuario in usuarios for libro in libros for i in range(4)
+        ]
+        random.Random(7).shuffle(intentos)
+
+        def comprar(intento):
+            usuario, libro, clave = intento
+            try:
+                return comprar_libros(usuario, [libro.id], clave=clave)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as ejecutor:
+            resultados = list(ejecutor.map(comprar, intentos))
+
+        self.assertEqual(len(resultados), 200)
+        pares = list(DetallePedido.objects.values_list('pedido__usuario_id', 'libro_id'))
+        self.assertEqual(len(pares), len(usuarios) * len(libros))
+        self.assertEqual(len(set(pares)), len(pares))
+        self.assertEqual(Pedido.objects.count(), len(pares))
+        self.assertEqual(BibliotecaUsuario.objects.count(), len(pares))
+        self.assertEqual(VentaDiariaFormato.objects.get().unidades, len(pares))
+        for pedido in Pedido.objects.prefetch_related('detalles'):
+            self.assertEqual(pedido.total_pagado, sum(d.precio_compra for d in pedido.detalles.all()))
+
+
+class EstaticosTests(TestCase):
+
+    def setUp(self):
+        base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base)
+        # Un archivo que existe justo fuera de STATIC_ROOT
+        with open(os.path.join(base, 'settings.py'), 'w') as f:
+            f.write("SECRET_KEY = 'secreto'\n")
+        self.raiz = os.path.join(base, 'staticfiles')
+        ajustes = override_settings(STATIC_ROOT=self.raiz, STORAGES={
+            **settings.STORAGES, 'staticfiles': {'BACKEND': 'tienda.estaticos.AlmacenEstaticos'},
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def pedir(self, ruta, codificacion=''):
+        request = RequestFactory().get('/static/' + ruta, HTTP_ACCEPT_ENCODING=codificacion)
+        return servir_estatico(request, ruta)
+
+    def test_nombres_con_hash_y_variantes_comprimidas(self):
+        url = Template('{% load static %}{% static "css/style.css" %}').render(Context())
+        ruta = url.removeprefix(settings.STATIC_URL)
+        self.assertRegex(ruta, r'^css/style\.[0-9a-f]{12}\.css$')
+        self.assertTrue(os.path.exists(os.path.join(self.raiz, ruta + '.gz')))
+        # Las imágenes no se comprimen
+        self.assertFalse([nombre for nombre in os.listdir(os.path.join(self.raiz, 'images')) if nombre.endswith('.gz')])
+
+        respuesta = self.pedir(ruta, 'gzip, deflate')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(respuesta['Content-Type'], 'text/css')
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', respuesta['Vary'])
+        with open(os.path.join(self.raiz, ruta), 'rb') as f:
+            self.assertEqual(gzip.decompress(b''.join(respuesta.streaming_content)), f.read())
+
+        respuesta = self.pedir(ruta)
+        self.assertFalse(respuesta.has_header('Content-Encoding'))
+
+    def test_nombres_sin_hash_no_son_inmutables(self):
+        self.assertEqual(self.pedir('css/style.css', 'gzip')['Cache-Control'], 'public, max-age=300')
+
+    def test_no_se_sale_de_static_root(self):
+        for ruta in ('../settings.py', 'css/../../settings.py', '/etc/passwd', 'css/./style.css'):
+            with self.subTest(ruta=ruta), self.assertRaises(Http404):
+                self.pedir(ruta)
+
+
+class PerfilBaseDeDatosTests(TestCase):
+
+    def pragma(self, nombre):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {nombre}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_de_sqlite(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Solo SQLite')
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), settings.DB_ESPERA * 1000)
+
+
+@override_settings(DB_REPLICAS=['replica_1'], PROGRESO_INTERVALO=0)
+class ReplicasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='replica@booksbs.local', password='x')
+        cls.libro = Libro.objects.create(titulo='Replicado', portada='portadas/r.png', estado_publicacion='disponible')
+
+    def setUp(self):
+        cache.clear()
+
+    def base_para_lectura(self, sesion):
+        """Ejecuta una vista marcada y devuelve a qué base irían sus lecturas."""
+        destinos = {}
+
+        @lectura_en_replica
+        def vista(request):
+            destinos['libro'] = router.db_for_read(Libro)
+            destinos['usuario'] = router.db_for_read(User)
+            en_cache_catalogo('prueba_replica', construir=lambda: destinos.setdefault('cache', router.db_for_read(Libro)))
+
+        request = RequestFactory().get('/')
+        request.session = sesion
+        vista(request)
+        return destinos
+
+    def test_la_tienda_lee_de_la_replica(self):
+        destinos = self.base_para_lectura({})
+        self.assertEqual(destinos['libro'], 'replica_1')
+        # Usuarios y sesiones siempre de la primaria, igual que lo que se cachea
+        self.assertEqual(destinos['usuario'], 'default')
+        self.assertEqual(destinos['cache'], 'default')
+        # Fuera de las vistas marcadas, y en las escrituras, la primaria
+        self.assertEqual(router.db_for_read(Libro), 'default')
+        self.assertEqual(router.db_for_write(Libro), 'default')
+
+    def test_una_sesion_que_escribe_queda_en_la_primaria(self):
+        self.client.force_login(self.usuario)
+        self.client.get(reverse('carrito'))
+        self.assertNotIn(replicas.CLAVE_SESION, self.client.session)
+        self.client.post(reverse('agregar_carrito', args=[self.libro.id]))
+        self.assertTrue(self.client.session[replicas.CLAVE_SESION])
+        self.assertEqual(self.base_para_lectura(self.client.session)['libro'], 'default')
+
+    def bases_del_lector(self):
+        """Pide una página del lector y devuelve a qué bases irían sus lecturas de libros."""
+        destinos = []
+        original = replicas.RouterReplicas.db_for_read
+
+        def espia(router, model, **hints):
+            if model is Libro:
+                destinos.append(original(router, model, **hints))
+            # En las pruebas no hay réplica de verdad: se lee de la primaria
+            return None
+
+        with mock.patch.object(replicas.RouterReplicas, 'db_for_read', espia):
+            self.assertEqual(self.client.get(reverse('leer_libro', args=[self.libro.id, 1])).status_code, 200)
+        return set(destinos)
+
+    def test_iniciar_sesion_no_fija_la_primaria(self):
+        BibliotecaUsuario.objects.create(usuario=self.usuario, libro=self.libro)
+        self.client.post(reverse('login'), {'email': 'replica@booksbs.local', 'password': 'x'})
+        self.assertNotIn(replicas.CLAVE_SESION, self.client.session)
+        self.assertEqual(self.bases_del_lector(), {'replica_1'})
+
+    def test_la_primaria_se_fija_solo_un_rato(self):
+        BibliotecaUsuario.objects.create(usuario=self.usuario, libro=self.libro)
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('agregar_carrito', args=[self.libro.id]))
+        self.assertEqual(self.bases_del_lector(), {None})
+        with mock.patch('tienda.replicas.time.time', return_value=time.time() + settings.DB_PRIMARIA_TRAS_ESCRITURA + 1):
+            self.assertEqual(self.bases_del_lector(), {'replica_1'})
+
+    @override_settings(DB_REPLICAS=[])
+    def test_sin_replicas_no_se_toca_la_sesion(self):
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('agregar_carrito', args=[self.libro.id]))
+        self.assertNotIn(replicas.CLAVE_SESION, self.client.session)
+        self.assertEqual(self.base_para_lectura({})['libro'], 'default')
+
+
+@override_settings(SESSION_ENGINE='tienda.sesiones', DB_REPLICAS=['default'])
+class SesionesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='sesion@booksbs.local', password='x')
+
+    def cookie(self):
+        return self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def sesion_anonima(self, **datos):
+        sesion = SessionStore()
+        sesion.update(datos)
+        sesion.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = sesion.session_key
+
+    def test_un_anonimo_no_toca_la_tabla_de_sesiones(self):
+        self.sesion_anonima(visitas=1)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(reverse('login'), {'email': 'sesion@booksbs.local', 'password': 'mal'})
+            self.client.get(reverse('login'))
+        self.assertContains(respuesta, 'Correo o contraseña incorrectos.')
+        self.assertFalse([c['sql'] for c in consultas if 'django_session' in c['sql']])
+        self.assertIn(':', self.cookie())
+        self.assertEqual(self.client.session['visitas'], 1)
+        # Un login fallido no fija la primaria
+        self.assertNotIn(replicas.CLAVE_SESION, self.client.session)
+        self.assertFalse(Session.objects.exists())
+
+    def test_al_iniciar_sesion_pasa_a_la_base_y_al_cerrarla_se_borra(self):
+        self.sesion_anonima(visitas=1)
+        self.client.post(reverse('login'), {'email': 'sesion@booksbs.local', 'password': 'x'})
+        sesion = Session.objects.get()
+        self.assertEqual(self.cookie(), sesion.session_key)
+        # Conserva lo que tenía como anónimo
+        self.assertEqual(self.client.session['visitas'], 1)
+        self.assertEqual(self.client.get(reverse('mis_libros')).status_code, 200)
+
+        self.client.get(reverse('logout'))
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(self.client.get(reverse('mis_libros')).status_code, 302)
+
+    def test_una_cookie_alterada_empieza_una_sesion_nueva(self):
+        self.sesion_anonima(visitas=1)
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = self.cookie()[:-2] + 'xx'
+        self.assertNotIn('visitas', self.client.session)
+        self.assertEqual(self.client.get(reverse('index')).status_code, 200)
+
+    def test_una_cookie_caducada_empieza_una_sesion_nueva(self):
+        self.sesion_anonima(visitas=1)
+        despues = time.time() + settings.SESSION_COOKIE_AGE + 1
+        with mock.patch('django.core.signing.time.time', return_value=despues):
+            self.assertNotIn('visitas', self.client.session)
+
+
+@override_settings(PROGRESO_INTERVALO=0)
+class ProgresoLecturaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='progreso@booksbs.local', password='x')
+        cls.ebook = Libro.objects.create(titulo='Ebook', portada='portadas/e.png', formato='ebook')
+        cls.audiobook = Libro.objects.create(titulo='Audiobook', portada='portadas/a.png', formato='audiobook')
+        ContenidoLibro.objects.bulk_create(
+            ContenidoLibro(libro=cls.ebook, tipo_contenido='imagen', orden=i, archivo=f'contenido/e_{i}.png')
+            for i in range(1, 31)
+        )
+        ContenidoLibro.objects.create(libro=cls.audiobook, tipo_contenido='audio', orden=1, archivo='contenido/a.mp3')
+        BibliotecaUsuario.objects.bulk_create([
+            BibliotecaUsuario(usuario=cls.usuario, libro=cls.ebook),
+            BibliotecaUsuario(usuario=cls.usuario, libro=cls.audiobook),
+        ])
+
+    def setUp(self):
+        cache.clear()
+        progreso.pendientes.clear()
+        self.client.force_login(self.usuario)
+
+    def entrada(self, libro):
+        return BibliotecaUsuario.objects.get(usuario=self.usuario, libro=libro)
+
+    def test_pasar_paginas_no_escribe_hasta_guardar(self):
+        self.client.get(reverse('leer_libro', args=[self.ebook.id, 1]))
+        with CaptureQueriesContext(connection) as consultas:
+            for pagina in range(2, 13):
+                self.client.get(reverse('leer_libro', args=[self.ebook.id, pagina]))
+        self.assertFalse([c['sql'] for c in consultas if c['sql'].startswith('UPDATE')])
+        self.assertEqual(self.entrada(self.ebook).ultima_pagina, 1)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(progreso.guardar_pendientes(), 1)
+        self.assertEqual(len([c for c in consultas if c['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(self.entrada(self.ebook).ultima_pagina, 12)
+        self.assertEqual(progreso.guardar_pendientes(), 0)
+
+    def test_mis_libros_enlaza_a_la_ultima_pagina(self):
+        self.client.get(reverse('leer_libro', args=[self.ebook.id, 7]))
+        url = reverse('leer_libro', args=[self.ebook.id, 7])
+        # Antes de guardar se ve lo pendiente de este proceso, y después lo guardado
+        self.assertContains(self.client.get(reverse('mis_libros')), f'href="{url}"')
+        progreso.guardar_pendientes()
+        self.assertContains(self.client.get(reverse('mis_libros')), f'href="{url}"')
+
+    def test_posicion_del_audiobook(self):
+        url = reverse('guardar_progreso', args=[self.audiobook.id])
+        self.assertEqual(self.client.post(url, {'segundos': '95.4'}).status_code, 204)
+        self.assertEqual(self.client.get(reverse('leer_libro', args=[self.audiobook.id, 1])).context['posicion_audio'], 95)
+        progreso.guardar_pendientes()
+        self.assertEqual(self.entrada(self.audiobook).posicion_audio, 95)
+        self.assertEqual(self.client.post(url, {'segundos': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+    def test_solo_se_registra_lo_propio(self):
+        ajeno = Libro.objects.create(titulo='Ajeno', portada='portadas/x.png', formato='audiobook')
+        self.assertEqual(self.client.post(reverse('guardar_progreso', args=[ajeno.id]), {'segundos': 10}).status_code, 403)
+        self.assertEqual(progreso.pendientes, {})
+
+    def test_no_se_pisa_un_progreso_mas_reciente(self):
+        progreso.registrar_progreso(self.usuario.id, self.ebook.id, pagina=5)
+        BibliotecaUsuario.objects.filter(usuario=self.usuario, libro=self.ebook).update(
+            ultima_pagina=9, progreso_actualizado=timezone.now() + datetime.timedelta(minutes=1),
+        )
+        self.assertEqual(progreso.guardar_pendientes(), 0)
+        self.assertEqual(self.entrada(self.ebook).ultima_pagina, 9)
+
+    @override_settings(PROGRESO_LOTE=2)
+    def test_se_guarda_al_llenarse_el_lote(self):
+        progreso.registrar_progreso(self.usuario.id, self.ebook.id, pagina=3)
+        self.assertEqual(self.entrada(self.ebook).ultima_pagina, 1)
+        progreso.registrar_progreso(self.usuario.id, self.audiobook.id, segundos=30)
+        self.assertEqual(self.entrada(self.ebook).ultima_pagina, 3)
+        self.assertEqual(self.entrada(self.audiobook).posicion_audio, 30)
+        self.assertEqual(progreso.pendientes, {})
+
+
+@override_settings(PROGRESO_INTERVALO=0)
+class ConteoConsultasTests(TestCase):
+    """
+    Número exacto de consultas por vista con un catálogo grande. Si una
+    plantilla vuelve a consultar relaciones dentro de un ciclo, el conteo
+    crece con el catálogo y esta prueba falla.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='lectora@booksbs.local', email='lectora@booksbs.local')
+        cls.admin = User.objects.create_superuser(username='admin@booksbs.local', email='admin@booksbs.local')
+        autores = Autor.objects.bulk_create(Autor(nombre_autor=f'Autor {i}') for i in range(12))
+        generos = Genero.objects.bulk_create(Genero(nombre_genero=f'Género {i}') for i in range(6))
+        libros = Libro.objects.bulk_create(
+            Libro(
+                titulo=f'Libro {i}',
+                portada=f'portadas/{i}.png',
+                precio=100 + i,
+                formato='audiobook' if i % 5 == 0 else 'ebook',
+                estado_publicacion='proximamente' if i % 6 == 0 else 'disponible',
+            )
+            for i in range(60)
+        )
+        Libro.autores.through.objects.bulk_create(
+            Libro.autores.through(libro=libro, autor=autores[(i + j) % 12])
+            for i, libro in enumerate(libros) for j in range(2)
+        )
+        Libro.generos.through.objects.bulk_create(
+            Libro.generos.through(libro=libro, genero=generos[i % 6]) for i, libro in enumerate(libros)
+        )
+        cls.propios = [libro for libro in libros if libro.estado_publicacion == 'disponible'][:20]
+        BibliotecaUsuario.objects.bulk_create(BibliotecaUsuario(usuario=cls.usuario, libro=libro) for libro in cls.propios)
+        for libro in cls.propios:
+            pedido = Pedido.objects.create(usuario=cls.usuario, total_pagado=libro.precio, estado_pago='completado')
+            DetallePedido.objects.create(pedido=pedido, libro=libro, precio_compra=libro.precio)
+        cls.libro_nuevo = next(libro for libro in libros if libro.estado_publicacion == 'disponible' and libro not in cls.propios)
+        cls.proximo = next(libro for libro in libros if libro.estado_publicacion == 'proximamente')
+        cls.autor = autores[0]
+        cls.genero = generos[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def assertConsultas(self, esperadas, nombre_url, *args, usuario=None, metodo='get', datos=None, misma_sesion=False):
+        # misma_sesion: sigue con la sesión de la petición anterior (el carrito vive en ella)
+        if misma_sesion:
+            pass
+        elif usuario:
+            self.client.force_login(usuario)
+        else:
+            self.client.logout()
+        cache.clear()
+        url = reverse(nombre_url, args=args)
+        with self.subTest(url=url):
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = getattr(self.client, metodo)(url, datos or {})
+            self.assertLess(respuesta.status_code, 400)
+            self.assertEqual(
+                len(consultas), esperadas,
+                f'{url}: {len(consultas)} consultas\n' + '\n'.join(c['sql'] for c in consultas),
+            )
+
+    def test_tienda_anonimo(self):
+        self.assertConsultas(2, 'index')
+        self.assertConsultas(4, 'proximos')
+        self.assertConsultas(3, 'bookstore')
+        # Las fichas leen primero la fecha de modificación del libro (validador HTTP)
+        self.assertConsultas(4, 'libro_detalle', self.libro_nuevo.id)
+        self.assertConsultas(4, 'proximo_detalle', self.proximo.id)
+        self.assertConsultas(0, 'login')
+        self.assertConsultas(0, 'registro')
+
+    def test_tienda_con_sesion(self):
+        # La sesión se lee de la cache 'sesiones', sin consultar la tabla
+        self.assertConsultas(5, 'bookstore', usuario=self.usuario)
+        self.assertConsultas(6, 'libro_detalle', self.libro_nuevo.id, usuario=self.usuario)
+        self.assertConsultas(2, 'cuenta', usuario=self.usuario)
+        # Con la cache vacía cada página con sesión carga una vez la biblioteca;
+        # mis_libros lee los libros con su progreso directamente de la tabla
+        self.assertConsultas(3, 'mis_libros', usuario=self.usuario)
+        self.assertConsultas(3, 'compra', self.libro_nuevo.id, usuario=self.usuario)
+        self.assertConsultas(4, 'leer_libro', self.propios[1].id, 1, usuario=self.usuario)
+        # Primera venta del día: por cada resumen (libro, género, formato) un
+        # UPDATE que no encuentra fila y un INSERT dentro de un savepoint
+        self.assertConsultas(26, 'procesar_compra', self.libro_nuevo.id, usuario=self.usuario, metodo='post')
+
+    def test_carrito(self):
+        otros = [libro for libro in Libro.objects.filter(estado_publicacion='disponible').exclude(
+            id__in=[libro.id for libro in self.propios]).order_by('id')[:3]]
+        # Cambiar el carrito guarda la sesión en su tabla (un UPDATE dentro de un savepoint)
+        self.assertConsultas(5, 'agregar_carrito', otros[0].id, usuario=self.usuario, metodo='post')
+        self.assertConsultas(5, 'agregar_carrito', otros[1].id, metodo='post', misma_sesion=True)
+        self.assertConsultas(5, 'agregar_carrito', otros[2].id, metodo='post', misma_sesion=True)
+        self.assertConsultas(4, 'quitar_carrito', otros[2].id, metodo='post', misma_sesion=True)
+        self.assertConsultas(4, 'carrito', misma_sesion=True)
+        # Un pedido para todo el carrito; los resúmenes se escriben en bloque
+        self.assertConsultas(28, 'procesar_carrito', metodo='post', misma_sesion=True)
+
+    def test_lector_y_medios(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        for carpeta in ('contenido', 'portadas'):
+            os.makedirs(os.path.join(media, carpeta))
+        with open(os.path.join(media, 'contenido', 'libro.mp3'), 'wb') as f:
+            f.write(b'\0' * 1024)
+        Image.new('RGB', (300, 450), 'navy').save(os.path.join(media, 'portadas', 'libro.png'))
+        audio = next(libro for libro in self.propios if libro.formato == 'audiobook')
+        ContenidoLibro.objects.create(libro=audio, tipo_contenido='audio', archivo='contenido/libro.mp3')
+
+        with override_settings(MEDIA_ROOT=media, MEDIA_ENTREGA='django'):
+            # El progreso se acumula en memoria y se escribe por lotes
+            self.addCleanup(progreso.pendientes.clear)
+            self.assertConsultas(2, 'guardar_progreso', audio.id, usuario=self.usuario, metodo='post', datos={'segundos': 90})
+            self.assertConsultas(3, 'servir_contenido', audio.id, 'contenido/libro.mp3', usuario=self.usuario)
+            self.assertConsultas(0, 'miniatura', 'tabla', 'webp', 'portadas/libro.png')
+
+    def test_con_la_biblioteca_en_cache_no_se_consulta_la_propiedad(self):
+        self.client.force_login(self.usuario)
+        self.client.get(reverse('cuenta'))
+        urls = [
+            reverse('bookstore'),
+            reverse('libro_detalle', args=[self.libro_nuevo.id]),
+            reverse('compra', args=[self.libro_nuevo.id]),
+            reverse('cuenta'),
+            reverse('carrito'),
+            reverse('servir_contenido', args=[self.propios[1].id, 'contenido/no-existe.png']),
+        ]
+        for url in urls:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as consultas:
+                self.client.get(url)
+            self.assertFalse([c['sql'] for c in consultas if 'tienda_bibliotecausuario' in c['sql']])
+
+    def test_la_biblioteca_cambia_de_version(self):
+        self.client.force_login(self.usuario)
+        self.assertFalse(self.client.get(reverse('libro_detalle', args=[self.libro_nuevo.id])).context['ya_adquirido'])
+        # La versión se cambia al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('procesar_compra', args=[self.libro_nuevo.id]))
+        self.assertTrue(self.client.get(reverse('libro_detalle', args=[self.libro_nuevo.id])).context['ya_adquirido'])
+        with self.captureOnCommitCallbacks(execute=True):
+            BibliotecaUsuario.objects.filter(usuario=self.usuario, libro=self.libro_nuevo).delete()
+        self.assertFalse(self.client.get(reverse('libro_detalle', args=[self.libro_nuevo.id])).context['ya_adquirido'])
+
+    def test_dashboard(self):
+        self.assertConsultas(2, 'dash_ver_pedidos', usuario=self.admin)
+        # Solo los resúmenes diarios: la serie, los formatos, los libros y los géneros
+        self.assertConsultas(5, 'dash_ventas', usuario=self.admin)
+        self.assertConsultas(2, 'dash_ver_libros', usuario=self.admin)
+        self.assertConsultas(2, 'dash_ver_usuarios', usuario=self.admin)
+        self.assertConsultas(2, 'dash_ver_generos', usuario=self.admin)
+        self.assertConsultas(2, 'dash_ver_autores', usuario=self.admin)
+        self.assertConsultas(3, 'dash_agregar_libro', usuario=self.admin)
+        self.assertConsultas(6, 'dash_editar_libro', self.libro_nuevo.id, usuario=self.admin)
+        self.assertConsultas(2, 'dash_borrar_libro', self.libro_nuevo.id, usuario=self.admin)
+        self.assertConsultas(2, 'dash_editar_usuario', self.usuario.id, usuario=self.admin)
+        self.assertConsultas(2, 'dash_borrar_usuario', self.usuario.id, usuario=self.admin)
+        self.assertConsultas(1, 'dash_agregar_genero', usuario=self.admin)
+        self.assertConsultas(2, 'dash_editar_genero', self.genero.id, usuario=self.admin)
+        self.assertConsultas(2, 'dash_borrar_genero', self.genero.id, usuario=self.admin)
+        self.assertConsultas(1, 'dash_agregar_autor', usuario=self.admin)
+        self.assertConsultas(2, 'dash_editar_autor', self.autor.id, usuario=self.admin)
+        self.assertConsultas(2, 'dash_borrar_autor', self.autor.id, usuario=self.admin)
+
+
+class InstrumentacionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='medida@booksbs.local')
+        cls.libro = Libro.objects.create(titulo='Medido', portada='portadas/m.png', formato='audiobook')
+        BibliotecaUsuario.objects.create(usuario=cls.usuario, libro=cls.libro)
+
+    def setUp(self):
+        cache.clear()
+
+    def metricas(self, respuesta):
+        return dict(parte.strip().split(';', 1) for parte in respuesta['Server-Timing'].split(','))
+
+    def test_server_timing_con_consultas_plantillas_y_tamano(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('bookstore'))
+        metricas = self.metricas(respuesta)
+        self.assertIn(f'desc="{len(consultas)} consultas"', metricas['sql'])
+        self.assertGreater(float(metricas['plantillas'].removeprefix('dur=')), 0)
+        self.assertEqual(metricas['respuesta'], f'desc="{len(respuesta.content)} bytes"')
+        for nombre in ('vista', 'total'):
+            self.assertIn(nombre, metricas)
+
+    @override_settings(PETICION_LENTA_MS=0)
+    def test_las_peticiones_lentas_se_registran_con_las_consultas_repetidas(self):
+        def vista(request):
+            for _ in range(3):
+                Libro.objects.filter(id=self.libro.id).first()
+            return HttpResponse('ok')
+
+        with self.assertLogs('tienda.instrumentacion', 'WARNING') as logs:
+            respuesta = InstrumentacionMiddleware(vista)(RequestFactory().get('/lenta/'))
+        registro = json.loads(logs.records[0].getMessage())
+        self.assertEqual(registro['ruta'], '/lenta/')
+        self.assertEqual(registro['consultas'], 3)
+        self.assertEqual(registro['consultas_repetidas'][0]['veces'], 3)
+        self.assertEqual(registro['bytes'], 2)
+        self.assertIn('3 consultas', respuesta['Server-Timing'])
+
+    async def test_con_asgi_cuenta_las_consultas_hechas_en_otros_hilos(self):
+        await self.async_client.aforce_login(self.usuario)
+        respuesta = await self.async_client.get(reverse('leer_libro', args=[self.libro.id, 1]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('desc="0 consultas"', respuesta['Server-Timing'])
+
+    @override_settings(INSTRUMENTACION=False)
+    def test_se_puede_desactivar(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('index')))
+
+
+
+@override_settings(PROGRESO_INTERVALO=0)
+class ComandosBenchmarkTests(TestCase):
+    """generar_datos y benchmark_urls a escala mínima, para que no se rompan sin notarlo."""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def generar(self):
+        call_command(
+            'generar_datos', libros=30, autores=8, generos=4, usuarios=5, pedidos=20, stdout=io.StringIO(),
+        )
+        return [modelo.objects.count() for modelo in (Genero, Autor, Libro, User, Pedido, BibliotecaUsuario)]
+
+    def test_generar_datos_se_puede_repetir(self):
+        conteos = self.generar()
+        self.assertEqual(conteos[:5], [4, 8, 30, 6, 20])  # 5 usuarios y el admin del benchmark
+        self.assertTrue(buscar_ids(Libro.objects.first().titulo))
+        self.assertEqual(self.generar(), conteos)
+
+    def test_benchmark_urls_mide_todas_las_urls(self):
+        self.generar()
+        salida = os.path.join(self.media, 'resultados.json')
+        registro = io.StringIO()
+        call_command('benchmark_urls', repeticiones=1, salida=salida, stdout=registro)
+        self.assertNotIn('se omite', registro.getvalue())
+        with open(salida, encoding='utf-8') as f:
+            informe = json.load(f)
+        medidas = {resultado['nombre']: resultado['status'] for resultado in informe['resultados']}
+        self.assertEqual(informe['escala']['libros'], 30)
+        self.assertIn('miniatura', medidas)
+        self.assertIn('leer_libro', medidas)
+        self.assertFalse({nombre: status for nombre, status in medidas.items() if status >= 500})
@@ -11,6 +11,9 @@ urlpatterns = [
     path('proximo/<int:id_libro>/', views.pagina_proximo_detalle, name='proximo_detalle'),
     path('libro/<int:id_libro>/', views.pagina_libro_detalle, name='libro_detalle'),
 
+    # Miniaturas de portadas y fotos (se generan al pedirlas por primera vez)
+    path('miniatura/<str:tamano>/<str:formato>/<path:nombre>', views.servir_miniatura, name='miniatura'),
+
     # Autenticación
     path('login/', views.pagina_login, name='login'),
     path('registro/', views.pagina_registro, name='registro'),
@@ -22,8 +25,16 @@ urlpatterns = [
     
    
     path('leer/<int:id_libro>/<int:pagina>/', views.pagina_leer_libro, name='leer_libro'),
+    path('leer/<int:id_libro>/archivo/<path:nombre>', views.servir_contenido, name='servir_contenido'),
+    path('leer/<int:id_libro>/progreso/', views.guardar_progreso, name='guardar_progreso'),
 
     # Compra
     path('comprar/<int:id_libro>/', views.pagina_compra, name='compra'),
     path('procesar_compra/<int:id_libro>/', views.procesar_compra, name='procesar_compra'),
+
+    # Carrito
+    path('carrito/', views.pagina_carrito, name='carrito'),
+    path('carrito/agregar/<int:id_libro>/', views.agregar_carrito, name='agregar_carrito'),
+    path('carrito/quitar/<int:id_libro>/', views.quitar_carrito, name='quitar_carrito'),
+    path('carrito/pagar/', views.procesar_carrito, name='procesar_carrito'),
 ]
\ No newline at end of file
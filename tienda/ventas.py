@@ -0,0 +1,131 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Libro, DetallePedido, VentaDiariaLibro, VentaDiariaGenero, VentaDiariaFormato
+
+
+def _totales():
+    return defaultdict(lambda: [0, Decimal('0')])
+
+
+def totales_por_dia(detalles):
+    """
+    Agrupa detalles (con pedido y libro cargados) en
+    {modelo: {(fecha, clave): [unidades, ingresos]}} para cada resumen.
+    Un libro con varios géneros cuenta completo en cada uno de ellos.
+    """
+    libros = {detalle.libro_id for detalle in detalles if detalle.libro_id}
+    generos_por_libro = defaultdict(list)
+    for libro_id, genero_id in Libro.generos.through.objects.filter(libro_id__in=libros).values_list('libro_id', 'genero_id'):
+        generos_por_libro[libro_id].append(genero_id)
+
+    por_libro, por_genero, por_formato = _totales(), _totales(), _totales()
+    for detalle in detalles:
+        fecha = timezone.localdate(detalle.pedido.fecha_pedido)
+        claves = [(por_formato, detalle.libro.formato if detalle.libro_id else '')]
+        if detalle.libro_id:
+            claves.append((por_libro, detalle.libro_id))
+            claves += [(por_genero, genero_id) for genero_id in generos_por_libro[detalle.libro_id]]
+        for totales, clave in claves:
+            totales[fecha, clave][0] += 1
+            totales[fecha, clave][1] += detalle.precio_compra
+    return {
+        VentaDiariaLibro: por_libro,
+        VentaDiariaGenero: por_genero,
+        VentaDiariaFormato: por_formato,
+    }
+
+
+def _campo_clave(modelo):
+    return {VentaDiariaLibro: 'libro_id', VentaDiariaGenero: 'genero_id', VentaDiariaFormato: 'formato'}[modelo]
+
+
+def incrementar(modelo, fecha, clave, unidades, ingresos):
+    """UPDATE ... SET x = x + n; si la fila del día no existe todavía, se crea."""
+    filtro = {'fecha': fecha, _campo_clave(modelo): clave}
+    incremento = {'unidades': F('unidades') + unidades, 'ingresos': F('ingresos') + ingresos}
+    if modelo.objects.filter(**filtro).update(**incremento):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(unidades=unidades, ingresos=ingresos, **filtro)
+    except IntegrityError:
+        # Otra transacción creó la fila entre el UPDATE y el INSERT
+        modelo.objects.filter(**filtro).update(**incremento)
+
+
+def aplicar_totales(totales_por_modelo):
+    """
+    Versión por lotes: bloquea las filas de resumen que ya existen y las
+    reemplaza (DELETE + bulk_create) por las sumas; bulk_update con miles de
+    CASE WHEN resulta mucho más lento que volver a insertarlas.
+    """
+    for modelo, totales in totales_por_modelo.items():
+        if not totales:
+            continue
+        campo = _campo_clave(modelo)
+        existentes = []
+        fechas = [fecha for fecha, _ in totales]
+        # Rango de fechas en vez de fecha IN (...): con IN el índice único se
+        # sondea una vez por cada combinación fecha x clave
+        filas = modelo.objects.select_for_update().filter(
+            fecha__gte=min(fechas), fecha__lte=max(fechas),
+            **{f'{campo}__in': {clave for _, clave in totales}},
+        ).values_list('pk', 'fecha', campo, 'unidades', 'ingresos')
+        for pk, fecha, clave, unidades, ingresos in filas:
+            if (fecha, clave) in totales:
+                totales[fecha, clave][0] += unidades
+                totales[fecha, clave][1] += ingresos
+                existentes.append(pk)
+        modelo.objects.filter(pk__in=existentes).delete()
+
+        nuevas = [
+            modelo(fecha=fecha, unidades=unidades, ingresos=ingresos, **{campo: clave})
+            for (fecha, clave), (unidades, ingresos) in totales.items()
+        ]
+        try:
+            with transaction.atomic():
+                modelo.objects.bulk_create(nuevas, batch_size=1000)
+        except IntegrityError:
+            # Carrera con una compra que creó alguna fila nueva: fila por fila
+            for fila in nuevas:
+                incrementar(modelo, fila.fecha, getattr(fila, campo), fila.unidades, fila.ingresos)
+
+
+def sumar_ventas(detalles):
+    """
+    Suma a los resúmenes detalles recién creados con resumido=True. Debe
+    llamarse en la misma transacción que los crea. Con un solo libro basta
+    un UPDATE por fila de resumen (ya existe casi siempre la del día); un
+    carrito con varios usa la versión por lotes.
+    """
+    if len(detalles) > 1:
+        aplicar_totales(totales_por_dia(detalles))
+        return
+    for modelo, totales in totales_por_dia(detalles).items():
+        for (fecha, clave), (unidades, ingresos) in totales.items():
+            incrementar(modelo, fecha, clave, unidades, ingresos)
+
+
+def acumular_pendientes(lote=5000):
+    """
+    Suma los detalles completados que aún no están en los resúmenes (pedidos
+    anteriores a los resúmenes o cargados en bloque). Devuelve cuántos sumó.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            detalles = list(
+                DetallePedido.objects.select_for_update(of=('self',))
+                .filter(resumido=False, pedido__estado_pago='completado')
+                .select_related('pedido', 'libro').order_by('id')[:lote]
+            )
+            if not detalles:
+                return total
+            aplicar_totales(totales_por_dia(detalles))
+            DetallePedido.objects.filter(id__in=[detalle.id for detalle in detalles]).update(resumido=True)
+        total += len(detalles)
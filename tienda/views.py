@@ -1,71 +1,118 @@
+import os
+import uuid
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Libro, Genero, Autor, BibliotecaUsuario, ContenidoLibro, Pedido, DetallePedido
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed
+from .models import Libro, Genero, Autor, BibliotecaUsuario
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from PIL import UnidentifiedImageError
+from .lector import obtener_manifiesto, obtener_pagina, archivo_pertenece_al_libro
+from .entrega import respuesta_archivo
+from .derivados import MINIATURAS, CARPETAS_MINIATURAS, FORMATOS_DERIVADOS, es_derivado, generar_miniaturas, nombre_miniatura, olvidar_derivados
+from .catalogo import en_cache_catalogo
+from .busqueda import por_relevancia
+from .compras import comprar_libros
+from .biblioteca import libros_propios
+from .replicas import lectura_en_replica
+from .condicional import condicional, marca_catalogo, marca_libro
+from .progreso import registrar_progreso, aplicar_pendiente, SEGUNDOS_MAXIMOS
+from .carrito import obtener_carrito, guardar_carrito, agregar_al_carrito, quitar_del_carrito, vaciar_carrito
 
+@lectura_en_replica
+@condicional(marca_catalogo)
 def pagina_index(request):
-    libros_nuevos = Libro.objects.filter(estado_publicacion='disponible').order_by('-id')[:4]
+    libros_nuevos = en_cache_catalogo('index', construir=lambda: list(
+        Libro.objects.filter(estado_publicacion='disponible').order_by('-id').prefetch_related('autores')[:4]
+    ))
     contexto = {
         'libros': libros_nuevos,
     }
     return render(request, 'index.html', contexto)
 
+@lectura_en_replica
+@condicional(marca_catalogo)
 def pagina_proximos(request):
-    ebooks_proximos = Libro.objects.filter(estado_publicacion='proximamente', formato='ebook').order_by('fecha_lanzamiento')
-    audiobooks_proximos = Libro.objects.filter(estado_publicacion='proximamente', formato='audiobook').order_by('fecha_lanzamiento')
+    ebooks_proximos = en_cache_catalogo('proximos', 'ebook', construir=lambda: list(
+        Libro.objects.filter(estado_publicacion='proximamente', formato='ebook').order_by('fecha_lanzamiento').prefetch_related('autores')
+    ))
+    audiobooks_proximos = en_cache_catalogo('proximos', 'audiobook', construir=lambda: list(
+        Libro.objects.filter(estado_publicacion='proximamente', formato='audiobook').order_by('fecha_lanzamiento').prefetch_related('autores')
+    ))
     contexto = {
         'ebooks': ebooks_proximos,
         'audiobooks': audiobooks_proximos,
     }
     return render(request, 'proximos.html', contexto)
 
+@lectura_en_replica
+@condicional(marca_catalogo)
 def pagina_bookstore(request):
-    genero_id = request.GET.get('genero_id')
-    
+    try:
+        genero_id = int(request.GET.get('genero_id') or 0) or None
+    except ValueError:
+        genero_id = None
+
+    busqueda = (request.GET.get('q') or '').strip()
+    try:
+        pagina = max(int(request.GET.get('pagina') or 1), 1)
+    except ValueError:
+        pagina = 1
+    por_pagina = settings.TIENDA_POR_PAGINA
+    inicio = (pagina - 1) * por_pagina
+
+    libros = Libro.objects.filter(estado_publicacion='disponible')
     if genero_id:
-        libros_disponibles = Libro.objects.filter(estado_publicacion='disponible', generos__id=genero_id).order_by('-id')
-        try:
-            genero_id = int(genero_id)
-        except ValueError:
-            genero_id = None
+        libros = libros.filter(generos__id=genero_id)
+
+    def pagina_de(ordenados):
+        # Uno de más para saber si hay página siguiente sin contar
+        filas = list(ordenados.prefetch_related('autores')[inicio:inicio + por_pagina + 1])
+        return filas[:por_pagina], len(filas) > por_pagina
+
+    if busqueda:
+        # Las búsquedas no se cachean: casi no se repiten y echarían de la
+        # cache a las páginas del catálogo. Una consulta trae solo la página
+        libros_pagina, hay_siguiente = pagina_de(por_relevancia(libros, busqueda))
     else:
-        libros_disponibles = Libro.objects.filter(estado_publicacion='disponible').order_by('-id')
+        libros_pagina, hay_siguiente = en_cache_catalogo(
+            'bookstore', genero_id, pagina, construir=lambda: pagina_de(libros.order_by('-id')),
+        )
 
-    generos = Genero.objects.all()
-    libros_adquiridos_ids = []
-    
-    if request.user.is_authenticated:
-        libros_adquiridos_ids = BibliotecaUsuario.objects.filter(usuario=request.user).values_list('libro__id', flat=True)
-        
+    generos = en_cache_catalogo('generos', construir=lambda: list(Genero.objects.all()))
     contexto = {
-        'libros': libros_disponibles,
+        'libros': libros_pagina,
         'generos': generos,
-        'libros_adquiridos_ids': libros_adquiridos_ids,
-        'genero_id_activo': genero_id
+        'libros_adquiridos_ids': libros_propios(request.user),
+        'genero_id_activo': genero_id,
+        'busqueda': busqueda,
+        'pagina_anterior': pagina - 1 if pagina > 1 else None,
+        'pagina_siguiente': pagina + 1 if hay_siguiente else None,
     }
     return render(request, 'bookstore.html', contexto)
 
+@lectura_en_replica
+@condicional(marca_libro)
 def pagina_proximo_detalle(request, id_libro):
-    libro = get_object_or_404(Libro, id=id_libro, estado_publicacion='proximamente')
+    libro = get_object_or_404(Libro.objects.prefetch_related('autores', 'generos'), id=id_libro, estado_publicacion='proximamente')
     contexto = {
         'libro': libro,
     }
     return render(request, 'proximo-detalle.html', contexto)
 
+@lectura_en_replica
+@condicional(marca_libro)
 def pagina_libro_detalle(request, id_libro):
-    libro = get_object_or_404(Libro, id=id_libro, estado_publicacion='disponible')
+    libro = get_object_or_404(Libro.objects.prefetch_related('autores', 'generos'), id=id_libro, estado_publicacion='disponible')
     
-    ya_adquirido = False
-    if request.user.is_authenticated:
-        if BibliotecaUsuario.objects.filter(usuario=request.user, libro=libro).exists():
-            ya_adquirido = True
-            
     contexto = {
         'libro': libro,
-        'ya_adquirido': ya_adquirido,
+        'ya_adquirido': libro.id in libros_propios(request.user),
     }
     return render(request, 'libro_detalle.html', contexto)
 
@@ -115,7 +162,7 @@ def pagina_logout(request):
 
 @login_required
 def pagina_cuenta(request):
-    conteo_libros = BibliotecaUsuario.objects.filter(usuario=request.user).count()
+    conteo_libros = len(libros_propios(request.user))
     contexto = {
         'conteo_libros': conteo_libros,
     }
@@ -123,20 +170,41 @@ def pagina_cuenta(request):
 
 @login_required
 def pagina_mis_libros(request):
-    biblioteca = BibliotecaUsuario.objects.filter(usuario=request.user)
-    ids_libros_usuario = biblioteca.values_list('libro__id', flat=True)
-    ebooks = Libro.objects.filter(id__in=ids_libros_usuario, formato='ebook')
-    audiobooks = Libro.objects.filter(id__in=ids_libros_usuario, formato='audiobook')
+    # Los libros y el progreso de lectura salen de la misma consulta
+    libros = (
+        Libro.objects.filter(bibliotecausuario__usuario=request.user)
+        .annotate(ultima_pagina=F('bibliotecausuario__ultima_pagina'), posicion_audio=F('bibliotecausuario__posicion_audio'))
+        .prefetch_related('autores')
+    )
+    ebooks = []
+    audiobooks = []
+    for libro in libros:
+        aplicar_pendiente(libro, request.user.id, libro.id)
+        if libro.formato == 'ebook':
+            ebooks.append(libro)
+        elif libro.formato == 'audiobook':
+            audiobooks.append(libro)
     contexto = {
         'ebooks': ebooks,
         'audiobooks': audiobooks,
     }
     return render(request, 'mis-libros.html', contexto)
 
+# El lector y la entrega de archivos son asíncronos: con ASGI un oyente que
+# descarga el audio despacio no ocupa un hilo. Lo que no tiene versión
+# asíncrona (cache del manifiesto y de la biblioteca, la plantilla) se llama
+# con sync_to_async.
+
 @login_required
-def pagina_leer_libro(request, id_libro, pagina):
-    libro = get_object_or_404(Libro, id=id_libro)
-    
+@lectura_en_replica
+async def pagina_leer_libro(request, id_libro, pagina):
+    try:
+        libro = await Libro.objects.aget(id=id_libro)
+    except Libro.DoesNotExist:
+        raise Http404
+    usuario = await request.auser()
+    propio = libro.id in await sync_to_async(libros_propios)(usuario)
+
     contexto = {
         'libro': libro,
         'pagina_actual': None,
@@ -146,60 +214,148 @@ def pagina_leer_libro(request, id_libro, pagina):
     }
 
     if libro.formato == 'ebook':
-        contenido = ContenidoLibro.objects.filter(libro=libro, tipo_contenido='imagen').order_by('orden')
-        total_paginas = contenido.count()
+        manifiesto = await sync_to_async(obtener_manifiesto)(libro.id)
+        pagina_num, pagina_actual = obtener_pagina(manifiesto, pagina)
 
-        try:
-            pagina_num = int(pagina)
-        except (ValueError, TypeError):
-            pagina_num = 1
-
-        if pagina_num < 1:
-            pagina_num = 1
-        elif pagina_num > total_paginas and total_paginas > 0:
-            pagina_num = total_paginas
-        elif total_paginas == 0:
-            pagina_num = 1
-
-        if total_paginas > 0:
-            contexto['pagina_actual'] = contenido[pagina_num-1]
-        
+        contexto['pagina_actual'] = pagina_actual
         contexto['pagina_num'] = pagina_num
-        contexto['total_paginas'] = total_paginas
+        contexto['total_paginas'] = manifiesto['total']
+        if propio:
+            # Puede guardar el lote si se llenó
+            await sync_to_async(registrar_progreso)(usuario.id, libro.id, pagina=pagina_num)
 
     elif libro.formato == 'audiobook':
-        pista = ContenidoLibro.objects.filter(libro=libro, tipo_contenido='audio').first()
-        contexto['pista_audio'] = pista
-        
-    return render(request, 'leer-libro.html', contexto)
+        contexto['pista_audio'] = (await sync_to_async(obtener_manifiesto)(libro.id))['audio']
+        if propio:
+            entrada = await BibliotecaUsuario.objects.only('posicion_audio').aget(usuario=usuario, libro=libro)
+            contexto['posicion_audio'] = aplicar_pendiente(entrada, usuario.id, libro.id).posicion_audio
+
+    return await sync_to_async(render)(request, 'leer-libro.html', contexto)
+
+@login_required
+def guardar_progreso(request, id_libro):
+    """El reproductor envía aquí cada pocos segundos por dónde va el audiobook."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        segundos = int(float(request.POST.get('segundos', '')))
+    except (ValueError, OverflowError):
+        return HttpResponseBadRequest()
+    if id_libro not in libros_propios(request.user):
+        return HttpResponseForbidden()
+    registrar_progreso(request.user.id, id_libro, segundos=min(max(segundos, 0), SEGUNDOS_MAXIMOS))
+    return HttpResponse(status=204)
+
+@login_required
+async def servir_contenido(request, id_libro, nombre):
+    if nombre.startswith('/') or os.path.normpath(nombre) != nombre:
+        raise Http404
+    if not archivo_pertenece_al_libro(await sync_to_async(obtener_manifiesto)(id_libro), nombre):
+        raise Http404
+    usuario = await request.auser()
+    if not usuario.is_superuser and id_libro not in await sync_to_async(libros_propios)(usuario):
+        return HttpResponseForbidden()
+    return respuesta_archivo(request, nombre)
+
+def servir_miniatura(request, tamano, formato, nombre):
+    """Genera la miniatura la primera vez que se pide; después la sirve el servidor de media."""
+    if tamano not in MINIATURAS or formato not in FORMATOS_DERIVADOS:
+        raise Http404
+    if not nombre.startswith(CARPETAS_MINIATURAS) or os.path.normpath(nombre) != nombre or es_derivado(nombre):
+        raise Http404
+    ruta = os.path.join(settings.MEDIA_ROOT, nombre)
+    if not os.path.isfile(ruta):
+        raise Http404
+    try:
+        generar_miniaturas(ruta, tamanos=[tamano])
+    except (UnidentifiedImageError, OSError):
+        # No es una imagen o no se puede leer
+        raise Http404
+    # Las plantillas enlazan a la miniatura según lo que diga la cache
+    olvidar_derivados(nombre)
+    return respuesta_archivo(request, nombre_miniatura(nombre, tamano, formato))
 
 @login_required
 def pagina_compra(request, id_libro):
     libro = get_object_or_404(Libro, id=id_libro)
-    if BibliotecaUsuario.objects.filter(usuario=request.user, libro=libro).exists():
+    if libro.id in libros_propios(request.user):
         messages.info(request, '¡Ya posees este libro!')
         return redirect('libro_detalle', id_libro=id_libro)
     contexto = {
         'libro': libro,
+        'clave_idempotencia': uuid.uuid4().hex,
     }
     return render(request, 'compra.html', contexto)
 
 @login_required
-@transaction.atomic
 def procesar_compra(request, id_libro):
     if request.method == 'POST':
         libro = get_object_or_404(Libro, id=id_libro)
-        usuario = request.user
-        if BibliotecaUsuario.objects.filter(usuario=usuario, libro=libro).exists():
-            messages.error(request, 'Ya has comprado este libro.')
-            return redirect('mis_libros')
         try:
-            nuevo_pedido = Pedido.objects.create(usuario=usuario, total_pagado=libro.precio, estado_pago='completado')
-            DetallePedido.objects.create(pedido=nuevo_pedido, libro=libro, precio_compra=libro.precio)
-            BibliotecaUsuario.objects.create(usuario=usuario, libro=libro)
-            messages.success(request, f"¡Compra exitosa! '{libro.titulo}' ha sido añadido a tu biblioteca.")
-            return redirect('mis_libros')
-        except Exception as e:
+            pedido, comprados, ya_tenia = comprar_libros(
+                request.user, [libro.id], clave=request.POST.get('clave_idempotencia'),
+            )
+        except DatabaseError as e:
             messages.error(request, f'Hubo un error al procesar tu compra: {e}')
             return redirect('compra', id_libro=id_libro)
-    return redirect('index')
\ No newline at end of file
+        if pedido:
+            quitar_del_carrito(request, libro.id)
+            messages.success(request, f"¡Compra exitosa! '{libro.titulo}' ha sido añadido a tu biblioteca.")
+        elif libro.id in ya_tenia:
+            messages.error(request, 'Ya has comprado este libro.')
+        else:
+            # Próximamente o retirado de la venta
+            messages.error(request, f"'{libro.titulo}' no está a la venta.")
+        return redirect('mis_libros')
+    return redirect('index')
+
+# --- Carrito ---
+
+@login_required
+def agregar_carrito(request, id_libro):
+    if request.method == 'POST':
+        libro = get_object_or_404(Libro, id=id_libro, estado_publicacion='disponible')
+        agregar_al_carrito(request, libro.id)
+        messages.success(request, f"'{libro.titulo}' se agregó a tu carrito.")
+    return redirect('carrito')
+
+@login_required
+def quitar_carrito(request, id_libro):
+    if request.method == 'POST':
+        quitar_del_carrito(request, id_libro)
+    return redirect('carrito')
+
+@login_required
+def pagina_carrito(request):
+    ids = obtener_carrito(request)
+    propios = libros_propios(request.user)
+    libros = list(
+        Libro.objects.filter(id__in=[libro_id for libro_id in ids if libro_id not in propios], estado_publicacion='disponible')
+        .prefetch_related('autores').order_by('titulo')
+    )
+    # Se limpian del carrito los libros que ya no se pueden comprar
+    if len(libros) != len(ids):
+        guardar_carrito(request, [libro.id for libro in libros])
+    contexto = {
+        'libros': libros,
+        'total': sum(libro.precio for libro in libros),
+        'clave_idempotencia': uuid.uuid4().hex,
+    }
+    return render(request, 'carrito.html', contexto)
+
+@login_required
+def procesar_carrito(request):
+    if request.method != 'POST':
+        return redirect('carrito')
+    ids = obtener_carrito(request)
+    try:
+        pedido, comprados, ya_tenia = comprar_libros(request.user, ids, clave=request.POST.get('clave_idempotencia'))
+    except DatabaseError as e:
+        messages.error(request, f'Hubo un error al procesar tu compra: {e}')
+        return redirect('carrito')
+    vaciar_carrito(request)
+    if pedido:
+        messages.success(request, f'¡Compra exitosa! {len(comprados)} libros se añadieron a tu biblioteca (total ${pedido.total_pagado}).')
+    else:
+        messages.info(request, 'No había libros nuevos que comprar en tu carrito.')
+    return redirect('mis_libros')